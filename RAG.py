@@ -1,69 +1,347 @@
 import streamlit as st
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
 from ctransformers import AutoModelForCausalLM
 import os
 import time
+import threading
+from contextlib import contextmanager
+from reranker import CrossEncoderReranker
+from context_compressor import ContextCompressor
+from embedding_backends import get_embedding_backend, OnnxEmbeddingBackend
+from answer_router import AnswerRouter, cargar_pipeline_qa
+from index_versions import GestorIndices
+from index_registry import RegistroIndices, productos_disponibles
+from query_batcher import MicroBatcher
+from llm_autotune import parametros_llm
+from answer_store import RespuestasPrecalculadas, INDICE_GENERAL
+from adaptive_topk import seleccionar_k
+from memory_profile import CONTABILIDAD, PERFIL_MEMORIA, perfil_memoria
 
-class RAGSimple:
-    def __init__(self, modo_prueba=False):
-        # Cargar el modelo de lenguaje
-        modelo_path = "llama-2-7b-chat.Q4_K_M.gguf"
-        if not os.path.exists(modelo_path):
-            raise FileNotFoundError(f"❌ No se encontró el modelo en {modelo_path}")
-            
-        print("🔄 Cargando modelos...")
-        self.llm = AutoModelForCausalLM.from_pretrained(
+# Backend de embeddings de consulta: "torch" (por defecto) u "onnx" (int8 en onnxruntime)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+
+@st.cache_resource
+def cargar_batcher(backend_embeddings=EMBEDDING_BACKEND, max_lote=32):
+    """Modelo de embeddings y micro-batcher compartidos por todas las sesiones del proceso."""
+    with CONTABILIDAD.medir('embeddings'):
+        modelo = get_embedding_backend(backend_embeddings, "all-MiniLM-L6-v2")
+        if isinstance(modelo, OnnxEmbeddingBackend):
+            modelo.load()  # La sesión ONNX se carga en el primer encode: se adelanta para medirla
+        return MicroBatcher(modelo, max_lote=max_lote)
+
+@st.cache_resource
+def cargar_respuestas_precalculadas():
+    """Respuestas precalculadas compartidas por todas las sesiones (se recargan si cambian en disco)."""
+    return RespuestasPrecalculadas()
+
+@st.cache_resource
+def cargar_gestor(mmap=False):
+    """Índice general versionado compartido: un solo hilo vigila CURRENT en todo el proceso."""
+    return GestorIndices(mmap=mmap)
+
+@st.cache_resource
+def cargar_llm(modelo_path, parametros):
+    """Modelo de lenguaje compartido por todas las sesiones (uno por combinación de parámetros)."""
+    print("🔄 Cargando modelo de lenguaje...")
+    with CONTABILIDAD.medir('llm'):
+        llm = AutoModelForCausalLM.from_pretrained(
             modelo_path,
             model_type="llama",
-            gpu_layers=20,     # Más capas en GPU por menor uso de memoria (~100MB por capa)
-            context_length=512 if modo_prueba else 1024,  # Contexto reducido en modo prueba
-            threads=6,         # Balanceado para CPU/GPU
             top_k=40,         # Mantener calidad de búsqueda
-            batch_size=2      # Aumentado por menor uso de memoria
+            mmap=True,        # Pesos mapeados: el page cache los comparte entre réplicas
+            mlock=False,
+            **parametros
         )
+    CONTABILIDAD.registrar_archivo('llm', modelo_path)
+    CONTABILIDAD.informe()
+    return llm
+
+@st.cache_resource
+def cargar_reranker(max_cache_size=10000):
+    """Cross-encoder compartido: el modelo y su caché de scores sobreviven a cada ejecución del script."""
+    return CrossEncoderReranker(max_cache_size=max_cache_size)
+
+@st.cache_resource
+def cargar_qa(modelo_qa="deepset/roberta-base-squad2"):
+    """Pipeline extractivo del router compartido por todas las sesiones."""
+    return cargar_pipeline_qa(modelo_qa)
+
+@st.cache_resource
+def cargar_historial_router():
+    """Historial (nivel, latencia) del router acumulado entre ejecuciones y sesiones."""
+    return []
+
+@st.cache_resource
+def cargar_registro(presupuesto_mb=4096, mmap=False):
+    """Registro de índices por línea de producto compartido por todas las sesiones."""
+    return RegistroIndices(presupuesto_mb=presupuesto_mb, mmap=mmap)
+
+class RAGSimple:
+    def __init__(self, modo_prueba=False, usar_reranker=False, candidatos_reranker=10,
+                 comprimir_contexto=False, max_tokens_contexto=200, backend_embeddings=EMBEDDING_BACKEND,
+                 respuestas_precalculadas=None, perfil_memoria_servidor=PERFIL_MEMORIA,
+                 top_k_adaptativo=False, k_max_adaptativo=5, busqueda_jerarquica=False, producto=None,
+                 indices=None):
+        # El modelo de lenguaje se carga en el primer uso (ver `llm`): las preguntas que
+        # se resuelven sin generación no pagan su carga
+        self.modelo_path = "llama-2-7b-chat.Q4_K_M.gguf"
+        if not os.path.exists(self.modelo_path):
+            raise FileNotFoundError(f"❌ No se encontró el modelo en {self.modelo_path}")
+        self._llm = None
+        # Perfil de memoria: "bajo" mapea índice y textos desde disco y limita cachés y lotes
+        self.perfil_memoria = perfil_memoria(perfil_memoria_servidor)
+        # Threads, batch y contexto medidos en este host por llm_autotune.py (o valores seguros)
+        self.parametros_llm = parametros_llm(self.modelo_path, modo_prueba)
+        if self.perfil_memoria['batch_size_max']:
+            self.parametros_llm['batch_size'] = min(self.parametros_llm['batch_size'],
+                                                    self.perfil_memoria['batch_size_max'])
         
-        # Cargar el modelo de embeddings
-        self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+        # Modelo de embeddings compartido: las consultas concurrentes se codifican y buscan por lotes
+        self.batcher = cargar_batcher(backend_embeddings, self.perfil_memoria['max_lote'])
+        self.embedding_model = self.batcher.modelo
         
-        # Cargar índice FAISS y textos si existen
-        if os.path.exists("vector_index.faiss"):
-            self.index = faiss.read_index("vector_index.faiss")
-            self.texts = np.load("vector_texts.npy").tolist()
-            print("✅ Base de datos vectorial cargada")
-        else:
-            raise FileNotFoundError("❌ No se encontró la base de datos vectorial")
+        # Índice versionado: se sustituye en caliente cuando loader.py publica una versión nueva.
+        # Con `producto`, el índice de esa línea se carga bajo demanda en el registro compartido.
+        # Ambos son recursos del proceso: se reutilizan entre instancias (cada rerun de Streamlit)
+        self.producto = producto
+        with CONTABILIDAD.medir('indice'):
+            if indices is not None:
+                self.indices = indices
+            elif producto is not None:
+                self.indices = cargar_registro(self.perfil_memoria['presupuesto_indices_mb'],
+                                               self.perfil_memoria['mmap_indice']).producto(producto)
+            else:
+                self.indices = cargar_gestor(self.perfil_memoria['mmap_indice'])
+        bundle = self.indices.actual.bundle
+        CONTABILIDAD.registrar_archivo('indice', bundle.path if bundle is not None else None)
+        self._local = threading.local()
+        print(f"✅ Base de datos vectorial cargada ({self.indices.actual.nombre})")
         
         # Modo prueba para respuestas más cortas
         self.modo_prueba = modo_prueba
 
+        # Reranker opcional: se recuperan más candidatos y solo los mejores llegan al prompt
+        self.usar_reranker = usar_reranker
+        self.candidatos_reranker = candidatos_reranker
+        self.reranker = cargar_reranker(self.perfil_memoria['cache_reranker'])
+
+        # Top-k adaptativo: se piden k_max_adaptativo resultados y se corta la lista según
+        # la distribución de distancias (uno si el primero domina, más si son parecidas)
+        self.top_k_adaptativo = top_k_adaptativo
+        self.k_max_adaptativo = k_max_adaptativo
+
+        # Búsqueda jerárquica: primero los documentos por su resumen, después solo sus fragmentos
+        self.busqueda_jerarquica = busqueda_jerarquica
+
+        # Compresión extractiva opcional del contexto (reutiliza el modelo MiniLM ya cargado)
+        self.comprimir_contexto = comprimir_contexto
+        self.compresor = ContextCompressor(self.embedding_model, max_tokens=max_tokens_contexto)
+
+        # Respuestas del catálogo de preguntas frecuentes generadas offline (answer_store.py)
+        self.respuestas_precalculadas = respuestas_precalculadas
+
+        # Métricas de la última pregunta (tiempos y tokens del prompt)
+        self.metricas = {}
+        print(f"🔍 Perfil de memoria: {self.perfil_memoria['nombre']}")
+        CONTABILIDAD.informe()
+
+    @property
+    def llm(self):
+        """Modelo de lenguaje compartido, cargado la primera vez que se necesita."""
+        if self._llm is None:
+            self._llm = cargar_llm(self.modelo_path, self.parametros_llm)
+        return self._llm
+
+    @contextmanager
+    def fijar_version(self):
+        """Usa la misma versión del índice durante toda una petición (reentrante)."""
+        if getattr(self._local, 'version', None) is not None:
+            yield self._local.version
+            return
+        with self.indices.adquirir() as version:
+            self._local.version = version
+            try:
+                yield version
+            finally:
+                self._local.version = None
+
+    def _version(self):
+        version = getattr(self._local, 'version', None)
+        return version if version is not None else self.indices.actual
+
+    @property
+    def index(self):
+        return self._version().index
+
+    @property
+    def texts(self):
+        return self._version().texts
+
+    @property
+    def ids(self):
+        return self._version().ids
+
+    def fuente(self, indice):
+        """Devuelve el documento, la página y la sección de un fragmento.
+
+        Si el fragmento se deduplicó al indexar, se citan también los otros documentos
+        en los que aparece.
+        """
+        version = self._version()
+        if version.procedencia is not None:
+            fuente = version.procedencia.citar([indice])[0]
+            documento = version.procedencia.documento([indice])[0]
+        elif self.ids is not None:
+            fuente = self.ids[indice]
+            documento = fuente.split(" | ")[0]
+        else:
+            return f"fragmento {indice}"
+        if version.metadata is not None:
+            otros = dict.fromkeys(f.split(" | ")[0] for f in version.metadata[indice].get('fuentes', []))
+            otros.pop(documento, None)
+            if otros:
+                fuente += f" (también en: {', '.join(otros)})"
+        return fuente
+
+    def recuperar_fragmentos(self, pregunta, num_resultados=1):
+        """Devuelve el embedding de la pregunta y los índices de los fragmentos más relevantes."""
+        # Embedding y búsqueda de documentos similares (más candidatos si se va a reordenar),
+        # agrupados con las preguntas de otras sesiones que lleguen a la vez
+        k = max(self.candidatos_reranker, num_resultados) if self.usar_reranker else num_resultados
+        if self.top_k_adaptativo:
+            k = max(k, self.k_max_adaptativo)
+        with self.fijar_version() as version:
+            if self.busqueda_jerarquica and version.documentos_index is not None:
+                question_embedding, _, _, tiempos = self.batcher.encode(pregunta).result()
+                inicio_busqueda = time.time()
+                resultado = version.documentos_index.search(question_embedding, k)
+                if resultado is not None:
+                    D, I, documentos = resultado
+                    print(f"🗂️ Búsqueda en {len(documentos)} documentos: {', '.join(documentos)}")
+                else:
+                    # Búsqueda global con el embedding ya calculado, sin volver a pasar por el batcher
+                    print("🗂️ Poca confianza en los documentos: búsqueda global")
+                    D, I = version.index.search(question_embedding.reshape(1, -1), k)
+                tiempos = dict(tiempos, busqueda=time.time() - inicio_busqueda)
+                self.metricas['documentos_candidatos'] = documentos if resultado is not None else None
+            else:
+                question_embedding, D, I, tiempos = self.batcher.buscar(pregunta, version.index, k).result()
+        tiempo_embedding = tiempos['embedding']
+        tiempo_busqueda = tiempos['busqueda']
+        indices = [int(i) for i in I[0] if i >= 0]
+        if self.top_k_adaptativo:
+            num_resultados = seleccionar_k(D[0][:len(indices)], k_max=self.k_max_adaptativo)
+            print(f"🎯 Top-k adaptativo: {num_resultados} fragmentos")
+        
+        # Reordenar los candidatos con el cross-encoder y quedarse con los mejores
+        tiempo_rerank = 0.0
+        if self.usar_reranker:
+            inicio_rerank = time.time()
+            candidatos = [self.texts[i] for i in indices]
+            mejores = self.reranker.rerank(pregunta, candidatos, top_k=num_resultados)
+            indices = [indices[pos] for pos, _ in mejores]
+            tiempo_rerank = time.time() - inicio_rerank
+        else:
+            indices = indices[:num_resultados]
+        
+        print(f"⏱️ Tiempo de generación de embedding: {tiempo_embedding:.2f}s")
+        print(f"⏱️ Tiempo de búsqueda FAISS: {tiempo_busqueda:.2f}s (lote de {tiempos['lote']} consultas)")
+        if self.usar_reranker:
+            print(f"⏱️ Tiempo de reranking ({len(candidatos)} candidatos): {tiempo_rerank:.2f}s")
+        
+        self.metricas.update({
+            'tiempo_embedding': tiempo_embedding,
+            'tiempo_busqueda': tiempo_busqueda,
+            'tamano_lote': tiempos['lote'],
+            'num_fragmentos': len(indices),
+            'tiempo_rerank': tiempo_rerank,
+            'indices_contexto': indices
+        })
+        return question_embedding, indices
+
     def buscar_contexto(self, pregunta, num_resultados=1):
         """Busca los documentos más relevantes para la pregunta."""
-        inicio = time.time()
-        # Generar embedding de la pregunta
-        question_embedding = self.embedding_model.encode([pregunta])[0]
-        tiempo_embedding = time.time() - inicio
-        
-        # Buscar documentos similares
-        inicio_busqueda = time.time()
-        D, I = self.index.search(question_embedding.reshape(1, -1), num_resultados)
-        tiempo_busqueda = time.time() - inicio_busqueda
+        _, indices = self.recuperar_fragmentos(pregunta, num_resultados)
         
         # Obtener los textos relevantes
-        contexto = "\n".join([self.texts[i] for i in I[0]])
-        print(f"⏱️ Tiempo de generación de embedding: {tiempo_embedding:.2f}s")
-        print(f"⏱️ Tiempo de búsqueda FAISS: {tiempo_busqueda:.2f}s")
+        return "\n".join([self.texts[i] for i in indices])
+
+    def comprimir(self, pregunta_embedding, fragmentos):
+        """Reduce los fragmentos recuperados a sus oraciones más relevantes."""
+        inicio = time.time()
+        contexto, stats = self.compresor.compress(
+            pregunta_embedding,
+            fragmentos,
+            count_tokens=lambda t: len(self.llm.tokenize(t))
+        )
+        tiempo_compresion = time.time() - inicio
+        print(f"⏱️ Tiempo de compresión de contexto: {tiempo_compresion:.2f}s "
+              f"({stats['tokens_originales']} → {stats['tokens_comprimidos']} tokens)")
+        
+        self.metricas.update({
+            'tiempo_compresion': tiempo_compresion,
+            'tokens_contexto_original': stats['tokens_originales'],
+            'tokens_contexto': stats['tokens_comprimidos']
+        })
         return contexto
 
-    def generar_respuesta(self, pregunta):
-        """Genera una respuesta usando RAG."""
+    def num_resultados(self):
+        """Número de fragmentos que llegan al prompt."""
+        if self.usar_reranker:
+            # Tras el reranking bastan menos fragmentos para el mismo contexto útil
+            return 1 if self.modo_prueba else 2
+        return 1 if self.modo_prueba else 3
+
+    def respuesta_precalculada(self, pregunta):
+        """Respuesta precalculada para el índice y la versión actuales, o None (sin embeddings ni LLM).
+
+        Las respuestas se generan en modo normal (ver `answer_store.main`): en modo prueba
+        no se sirven.
+        """
+        if self.respuestas_precalculadas is None or self.modo_prueba:
+            return None
+        registro = self.respuestas_precalculadas.buscar(pregunta, self.indices.nombre_actual,
+                                                        self.producto or INDICE_GENERAL)
+        if registro is None:
+            return None
+        print(f"⚡ Respuesta precalculada ({registro['producto']})")
+        return registro['respuesta']
+
+    def generar_respuesta(self, pregunta, recuperados=None):
+        """Genera una respuesta usando RAG.
+
+        `recuperados` es el `(embedding, índices)` de una recuperación ya hecha sobre la
+        versión fijada (p. ej. por `AnswerRouter.extraer`): se reutiliza en lugar de volver
+        a calcular el embedding y buscar.
+        """
         try:
+            respuesta = self.respuesta_precalculada(pregunta)
+            if respuesta is not None:
+                self.metricas = {'precalculada': True}
+                return respuesta
+
             inicio_total = time.time()
+            if recuperados is None:
+                self.metricas = {}
             # Obtener contexto relevante
             print("🔍 Buscando información relevante...")
             inicio_contexto = time.time()
-            contexto = self.buscar_contexto(pregunta, num_resultados=1 if self.modo_prueba else 3)
+            num_resultados = self.num_resultados()
+            # Recuperación y lectura de textos sobre la misma versión del índice
+            with self.fijar_version() as version:
+                if recuperados is not None:
+                    # Los primeros de una recuperación más amplia (mismo orden, reranking incluido)
+                    pregunta_embedding, indices = recuperados
+                    if not self.top_k_adaptativo:
+                        indices = indices[:num_resultados]
+                    self.metricas['indices_contexto'] = indices
+                else:
+                    pregunta_embedding, indices = self.recuperar_fragmentos(pregunta, num_resultados=num_resultados)
+                fragmentos = [self.texts[i] for i in indices]
+                self.metricas['version_indice'] = version.nombre
+            if self.comprimir_contexto:
+                contexto = self.comprimir(pregunta_embedding, fragmentos)
+            else:
+                contexto = "\n".join(fragmentos)
             tiempo_contexto = time.time() - inicio_contexto
             
             # Crear el prompt con el contexto
@@ -84,6 +362,8 @@ class RAGSimple:
             
             Pregunta: {pregunta} [/INST]"""
 
+            tokens_prompt = len(self.llm.tokenize(prompt))
+
             print("🤖 Generando respuesta...")
             inicio_generacion = time.time()
             respuesta = self.llm(
@@ -93,7 +373,7 @@ class RAGSimple:
                 top_k=40,
                 top_p=0.95,
                 repetition_penalty=1.1,
-                batch_size=2,  # Aumentado por menor uso de memoria
+                batch_size=self.parametros_llm['batch_size'],
                 stop=["</s>", "[INST]"]
             )
             tiempo_generacion = time.time() - inicio_generacion
@@ -102,6 +382,17 @@ class RAGSimple:
             print(f"⏱️ Tiempo total de generación de respuesta: {tiempo_total:.2f}s")
             print(f"⏱️ Tiempo de búsqueda de contexto: {tiempo_contexto:.2f}s")
             print(f"⏱️ Tiempo de generación LLM: {tiempo_generacion:.2f}s")
+            print(f"🔢 Tokens del prompt: {tokens_prompt}")
+
+            if self.producto is not None:
+                self.metricas['registro_indices'] = self.indices.registro.estadisticas()
+            self.metricas.update({
+                'memoria': CONTABILIDAD.resumen(),
+                'tiempo_contexto': tiempo_contexto,
+                'tiempo_generacion': tiempo_generacion,
+                'tiempo_total': tiempo_total,
+                'tokens_prompt': tokens_prompt
+            })
 
             return respuesta.split("[/INST]")[-1].strip()
 
@@ -124,7 +415,19 @@ def main():
     # Inicializar el sistema RAG
     try:
         modo_prueba = st.checkbox("¿Deseas usar el modo de prueba?")
-        rag = RAGSimple(modo_prueba)
+        usar_reranker = st.checkbox("¿Reordenar el contexto con el cross-encoder?")
+        comprimir_contexto = st.checkbox("¿Comprimir el contexto a las oraciones más relevantes?")
+        usar_router = st.checkbox("¿Responder primero con el modelo extractivo (más rápido)?")
+        top_k_adaptativo = st.checkbox("¿Ajustar el número de fragmentos a la relevancia de los resultados?")
+        busqueda_jerarquica = st.checkbox("¿Buscar primero los documentos y después sus fragmentos?")
+        productos = productos_disponibles()
+        producto = st.selectbox("Línea de producto:", ["General"] + productos) if productos else "General"
+        rag = RAGSimple(modo_prueba, usar_reranker=usar_reranker, comprimir_contexto=comprimir_contexto,
+                        respuestas_precalculadas=cargar_respuestas_precalculadas(),
+                        top_k_adaptativo=top_k_adaptativo, busqueda_jerarquica=busqueda_jerarquica,
+                        producto=None if producto == "General" else producto)
+        # Umbral de la última calibración (router_umbral.json); pipeline e historial compartidos
+        router = AnswerRouter(rag, qa=cargar_qa(), historial=cargar_historial_router()) if usar_router else None
         st.success("✅ Modelo cargado correctamente")
     except FileNotFoundError as e:
         st.error("❌ No se encontraron los archivos necesarios.")
@@ -141,11 +444,19 @@ def main():
     if query:
         with st.spinner("🔄 Procesando tu pregunta..."):
             try:
-                response = rag.generar_respuesta(query)
+                if router is not None:
+                    resultado = router.responder(query)
+                    response = resultado['respuesta']
+                else:
+                    response = rag.generar_respuesta(query)
                 
                 # Mostrar la respuesta
                 st.write("### 📝 Respuesta:")
                 st.write(response)
+                if router is not None:
+                    st.caption(f"Respondido por el nivel {resultado['nivel']} en {resultado['latencia']:.2f}s")
+                    with st.expander("🧭 Tráfico por nivel del router"):
+                        st.json(router.resumen())
             except Exception as e:
                 st.error(f"❌ Error al generar la respuesta: {str(e)}")
                 st.info("Intenta reformular tu pregunta o contacta al administrador si el error persiste.")
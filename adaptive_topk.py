@@ -0,0 +1,32 @@
+import numpy as np
+
+# Valores para distancias L2 al cuadrado entre embeddings normalizados (MiniLM): d = 2 - 2·cos,
+# así un salto de 0.15 equivale a ~0.075 de similitud coseno
+SALTO_DISTANCIA = 0.15
+MASA_ACUMULADA = 0.8
+TEMPERATURA = 0.1
+
+def seleccionar_k(distancias, k_min=1, k_max=5, salto=SALTO_DISTANCIA, masa=MASA_ACUMULADA,
+                  temperatura=TEMPERATURA):
+    """Número de resultados a conservar según la distribución de distancias (ordenadas).
+
+    Se corta en el primer salto de distancia mayor que `salto` entre dos resultados
+    consecutivos y, como mucho, en el menor k cuyo peso acumulado (softmax de las
+    distancias con `temperatura`) alcanza `masa`. Si el primer resultado domina se
+    devuelve uno; si las distancias son parecidas, hasta `k_max`.
+    """
+    distancias = np.asarray(distancias, dtype=np.float64)[:k_max]
+    distancias = distancias[np.isfinite(distancias)]
+    if len(distancias) <= k_min:
+        return len(distancias)
+
+    # Corte por salto: el primer hueco grande separa los relevantes del resto
+    saltos = np.flatnonzero(np.diff(distancias) >= salto)
+    k_salto = int(saltos[0]) + 1 if len(saltos) else len(distancias)
+
+    # Corte por masa acumulada de los scores
+    pesos = np.exp(-(distancias - distancias[0]) / temperatura)
+    acumulada = np.cumsum(pesos) / pesos.sum()
+    k_masa = int(np.searchsorted(acumulada, masa)) + 1
+
+    return max(k_min, min(k_salto, k_masa, len(distancias)))
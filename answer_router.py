@@ -0,0 +1,195 @@
+import os
+import re
+import json
+import time
+from datetime import datetime
+import numpy as np
+
+# Umbral calibrado por `AnswerRouter.calibrar`; RAG.py lo carga al servir
+UMBRAL_FILE = "router_umbral.json"
+UMBRAL_POR_DEFECTO = 0.3
+
+# Preguntas abiertas que requieren redacción (recomendaciones, comparaciones, explicaciones)
+OPEN_ENDED = re.compile(
+    r'(?i)\b(por qué|porqué|explica|explícame|compara|comparar|diferencias?|recomienda|'
+    r'recomiendas|recomendación|aconseja|conviene|ventajas|desventajas|mejor opción|resume|resumen)\b'
+)
+
+def _normalizar(texto):
+    return re.findall(r'\w+', texto.lower())
+
+def _f1_tokens(prediccion, referencia):
+    """F1 por tokens entre dos respuestas (métrica estándar de SQuAD)."""
+    pred, ref = _normalizar(prediccion), _normalizar(referencia)
+    if not pred or not ref:
+        return 0.0
+    comunes = sum(min(pred.count(t), ref.count(t)) for t in set(pred))
+    if comunes == 0:
+        return 0.0
+    precision, recall = comunes / len(pred), comunes / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+def cargar_umbral(umbral_file=UMBRAL_FILE):
+    """Umbral guardado por la última calibración, o `UMBRAL_POR_DEFECTO` si no hay uno válido."""
+    if not os.path.exists(umbral_file):
+        return UMBRAL_POR_DEFECTO
+    try:
+        with open(umbral_file, 'r', encoding='utf-8') as f:
+            return float(json.load(f)['umbral'])
+    except (OSError, json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        print(f"⚠️ El umbral de {umbral_file} no es válido ({e}); se usa {UMBRAL_POR_DEFECTO}")
+        return UMBRAL_POR_DEFECTO
+
+def cargar_pipeline_qa(modelo_qa="deepset/roberta-base-squad2"):
+    """Pipeline extractivo de transformers (RAG.py lo comparte entre sesiones con st.cache_resource)."""
+    from transformers import pipeline
+    return pipeline("question-answering", model=modelo_qa)
+
+class AnswerRouter:
+    """Responde primero con el modelo extractivo y recurre a llama solo si hace falta.
+
+    Las preguntas del catálogo con respuesta precalculada se resuelven antes de cualquier
+    embedding o generación.
+
+    El span extractivo se devuelve (con su fuente) cuando su score supera `umbral` (por
+    defecto el de la última calibración, `UMBRAL_FILE`); las preguntas abiertas o con baja
+    confianza pasan a `RAGSimple.generar_respuesta`, reutilizando los fragmentos ya recuperados.
+    `qa` e `historial` pueden compartirse entre instancias (un router por ejecución de Streamlit).
+    """
+
+    def __init__(self, rag, umbral=None, num_resultados=3, modelo_qa="deepset/roberta-base-squad2",
+                 qa=None, historial=None):
+        self.rag = rag
+        self.umbral = cargar_umbral() if umbral is None else umbral
+        self.num_resultados = num_resultados
+        self.modelo_qa = modelo_qa
+        self._qa = qa
+        self.historial = historial if historial is not None else []  # (nivel, latencia) por pregunta
+
+    @property
+    def qa(self):
+        """Carga el pipeline extractivo la primera vez que se usa."""
+        if self._qa is None:
+            self._qa = cargar_pipeline_qa(self.modelo_qa)
+        return self._qa
+
+    def es_abierta(self, pregunta):
+        return OPEN_ENDED.search(pregunta) is not None
+
+    def extraer(self, pregunta):
+        """Ejecuta el modelo extractivo sobre el contexto recuperado y localiza la fuente del span.
+
+        Devuelve también el embedding y los fragmentos recuperados (`recuperados`) para que
+        la generación no repita la búsqueda.
+        """
+        with self.rag.fijar_version():
+            embedding, indices = self.rag.recuperar_fragmentos(pregunta, num_resultados=self.num_resultados)
+            fragmentos = [self.rag.texts[i] for i in indices]
+            fuentes = [self.rag.fuente(i) for i in indices]
+        if not fragmentos:
+            return None
+
+        contexto = "\n\n".join(fragmentos)
+        resultado = self.qa(question=pregunta, context=contexto)
+
+        # Offset de inicio de cada fragmento dentro del contexto concatenado
+        inicios = np.cumsum([0] + [len(f) + 2 for f in fragmentos[:-1]])
+        posicion = int(np.searchsorted(inicios, resultado['start'], side='right')) - 1
+        return {
+            'respuesta': resultado['answer'],
+            'score': float(resultado['score']),
+            'fuente': fuentes[posicion],
+            'recuperados': (embedding, indices)
+        }
+
+    def responder(self, pregunta):
+        """Devuelve la respuesta, el nivel que la resolvió y la latencia."""
+        inicio = time.time()
+        extractiva = None
+        # Misma versión del índice para la extracción y, si hace falta, la generación
+        with self.rag.fijar_version():
+            precalculada = self.rag.respuesta_precalculada(pregunta)
+
+            if precalculada is None and not self.es_abierta(pregunta):
+                extractiva = self.extraer(pregunta)
+
+            if precalculada is not None:
+                nivel = 'precalculado'
+                respuesta = precalculada
+            elif extractiva is not None and extractiva['score'] >= self.umbral:
+                nivel = 'extractivo'
+                respuesta = f"{extractiva['respuesta']} (Fuente: {extractiva['fuente']})"
+            else:
+                nivel = 'generativo'
+                respuesta = self.rag.generar_respuesta(
+                    pregunta, recuperados=extractiva['recuperados'] if extractiva is not None else None)
+
+        latencia = time.time() - inicio
+        self.historial.append((nivel, latencia))
+        print(f"🧭 Nivel: {nivel} ({latencia:.2f}s)"
+              + (f", score extractivo {extractiva['score']:.3f}" if extractiva else ""))
+        return {
+            'respuesta': respuesta,
+            'nivel': nivel,
+            'score': extractiva['score'] if extractiva else None,
+            'fuente': extractiva['fuente'] if nivel == 'extractivo' else None,
+            'latencia': latencia
+        }
+
+    def calibrar(self, preguntas, precision_objetivo=0.9, f1_minimo=0.5, umbral_file=UMBRAL_FILE):
+        """Elige el umbral más bajo cuya precisión extractiva alcanza `precision_objetivo`.
+
+        `preguntas` es una lista de preguntas o de pares (pregunta, respuesta esperada). Sin
+        respuesta esperada se usa como referencia la respuesta generada por llama. Un span se
+        considera correcto si su F1 por tokens con la referencia es al menos `f1_minimo`.
+        El umbral se guarda en `umbral_file` para que RAG.py lo use al servir.
+        """
+        muestras = []
+        for item in preguntas:
+            pregunta, esperada = item if isinstance(item, tuple) else (item, None)
+            extractiva = self.extraer(pregunta)
+            if extractiva is None:
+                continue
+            if esperada is None:
+                esperada = self.rag.generar_respuesta(pregunta)
+            correcta = _f1_tokens(extractiva['respuesta'], esperada) >= f1_minimo
+            muestras.append((extractiva['score'], correcta))
+
+        if not muestras:
+            print("⚠️ No hay muestras para calibrar; se mantiene el umbral actual")
+            return self.umbral
+
+        # Recorrer los scores de mayor a menor y quedarse con el último que mantiene la precisión
+        muestras.sort(key=lambda m: m[0], reverse=True)
+        aciertos = 0
+        umbral = None
+        for n, (score, correcta) in enumerate(muestras, 1):
+            aciertos += correcta
+            if aciertos / n >= precision_objetivo:
+                umbral = score
+        self.umbral = umbral if umbral is not None else float('inf')
+        print(f"✅ Umbral calibrado: {self.umbral:.3f} ({len(muestras)} muestras)")
+        if umbral_file:
+            with open(umbral_file, 'w', encoding='utf-8') as f:
+                json.dump({'umbral': self.umbral,
+                           'muestras': len(muestras), 'precision_objetivo': precision_objetivo,
+                           'calibrado': datetime.now().isoformat()}, f, indent=2)
+        return self.umbral
+
+    def resumen(self):
+        """Fracción de tráfico por nivel y distribución de latencias extremo a extremo."""
+        if not self.historial:
+            return {}
+        niveles = [n for n, _ in self.historial]
+        latencias = np.array([l for _, l in self.historial])
+        resumen = {
+            'total': len(self.historial),
+            'latencia_p50': float(np.percentile(latencias, 50)),
+            'latencia_p90': float(np.percentile(latencias, 90)),
+            'latencia_p99': float(np.percentile(latencias, 99))
+        }
+        for nivel in ('precalculado', 'extractivo', 'generativo'):
+            lat_nivel = np.array([l for n, l in self.historial if n == nivel])
+            resumen[f'fraccion_{nivel}'] = niveles.count(nivel) / len(niveles)
+            resumen[f'latencia_p50_{nivel}'] = float(np.percentile(lat_nivel, 50)) if len(lat_nivel) else None
+        return resumen
@@ -0,0 +1,214 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import sqlite3
+from datetime import datetime
+
+ANSWER_STORE = "respuestas_precalculadas.sqlite"
+PREGUNTAS_FILE = "preguntas_frecuentes.json"
+# Índice sobre el que se calculó una respuesta: el general o el de una línea de producto
+INDICE_GENERAL = "general"
+
+def clave_pregunta(pregunta):
+    """Forma normalizada de la pregunta (minúsculas, solo palabras) usada como clave."""
+    return ' '.join(re.findall(r'\w+', pregunta.lower()))
+
+def huella_fragmento(texto):
+    """Identidad de un fragmento que se mantiene entre reconstrucciones del índice."""
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+class AnswerStore:
+    """Respuestas precalculadas en SQLite, con los fragmentos y la versión del índice de los que dependen.
+
+    Cada respuesta es de una pregunta sobre un índice concreto (`INDICE_GENERAL` o el de un
+    producto), porque la misma pregunta recupera fragmentos distintos en cada uno.
+    """
+
+    def __init__(self, path=ANSWER_STORE):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        columnas = [fila[1] for fila in self._conn.execute("PRAGMA table_info(respuestas)")]
+        if columnas and 'indice' not in columnas:
+            # Store anterior, sin índice en la clave: se regenera con `python answer_store.py`
+            print("⚠️ Store de respuestas sin índice por producto: se descarta y se regenerará")
+            self._conn.execute("DROP TABLE respuestas")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS respuestas ("
+            " clave TEXT NOT NULL,"
+            " indice TEXT NOT NULL,"
+            " pregunta TEXT NOT NULL,"
+            " producto TEXT,"
+            " respuesta TEXT NOT NULL,"
+            " fragmentos TEXT NOT NULL,"
+            " fuentes TEXT NOT NULL,"
+            " version TEXT NOT NULL,"
+            " actualizado TEXT NOT NULL,"
+            " PRIMARY KEY (clave, indice))"
+        )
+        self._conn.commit()
+
+    def _registro(self, fila):
+        clave, indice, pregunta, producto, respuesta, fragmentos, fuentes, version, actualizado = fila
+        return {
+            'clave': clave,
+            'indice': indice,
+            'pregunta': pregunta,
+            'producto': producto,
+            'respuesta': respuesta,
+            'fragmentos': json.loads(fragmentos),
+            'fuentes': json.loads(fuentes),
+            'version': version,
+            'actualizado': actualizado
+        }
+
+    def get(self, pregunta, indice=INDICE_GENERAL):
+        fila = self._conn.execute(
+            "SELECT * FROM respuestas WHERE clave = ? AND indice = ?",
+            (clave_pregunta(pregunta), indice)).fetchone()
+        return self._registro(fila) if fila is not None else None
+
+    def upsert(self, pregunta, producto, respuesta, fragmentos, fuentes, version, indice=INDICE_GENERAL):
+        """Inserta o sustituye la respuesta de una pregunta sobre `indice`."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO respuestas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (clave_pregunta(pregunta), indice, pregunta, producto, respuesta, json.dumps(fragmentos),
+             json.dumps(fuentes, ensure_ascii=False), version, datetime.now().isoformat())
+        )
+        self._conn.commit()
+
+    def marcar_version(self, pregunta, version, indice=INDICE_GENERAL):
+        """Confirma que la respuesta sigue siendo válida en otra versión del índice."""
+        self._conn.execute("UPDATE respuestas SET version = ? WHERE clave = ? AND indice = ?",
+                           (version, clave_pregunta(pregunta), indice))
+        self._conn.commit()
+
+    def delete(self, pregunta, indice=INDICE_GENERAL):
+        self._conn.execute("DELETE FROM respuestas WHERE clave = ? AND indice = ?",
+                           (clave_pregunta(pregunta), indice))
+        self._conn.commit()
+
+    def items(self, indice=None):
+        """Registros del store (solo los de `indice` si se indica)."""
+        if indice is None:
+            filas = self._conn.execute("SELECT * FROM respuestas ORDER BY indice, producto, clave")
+        else:
+            filas = self._conn.execute("SELECT * FROM respuestas WHERE indice = ? ORDER BY producto, clave",
+                                       (indice,))
+        for fila in filas:
+            yield self._registro(fila)
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+class RespuestasPrecalculadas:
+    """Vista en memoria del store para servir: búsqueda O(1) por (pregunta normalizada, índice).
+
+    Solo devuelve respuestas calculadas sobre el mismo índice (general o de producto) y la
+    misma versión que se está sirviendo, así que tras una reconstrucción no se sirve nada
+    hasta volver a ejecutar el trabajo offline. El archivo se vuelve a leer cuando cambia en disco.
+    """
+
+    def __init__(self, path=ANSWER_STORE):
+        self.path = path
+        self._mtime = None
+        self._respuestas = {}
+
+    def _recargar(self):
+        mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+        if mtime == self._mtime:
+            return
+        self._respuestas = {}
+        if mtime is not None:
+            store = AnswerStore(self.path)
+            try:
+                self._respuestas = {(registro['clave'], registro['indice']): registro
+                                    for registro in store.items()}
+            finally:
+                store.close()
+        self._mtime = mtime
+
+    def buscar(self, pregunta, version, indice=INDICE_GENERAL):
+        """Registro precalculado de la pregunta para `version` de `indice`, o None."""
+        self._recargar()
+        registro = self._respuestas.get((clave_pregunta(pregunta), indice))
+        if registro is None or registro['version'] != version:
+            return None
+        return registro
+
+def cargar_preguntas(preguntas_file=PREGUNTAS_FILE):
+    """Lista de (producto, pregunta) del catálogo curado."""
+    with open(preguntas_file, 'r', encoding='utf-8') as f:
+        catalogo = json.load(f)
+    return [(producto, pregunta) for producto, preguntas in catalogo.items() for pregunta in preguntas]
+
+def precalcular(rag, preguntas, store):
+    """Genera con `rag` las respuestas del catálogo y las guarda en `store`.
+
+    Las respuestas son las de `rag` con su configuración (modo normal y recuperación
+    base en `main`) sobre su índice: el general o el de `rag.producto`.
+    La recuperación (barata) se repite para todas las preguntas; la generación solo para
+    las que no tienen respuesta o cuyos fragmentos de apoyo han cambiado desde entonces.
+    Devuelve el número de respuestas generadas, conservadas y eliminadas.
+    """
+    indice = rag.producto or INDICE_GENERAL
+    resumen = {'generadas': 0, 'conservadas': 0, 'eliminadas': 0}
+    claves = {clave_pregunta(pregunta) for _, pregunta in preguntas}
+    for registro in list(store.items(indice)):
+        if registro['clave'] not in claves:
+            store.delete(registro['pregunta'], indice)
+            resumen['eliminadas'] += 1
+
+    for producto, pregunta in preguntas:
+        with rag.fijar_version() as version:
+            num_resultados = rag.num_resultados()
+            _, indices = rag.recuperar_fragmentos(pregunta, num_resultados=num_resultados)
+            fragmentos = [huella_fragmento(version.texts[i]) for i in indices]
+            registro = store.get(pregunta, indice)
+            if registro is not None and registro['fragmentos'] == fragmentos:
+                store.marcar_version(pregunta, version.nombre, indice)
+                resumen['conservadas'] += 1
+                continue
+
+            print(f"🔄 [{producto}] {pregunta}")
+            respuesta = rag.generar_respuesta(pregunta)
+            if respuesta.startswith("❌"):
+                print(f"⚠️ No se guarda la respuesta: {respuesta}")
+                continue
+            indices = rag.metricas['indices_contexto']
+            store.upsert(pregunta, producto, respuesta,
+                         [huella_fragmento(version.texts[i]) for i in indices],
+                         [rag.fuente(i) for i in indices], version.nombre, indice)
+            resumen['generadas'] += 1
+
+    print(f"✅ Respuestas precalculadas ({indice}): {resumen['generadas']} generadas, "
+          f"{resumen['conservadas']} sin cambios, {resumen['eliminadas']} eliminadas")
+    return resumen
+
+def main():
+    """Precalcula el catálogo sobre el índice general y las preguntas de cada producto sobre el suyo.
+
+    Se usa la configuración por defecto de `RAGSimple` (modo normal, sin reranker, sin
+    compresión ni top-k adaptativo): es la de las respuestas que se sirven.
+    """
+    from RAG import RAGSimple
+    from index_registry import productos_disponibles
+
+    preguntas_file = sys.argv[1] if len(sys.argv) > 1 else PREGUNTAS_FILE
+    preguntas = cargar_preguntas(preguntas_file)
+    store = AnswerStore()
+    try:
+        rag = RAGSimple()
+        precalcular(rag, preguntas, store)
+        for producto in productos_disponibles():
+            rag = RAGSimple(producto=producto)
+            precalcular(rag, [(p, pregunta) for p, pregunta in preguntas if p == producto], store)
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
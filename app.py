@@ -1,79 +1,82 @@
 import streamlit as st
 import os
-import fitz  # PyMuPDF
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from transformers import pipeline
+from index_versions import ruta_indice
 
-# 🔹 Configurar directorio de PDFs
-pdf_directory = "data"
+# Los modelos (sentence_transformers, transformers/torch) y el índice FAISS se cargan
+# de forma perezosa la primera vez que se hace una pregunta, no al importar el módulo.
 
-# 🔹 Cargar el modelo de embeddings
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+# 🔹 Backend de embeddings: "torch" (por defecto) u "onnx" (int8 en onnxruntime)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
 
-# 🔹 Cargar el índice FAISS y los IDs de los documentos
-index = faiss.read_index("vector_index.faiss")
-doc_ids = np.load("vector_ids.npy", allow_pickle=True)  # Cargar los nombres de los archivos indexados
+# 🔹 Cargar el modelo de embeddings detrás del micro-batcher compartido por todas las sesiones
+@st.cache_resource
+def cargar_batcher():
+    from embedding_backends import get_embedding_backend
+    from query_batcher import MicroBatcher
+    return MicroBatcher(get_embedding_backend(EMBEDDING_BACKEND, "all-MiniLM-L6-v2"))
+
+# 🔹 Cargar la versión publicada del índice (vectores, textos y procedencia)
+@st.cache_resource
+def cargar_indice(ruta):
+    from index_versions import VersionIndice
+    return VersionIndice(ruta)
 
 # 🔹 Cargar el modelo de Hugging Face para responder preguntas
-nlp = pipeline(
-    "question-answering",
-    model="deepset/roberta-base-squad2",
-)
+@st.cache_resource
+def cargar_modelo_qa():
+    from transformers import pipeline
+    return pipeline(
+        "question-answering",
+        model="deepset/roberta-base-squad2",
+    )
 
 # 🔹 FUNCIÓN PARA RECUPERAR DOCUMENTOS RELEVANTES DESDE "data/"
-def retrieve_relevant_documents(query, k=3):
-    """Convierte la consulta en embeddings y busca en FAISS los fragmentos más relevantes en la carpeta data/."""
-    query_embedding = embedding_model.encode([query], convert_to_numpy=True)
-    distances, indices = index.search(query_embedding, k)
+def retrieve_relevant_documents(query, k=3, adaptativo=False, k_max=5):
+    """Convierte la consulta en embeddings y busca en FAISS los fragmentos más relevantes en la carpeta data/.
+
+    Con `adaptativo` se piden `k_max` resultados y se conservan los que indique la
+    distribución de distancias (ver `adaptive_topk.seleccionar_k`) en lugar de `k`.
+    """
+    version = cargar_indice(ruta_indice())
+    # Las consultas simultáneas de varias sesiones se codifican y buscan en un solo lote
+    _, distances, indices, _ = cargar_batcher().buscar(query, version.index, k_max if adaptativo else k).result()
+
+    validos = (indices[0] >= 0) & (indices[0] < len(version.texts))
+    indices = indices[0][validos]
+    if adaptativo:
+        from adaptive_topk import seleccionar_k
+        indices = indices[:seleccionar_k(distances[0][validos], k_max=k_max)]
+    if not len(indices):
+        return ["No se encontró información relevante."]
+
+    # 🔹 Documento, página y sección de cada fragmento: consulta vectorizada a la procedencia
+    if version.procedencia is not None:
+        filenames = version.procedencia.documento(indices)
+        paginas = version.procedencia.page[indices]
+        secciones = version.procedencia.section[indices]
+    else:
+        # Índices sin procedencia: "archivo.pdf | sección N"
+        partes = [version.ids[i].split(" | sección ") for i in indices]
+        filenames = [p[0] for p in partes]
+        paginas = [0] * len(partes)
+        secciones = [int(p[1]) if len(p) > 1 else 0 for p in partes]
 
+    # 🔹 El texto del fragmento está en el índice: no hace falta volver a abrir el PDF
     relevant_docs = []
-    retrieved_filenames = []
-
-    for idx in indices[0]:  # Iterar sobre los fragmentos más relevantes
-        if idx >= len(doc_ids):
-            continue
-        
-        doc_info = doc_ids[idx]  # 🔹 Nombre del PDF + número de párrafo
-        pdf_filename, paragraph_id = doc_info.split(" | párrafo ")
-
-        retrieved_filenames.append(pdf_filename)
-
-        # 🔹 Leer el párrafo específico desde el PDF
-        pdf_path = os.path.join(pdf_directory, pdf_filename)
-        paragraph_id = int(paragraph_id)
-
-        try:
-            with fitz.open(pdf_path) as doc:
-                text = ""
-                paragraph_counter = 0
-                for page in doc:
-                    paragraphs = page.get_text("text").split("\n\n")  # Dividimos por párrafos
-                    for p in paragraphs:
-                        if len(p.strip()) > 50:
-                            if paragraph_counter == paragraph_id:
-                                text = p.strip()
-                                break
-                            paragraph_counter += 1
-        except Exception as e:
-            print(f"❌ Error al leer {pdf_filename}: {e}")
-            continue
-
-        # Si el párrafo tiene contenido, agregarlo
-        if text:
-            relevant_docs.append({
-                "filename": pdf_filename,
-                "paragraph_id": paragraph_id,
-                "content": text
-            })
-
-    return relevant_docs if relevant_docs else ["No se encontró información relevante."]
+    for idx, filename, pagina, seccion in zip(indices, filenames, paginas, secciones):
+        relevant_docs.append({
+            "filename": filename,
+            "page": int(pagina),
+            "paragraph_id": int(seccion),
+            "content": version.texts[idx]
+        })
+
+    return relevant_docs
 
 # 🔹 FUNCIÓN PARA RESPONDER PREGUNTAS USANDO RETRIEVAL + QA
-def query_document_qa(user_query, k=3):
+def query_document_qa(user_query, k=3, adaptativo=False):
     """Recupera párrafos usando FAISS y responde la pregunta con `deepset/roberta-base-squad2`."""
-    retrieved_docs = retrieve_relevant_documents(user_query, k)
+    retrieved_docs = retrieve_relevant_documents(user_query, k, adaptativo=adaptativo)
 
     if not retrieved_docs or retrieved_docs == ["No se encontró información relevante."]:
         return "No encontré información relevante.", []
@@ -82,36 +85,43 @@ def query_document_qa(user_query, k=3):
     context = "\n\n".join([doc["content"] for doc in retrieved_docs])
 
     # 🔹 Hacer la pregunta al modelo de Hugging Face
+    nlp = cargar_modelo_qa()
     response = nlp(question=user_query, context=context)
     answer = response.get("answer", "No encontré una respuesta clara.")
 
     return answer, retrieved_docs
 
 # 🔹 INTERFAZ EN STREAMLIT
-st.set_page_config(page_title="🔍 RAG - Respuestas con Documentos", layout="wide")
-st.title("📚 RAG - Sistema de Respuestas Basado en Documentos")
-
-# 📝 Entrada de usuario
-st.markdown("### 📝 Ingresa tu pregunta:")
-user_query = st.text_input("Escribe tu pregunta sobre los documentos:")
-
-if st.button("🔍 Buscar Respuesta"):
-    if user_query.strip():
-        with st.spinner("Buscando respuesta..."):
-            response, retrieved_docs = query_document_qa(user_query)
-
-        # 🔹 Mostrar la respuesta generada
-        st.success("✅ Respuesta encontrada:")
-        st.write(f"**🤖 {response}**")
-
-        # 🔹 Mostrar los documentos relevantes recuperados
-        st.markdown("### 📂 Documentos Consultados:")
-        if retrieved_docs:
-            for doc in retrieved_docs:
-                with st.expander(f"📄 {doc['filename']} | Párrafo {doc['paragraph_id']}"):
-                    st.write(doc["content"])
+def main():
+    st.set_page_config(page_title="🔍 RAG - Respuestas con Documentos", layout="wide")
+    st.title("📚 RAG - Sistema de Respuestas Basado en Documentos")
+
+    # 📝 Entrada de usuario
+    st.markdown("### 📝 Ingresa tu pregunta:")
+    user_query = st.text_input("Escribe tu pregunta sobre los documentos:")
+    adaptativo = st.checkbox("¿Ajustar el número de fragmentos a la relevancia de los resultados?")
+
+    if st.button("🔍 Buscar Respuesta"):
+        if user_query.strip():
+            with st.spinner("Buscando respuesta..."):
+                response, retrieved_docs = query_document_qa(user_query, adaptativo=adaptativo)
+
+            # 🔹 Mostrar la respuesta generada
+            st.success("✅ Respuesta encontrada:")
+            st.write(f"**🤖 {response}**")
+
+            # 🔹 Mostrar los documentos relevantes recuperados
+            st.markdown("### 📂 Documentos Consultados:")
+            if retrieved_docs:
+                for doc in retrieved_docs:
+                    pagina = f" | Página {doc['page']}" if doc['page'] else ""
+                    with st.expander(f"📄 {doc['filename']}{pagina} | Sección {doc['paragraph_id']}"):
+                        st.write(doc["content"])
+            else:
+                st.warning("No se encontraron documentos relevantes.")
+
         else:
-            st.warning("No se encontraron documentos relevantes.")
+            st.warning("⚠️ Por favor ingresa una pregunta.")
 
-    else:
-        st.warning("⚠️ Por favor ingresa una pregunta.")
+if __name__ == "__main__":
+    main()
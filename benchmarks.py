@@ -0,0 +1,420 @@
+import os
+import sys
+import time
+import json
+import threading
+import fitz  # PyMuPDF
+
+DATA_DIR = "preparsed_data"
+METADATA_FILE = "documentos_metadata.json"
+LARGEST_PDF = "20250226_CCGG_AZ_ Comunidades_V_Reducida.pdf"
+
+def cargar_textos_corpus(data_dir=DATA_DIR):
+    """Devuelve {nombre_pdf: texto completo} para todos los PDFs del corpus."""
+    textos = {}
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith('.pdf'):
+            continue
+        with fitz.open(os.path.join(data_dir, filename)) as doc:
+            textos[filename] = "".join(page.get_text() for page in doc)
+    return textos
+
+def _legacy_metadata_match(chunk, insurance_terms, main_sections):
+    """Implementación original de `_enhance_chunk_with_metadata` (tres recorridos por chunk)."""
+    contains_insurance_terms = any(term in chunk.lower() for term in insurance_terms)
+    in_important_section = any(section in chunk for section in main_sections)
+    section_context = next((s for s in main_sections if s in chunk), '')
+    return contains_insurance_terms, in_important_section, section_context
+
+def benchmark_metadata_matcher(n_chunks=100_000, chunk_chars=500):
+    """Compara el escaneo por subcadenas original con `MetadataMatcher` sobre `n_chunks` chunks."""
+    from enhanced_retrieval import MetadataMatcher
+
+    with open(METADATA_FILE, 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+    textos = cargar_textos_corpus()
+
+    # Chunks de tamaño fijo del corpus real, repetidos hasta llegar a n_chunks
+    base = []
+    for filename, text in textos.items():
+        if filename not in metadata:
+            continue
+        for i in range(0, len(text), chunk_chars):
+            base.append((filename, text[i:i + chunk_chars]))
+    chunks = [base[i % len(base)] for i in range(n_chunks)]
+    print(f"🔍 {len(chunks)} chunks de {chunk_chars} caracteres ({len(base)} únicos)")
+
+    summaries = {fn: metadata[fn].get('content_summary', {}) for fn in metadata}
+
+    inicio = time.time()
+    legacy = [
+        _legacy_metadata_match(chunk,
+                               summaries[fn].get('insurance_terms_present', []),
+                               summaries[fn].get('main_sections', []))
+        for fn, chunk in chunks
+    ]
+    tiempo_legacy = time.time() - inicio
+
+    inicio = time.time()
+    matchers = {fn: MetadataMatcher(s.get('insurance_terms_present', []), s.get('main_sections', []))
+                for fn, s in summaries.items()}
+    tiempo_compilacion = time.time() - inicio
+
+    inicio = time.time()
+    nuevos = [matchers[fn].match(chunk) for fn, chunk in chunks]
+    tiempo_matcher = time.time() - inicio
+
+    diferencias = sum(1 for a, b in zip(legacy, nuevos) if a != b)
+    print("\n📊 Matcher de metadatos:")
+    print(f"- Escaneo original: {tiempo_legacy:.2f}s")
+    print(f"- MetadataMatcher: {tiempo_matcher:.2f}s (+{tiempo_compilacion:.3f}s compilando {len(matchers)} autómatas)")
+    print(f"- Aceleración: {tiempo_legacy / max(tiempo_matcher, 1e-9):.1f}x")
+    print(f"- Resultados distintos: {diferencias}")
+
+def generar_consultas(n_queries, metadata_file=METADATA_FILE):
+    """Genera consultas de evaluación a partir de las palabras clave de cada documento."""
+    with open(metadata_file, 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+    plantillas = ["¿Qué cubre {}?", "¿Está incluida la {}?", "Condiciones de {}", "¿Cómo funciona {}?"]
+    keywords = [kw for doc in metadata.values() for kw in doc.get('content_summary', {}).get('keywords', [])]
+    return [plantillas[i % len(plantillas)].format(keywords[i % len(keywords)]) for i in range(n_queries)]
+
+def benchmark_retrieve_batch(batch_sizes=(1, 8, 32, 128), n_queries=256):
+    """Mide el throughput de `EnhancedRetriever.retrieve_batch` según el tamaño de lote."""
+    from enhanced_retrieval import EnhancedRetriever
+
+    retriever = EnhancedRetriever()
+    if not retriever.load_for_serving():
+        retriever.process_documents()
+    consultas = generar_consultas(n_queries)
+
+    # Calentamiento del modelo de embeddings
+    retriever.retrieve_batch(consultas[:2])
+
+    print("\n📊 Throughput de retrieve_batch:")
+    for batch_size in batch_sizes:
+        inicio = time.time()
+        for i in range(0, len(consultas), batch_size):
+            retriever.retrieve_batch(consultas[i:i + batch_size], k=5)
+        tiempo = time.time() - inicio
+        print(f"- Lote {batch_size:>4}: {len(consultas) / tiempo:.1f} consultas/s ({tiempo:.2f}s)")
+
+def benchmark_embedding_backends(n_single=50, n_bulk=2000, batch_size=64):
+    """Latencia de una consulta y throughput masivo de los backends de embeddings torch y onnx."""
+    import numpy as np
+    from embedding_backends import get_embedding_backend
+
+    consultas = generar_consultas(n_single)
+    if os.path.exists("vector_texts.npy"):
+        corpus = [str(t) for t in np.load("vector_texts.npy", mmap_mode='r')[:n_bulk]]
+    else:
+        corpus = [t[:1000] for t in cargar_textos_corpus().values()]
+
+    print(f"\n📊 Backends de embeddings ({len(corpus)} textos para el throughput):")
+    for backend in ("torch", "onnx"):
+        modelo = get_embedding_backend(backend)
+        modelo.encode(consultas[:2])  # Calentamiento (y exportación ONNX si hace falta)
+
+        latencias = []
+        for consulta in consultas:
+            inicio = time.time()
+            modelo.encode([consulta])
+            latencias.append(time.time() - inicio)
+
+        inicio = time.time()
+        modelo.encode(corpus, batch_size=batch_size)
+        tiempo_bulk = time.time() - inicio
+
+        print(f"- {backend}: p50 {np.percentile(latencias, 50) * 1000:.1f} ms, "
+              f"p95 {np.percentile(latencias, 95) * 1000:.1f} ms por consulta; "
+              f"{len(corpus) / tiempo_bulk:.1f} textos/s en bloque")
+
+def benchmark_sharded_search(shard_counts=(1, 2, 4, 8), n_vectors=200_000, n_queries=64, k=5):
+    """Latencia de búsqueda del índice repartido en shards según el número de shards."""
+    import tempfile
+    import faiss
+    import numpy as np
+    from sharded_index import construir_shards, ShardedIndex
+
+    # Corpus sintético del tamaño del archivo completo a partir de los vectores reales
+    index = faiss.read_index("vector_index.faiss")
+    base = index.reconstruct_n(0, index.ntotal)
+    base_ids = [str(i) for i in np.load("vector_ids.npy", mmap_mode='r')]
+    rng = np.random.default_rng(0)
+    repeticiones = -(-n_vectors // len(base))
+    vectores = np.tile(base, (repeticiones, 1))[:n_vectors]
+    vectores += rng.normal(0, 0.01, vectores.shape).astype(np.float32)
+    split_ids = [f"{base_ids[i % len(base_ids)].split(' | ')[0]}#{i // len(base_ids)} | sección 1"
+                 for i in range(n_vectors)]
+    consultas = vectores[rng.choice(n_vectors, n_queries, replace=False)]
+
+    print(f"\n📊 Búsqueda repartida ({n_vectors} vectores, {n_queries} consultas, k={k}):")
+    for num_shards in shard_counts:
+        with tempfile.TemporaryDirectory() as directorio:
+            construir_shards(vectores, split_ids, num_shards, directorio=directorio)
+            sharded = ShardedIndex(directorio)
+            try:
+                sharded.search(consultas[:1], k)  # Calentamiento de los procesos
+                latencias = []
+                for consulta in consultas:
+                    inicio = time.time()
+                    sharded.search(consulta[None, :], k)
+                    latencias.append(time.time() - inicio)
+            finally:
+                sharded.close()
+        print(f"- {num_shards} shards: p50 {np.percentile(latencias, 50) * 1000:.1f} ms, "
+              f"p95 {np.percentile(latencias, 95) * 1000:.1f} ms")
+
+def _legacy_content_stats(text, insurance_terms):
+    """Recuento original de `PDFAnalyzer.analyze_content_structure` (un findall por término)."""
+    from collections import Counter
+    import re
+
+    paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
+    sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
+    words = [w.lower() for w in re.findall(r'\w+', text.lower()) if len(w) > 3]
+    text_lower = text.lower()
+    terms = Counter()
+    for term in insurance_terms:
+        count = len(re.findall(r'\b' + term + r'\b', text_lower))
+        if count > 0:
+            terms[term] = count
+    return {
+        'paragraph_lengths': [len(p.split()) for p in paragraphs],
+        'sentence_lengths': [len(s.split()) for s in sentences],
+        'word_frequencies': Counter(words),
+        'total_words': len(words),
+        'insurance_terms_freq': terms
+    }
+
+def _legacy_metadata_words(text, insurance_terms):
+    """Recuento original de `MetadataGenerator.extract_text_content` (re.sub por palabra)."""
+    from collections import Counter
+    import re
+
+    words = []
+    for word in re.findall(r'\w+', text.lower()):
+        word = re.sub(r'[^\w\sáéíóúñ]', '', word)
+        if len(word) > 3 and not word.isdigit():
+            words.append(word)
+    text_lower = text.lower()
+    terms = Counter()
+    for term in insurance_terms:
+        count = len(re.findall(r'\b' + term + r'\b', text_lower))
+        if count > 0:
+            terms[term] = count
+    return {'word_frequencies': Counter(words), 'total_words': len(words), 'insurance_terms_freq': terms}
+
+def benchmark_text_stats(pdf_file=LARGEST_PDF, repeticiones=20):
+    """Estadísticas de texto originales frente a `text_stats.analizar_texto` en el PDF más grande."""
+    from text_stats import analizar_texto
+    from data_wrangler import PDFAnalyzer
+
+    insurance_terms = PDFAnalyzer(DATA_DIR).insurance_terms
+    with fitz.open(os.path.join(DATA_DIR, pdf_file)) as doc:
+        text = "".join(page.get_text() for page in doc)
+    print(f"🔍 {pdf_file}: {len(text)} caracteres, {repeticiones} repeticiones")
+
+    casos = [
+        ('data_wrangler', lambda: _legacy_content_stats(text, insurance_terms),
+         lambda: analizar_texto(text, insurance_terms)),
+        ('metadata_generator', lambda: _legacy_metadata_words(text, insurance_terms),
+         lambda: analizar_texto(text, insurance_terms, skip_numbers=True)),
+    ]
+    print("\n📊 Estadísticas de texto:")
+    for nombre, legacy, nuevo in casos:
+        inicio = time.time()
+        for _ in range(repeticiones):
+            esperado = legacy()
+        tiempo_legacy = (time.time() - inicio) / repeticiones
+
+        inicio = time.time()
+        for _ in range(repeticiones):
+            obtenido = nuevo()
+        tiempo_nuevo = (time.time() - inicio) / repeticiones
+
+        iguales = all(obtenido[clave] == valor for clave, valor in esperado.items())
+        print(f"- {nombre}: {tiempo_legacy * 1000:.1f} ms -> {tiempo_nuevo * 1000:.1f} ms "
+              f"({tiempo_legacy / max(tiempo_nuevo, 1e-9):.1f}x), resultados idénticos: {'sí' if iguales else 'no'}")
+
+def benchmark_dedup(n_queries=200, k=5, umbral=0.9):
+    """Reducción del índice y diversidad del top-k al deduplicar los fragmentos con MinHash."""
+    import faiss
+    import numpy as np
+    from dedup import MinHashDeduplicator
+    from embedding_backends import get_embedding_backend
+    from index_versions import VersionIndice, ruta_indice
+
+    version = VersionIndice(ruta_indice())
+    textos = list(version.texts)
+    ids = list(version.ids)
+    if version.bundle is not None:
+        vectores = np.array(version.bundle.vectors)
+    else:
+        vectores = version.index.reconstruct_n(0, version.index.ntotal)
+
+    inicio = time.time()
+    canonicos = np.array(MinHashDeduplicator(umbral=umbral).agrupar(textos))
+    tiempo = time.time() - inicio
+    filas = np.where(canonicos == np.arange(len(textos)))[0]
+    documentos = np.array([i.split(" | ")[0] for i in ids])
+    # Documentos en los que aparece cada fragmento canónico
+    cubiertos = {c: set(documentos[canonicos == c]) for c in filas}
+
+    completo = faiss.IndexFlatL2(vectores.shape[1])
+    completo.add(vectores)
+    dedup = faiss.IndexFlatL2(vectores.shape[1])
+    dedup.add(vectores[filas])
+
+    modelo = get_embedding_backend("torch")
+    consultas = np.asarray(modelo.encode(generar_consultas(n_queries), convert_to_numpy=True), dtype=np.float32)
+    _, I_completo = completo.search(consultas, k)
+    _, I_dedup = dedup.search(consultas, k)
+    I_dedup = filas[I_dedup]
+
+    unicos_completo = np.mean([len(set(canonicos[fila])) for fila in I_completo])
+    unicos_dedup = np.mean([len(set(canonicos[fila])) for fila in I_dedup])
+    docs_completo = np.mean([len(set(documentos[fila])) for fila in I_completo])
+    docs_dedup = np.mean([len(set().union(*(cubiertos[i] for i in fila))) for fila in I_dedup])
+
+    bytes_fragmento = vectores.shape[1] * 4
+    print(f"\n📊 Deduplicación MinHash (umbral {umbral}, {tiempo:.2f}s):")
+    print(f"- Fragmentos: {len(textos)} -> {len(filas)} ({1 - len(filas) / len(textos):.1%} menos)")
+    print(f"- Vectores del índice: {len(textos) * bytes_fragmento / 1e6:.2f} MB -> {len(filas) * bytes_fragmento / 1e6:.2f} MB")
+    print(f"- Fragmentos distintos en el top-{k}: {unicos_completo:.2f} -> {unicos_dedup:.2f}")
+    print(f"- Documentos citados en el top-{k}: {docs_completo:.2f} -> {docs_dedup:.2f}")
+    version.close()
+
+def benchmark_micro_batcher(concurrencias=(1, 4, 16), n_queries=128, k=5):
+    """Throughput y latencia de consultas concurrentes con y sin el micro-batcher."""
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+    from embedding_backends import get_embedding_backend
+    from index_versions import VersionIndice, ruta_indice
+    from query_batcher import MicroBatcher
+
+    modelo = get_embedding_backend("torch", "all-MiniLM-L6-v2")
+    version = VersionIndice(ruta_indice())
+    batcher = MicroBatcher(modelo)
+    consultas = generar_consultas(n_queries)
+    lock = threading.Lock()  # Sin batcher, el índice se consulta de una en una (p. ej. shards)
+
+    def individual(consulta):
+        inicio = time.time()
+        embedding = modelo.encode([consulta])
+        with lock:
+            version.index.search(embedding, k)
+        return time.time() - inicio
+
+    def agrupada(consulta):
+        inicio = time.time()
+        batcher.buscar(consulta, version.index, k).result()
+        return time.time() - inicio
+
+    individual(consultas[0])
+    agrupada(consultas[0])  # Calentamiento
+
+    print(f"\n📊 Micro-batcher ({n_queries} consultas, k={k}):")
+    for concurrencia in concurrencias:
+        for nombre, funcion in (("individual", individual), ("micro-batcher", agrupada)):
+            lotes_antes = batcher.stats['lotes']
+            with ThreadPoolExecutor(concurrencia) as pool:
+                inicio = time.time()
+                latencias = list(pool.map(funcion, consultas))
+                tiempo = time.time() - inicio
+            detalle = ""
+            if funcion is agrupada:
+                detalle = f", lote medio {n_queries / max(batcher.stats['lotes'] - lotes_antes, 1):.1f}"
+            print(f"- {concurrencia:>2} sesiones, {nombre:<13}: {n_queries / tiempo:.1f} consultas/s, "
+                  f"p50 {np.percentile(latencias, 50) * 1000:.1f} ms{detalle}")
+    version.close()
+
+def benchmark_jerarquica(n_queries=200, k=5, docs_k=(1, 3, 5)):
+    """Latencia, recall@k y fracción de fallback de la búsqueda jerárquica frente a la global."""
+    import numpy as np
+    from embedding_backends import get_embedding_backend
+    from index_versions import VersionIndice, ruta_indice
+
+    version = VersionIndice(ruta_indice())
+    if version.documentos_index is None:
+        print("❌ La versión actual no tiene índice de documentos: reconstruye el índice con loader.py")
+        return
+    modelo = get_embedding_backend("torch")
+    consultas = modelo.encode(generar_consultas(n_queries), convert_to_numpy=True).astype(np.float32)
+
+    inicio = time.time()
+    _, I_global = version.bundle.search(consultas, k)
+    tiempo_global = (time.time() - inicio) / n_queries
+    print(f"\n📊 Búsqueda jerárquica ({n_queries} consultas, k={k}, {version.bundle.ntotal} fragmentos):")
+    print(f"- Global: {tiempo_global * 1000:.2f} ms/consulta")
+
+    indice_docs = version.documentos_index
+    for n_docs in docs_k:
+        indice_docs.docs_k = n_docs
+        recall, fallback, tiempo = [], 0, 0.0
+        for consulta, globales in zip(consultas, I_global):
+            inicio = time.time()
+            resultado = indice_docs.search(consulta, k)
+            tiempo += time.time() - inicio
+            if resultado is None:
+                fallback += 1
+                continue
+            recall.append(len(set(resultado[1][0]) & set(globales)) / k)
+        recall_medio = f"{np.mean(recall):.3f}" if recall else "-"
+        print(f"- {n_docs} documentos: {tiempo / n_queries * 1000:.2f} ms/consulta, recall@{k} {recall_medio} "
+              f"respecto a la global, fallback {fallback / n_queries:.0%}")
+    version.close()
+
+def benchmark_registro_indices(n_consultas=500, presupuestos_mb=(256, 1024, 4096), zipf=1.2, semilla=0):
+    """Cargas, desalojos y latencias del registro por producto con un tráfico sesgado (Zipf)."""
+    import numpy as np
+    from index_registry import RegistroIndices, productos_disponibles
+
+    productos = productos_disponibles()
+    if not productos:
+        print("❌ No hay índices por producto: constrúyelos con loader.procesar_por_producto()")
+        return
+    # Los primeros productos reciben la mayor parte de las consultas
+    pesos = 1 / np.arange(1, len(productos) + 1) ** zipf
+    rng = np.random.default_rng(semilla)
+    secuencia = rng.choice(productos, size=n_consultas, p=pesos / pesos.sum())
+
+    print(f"\n📊 Registro de índices ({n_consultas} consultas sobre {len(productos)} productos):")
+    for presupuesto in presupuestos_mb:
+        registro = RegistroIndices(presupuesto_mb=presupuesto, vigilar=False)
+        inicio = time.time()
+        for producto in secuencia:
+            with registro.adquirir(producto):
+                pass
+        total = time.time() - inicio
+        stats = registro.estadisticas()
+        carga = stats['latencia_carga_media'] or 0
+        print(f"- {presupuesto} MB: {stats['cargas']} cargas, {stats['desalojos']} desalojos, "
+              f"aciertos {stats['aciertos'] / (stats['aciertos'] + stats['cargas']):.0%}, "
+              f"carga media {carga * 1000:.0f} ms, {total:.2f}s en total, "
+              f"residentes {stats['memoria_residente_mb']:.0f} MB")
+        registro.cerrar()
+
+BENCHMARKS = {
+    'metadata_matcher': benchmark_metadata_matcher,
+    'retrieve_batch': benchmark_retrieve_batch,
+    'embedding_backends': benchmark_embedding_backends,
+    'sharded_search': benchmark_sharded_search,
+    'text_stats': benchmark_text_stats,
+    'dedup': benchmark_dedup,
+    'micro_batcher': benchmark_micro_batcher,
+    'jerarquica': benchmark_jerarquica,
+    'registro_indices': benchmark_registro_indices,
+}
+
+def main():
+    nombres = sys.argv[1:] or list(BENCHMARKS)
+    for nombre in nombres:
+        if nombre not in BENCHMARKS:
+            print(f"❌ Benchmark desconocido: {nombre}. Disponibles: {', '.join(BENCHMARKS)}")
+            continue
+        print(f"\n🚀 Benchmark: {nombre}")
+        BENCHMARKS[nombre]()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import hashlib
+import itertools
+from contextlib import redirect_stdout
+import numpy as np
+import pandas as pd
+import fitz  # PyMuPDF
+from context_compressor import SENTENCE_SPLIT
+
+DATA_DIR = "preparsed_data"
+CACHE_DIR = "sweep_cache"
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Tamaños por estrategia: palabras en las ventanas de `DocumentProcessor.create_chunks`,
+# caracteres en el splitter recursivo de `EnhancedRetriever`. Las secciones del `splitter`
+# de loader.py no tienen parámetros.
+TAMANOS = {
+    'ventanas': (128, 256, 512, 1024),
+    'recursivo': (250, 500, 1000, 2000)
+}
+SOLAPES = (0.0, 0.1, 0.2)
+
+def cargar_paginas(data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """Texto por página de cada PDF. Se guarda en caché y solo se reextrae si el archivo cambia."""
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, "paginas.json")
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+
+    paginas = {}
+    cambios = False
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith('.pdf'):
+            continue
+        path = os.path.join(data_dir, filename)
+        firma = f"{os.path.getsize(path)}-{os.path.getmtime(path)}"
+        entrada = cache.get(filename)
+        if entrada is None or entrada['firma'] != firma:
+            with fitz.open(path) as doc:
+                entrada = {'firma': firma, 'paginas': [page.get_text() for page in doc]}
+            cache[filename] = entrada
+            cambios = True
+        paginas[filename] = entrada['paginas']
+
+    if cambios:
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+    return paginas
+
+class EmbeddingCache:
+    """Embeddings por texto (SHA-1) en memoria y en disco, con el coste de calcular cada uno.
+
+    Las configuraciones del barrido comparten muchos chunks (p. ej. las páginas más cortas
+    que la ventana salen iguales con cualquier tamaño); cada texto se embebe una sola vez.
+    """
+
+    def __init__(self, model, model_name=MODEL_NAME, cache_dir=CACHE_DIR):
+        self.model = model
+        self.path = os.path.join(cache_dir, f"embeddings_{model_name.replace('/', '__')}.npz")
+        self.vectores = {}
+        self.costes = {}
+        self._nuevos = 0
+        if os.path.exists(self.path):
+            datos = np.load(self.path)
+            for clave, vector, coste in zip(datos['claves'], datos['vectores'], datos['costes']):
+                self.vectores[str(clave)] = vector
+                self.costes[str(clave)] = float(coste)
+
+    @staticmethod
+    def clave(texto):
+        return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+    def encode(self, textos, batch_size=64):
+        """Devuelve los embeddings y los segundos que costaría calcularlos todos desde cero."""
+        claves = [self.clave(t) for t in textos]
+        pendientes = {}
+        for clave, texto in zip(claves, textos):
+            if clave not in self.vectores:
+                pendientes.setdefault(clave, texto)
+
+        pendientes = list(pendientes.items())
+        for inicio in range(0, len(pendientes), batch_size):
+            lote = pendientes[inicio:inicio + batch_size]
+            t0 = time.perf_counter()
+            embeddings = self.model.encode([texto for _, texto in lote], convert_to_numpy=True)
+            duracion = time.perf_counter() - t0
+            # El tiempo del lote se reparte en proporción a la longitud de cada texto
+            longitudes = np.array([len(texto) for _, texto in lote], dtype=np.float64)
+            for (clave, _), vector, longitud in zip(lote, embeddings, longitudes):
+                self.vectores[clave] = np.asarray(vector, dtype=np.float32)
+                self.costes[clave] = duracion * longitud / max(longitudes.sum(), 1.0)
+        self._nuevos += len(pendientes)
+
+        vectores = np.stack([self.vectores[c] for c in claves]) if claves else np.empty((0, 0), np.float32)
+        return vectores, sum(self.costes[c] for c in claves)
+
+    def guardar(self):
+        if not self._nuevos:
+            return
+        claves = list(self.vectores)
+        np.savez(self.path,
+                 claves=np.array(claves),
+                 vectores=np.stack([self.vectores[c] for c in claves]),
+                 costes=np.array([self.costes[c] for c in claves]))
+        self._nuevos = 0
+
+def chunks_ventanas(paginas, tamano, solape):
+    """Ventanas de palabras por página, como `DocumentProcessor.process_pdf`."""
+    from loader import DocumentProcessor
+    processor = DocumentProcessor(chunk_size=tamano, chunk_overlap=solape)
+    return [(filename, chunk['text'])
+            for filename, pags in paginas.items()
+            for pagina in pags
+            for chunk in processor.create_chunks(pagina)]
+
+def chunks_secciones(paginas):
+    """Secciones/párrafos del `splitter` de loader.py sobre el texto de `dataLoader`."""
+    from loader import DocumentProcessor
+    processor = DocumentProcessor()
+    textos = ["".join(pagina + "\n" for pagina in pags) for pags in paginas.values()]
+    with redirect_stdout(io.StringIO()):  # El splitter informa de cada documento
+        split_texts, split_ids = processor.splitter(textos, list(paginas))
+    return [(split_id.split(" | ")[0], texto) for texto, split_id in zip(split_texts, split_ids)]
+
+def chunks_recursivo(paginas, tamano, solape):
+    """Splitter recursivo de LangChain con los separadores de `EnhancedRetriever` (`SPLITTER_CONFIG`)."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from enhanced_retrieval import SPLITTER_CONFIG
+    config = dict(SPLITTER_CONFIG, chunk_size=tamano, chunk_overlap=int(tamano * solape))
+    splitter = RecursiveCharacterTextSplitter(**config)
+    return [(filename, chunk)
+            for filename, pags in paginas.items()
+            for chunk in splitter.split_text("".join(pags))]
+
+def generar_consultas(paginas, n=200, semilla=0):
+    """Consultas de ítem conocido: oraciones del corpus y el documento del que salen.
+
+    Un acierto es recuperar, entre los k primeros, un chunk del mismo documento que
+    contenga el inicio de la oración.
+    """
+    oraciones = []
+    for filename, pags in paginas.items():
+        texto = ' '.join("".join(pags).split())
+        oraciones.extend((filename, o.strip()) for o in SENTENCE_SPLIT.split(texto)
+                         if 40 <= len(o.strip()) <= 200)
+    return random.Random(semilla).sample(oraciones, min(n, len(oraciones)))
+
+def evaluar_configuracion(chunks, cache, consultas, embeddings_consultas, k=5):
+    """Métricas de una configuración de chunking sobre el corpus ya extraído."""
+    import faiss
+
+    textos = [texto for _, texto in chunks]
+    embeddings, tiempo_embedding = cache.encode(textos)
+
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(embeddings)
+    bytes_indice = int(faiss.serialize_index(index).nbytes)
+
+    # Latencia de búsqueda consulta a consulta (el embedding de la pregunta no depende del chunking)
+    latencias = []
+    resultados = []
+    for q in embeddings_consultas:
+        inicio = time.perf_counter()
+        _, I = index.search(q.reshape(1, -1), k)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        resultados.append(I[0])
+
+    normalizados = [' '.join(texto.split()) for texto in textos]
+    aciertos = 0
+    for (filename, oracion), ids in zip(consultas, resultados):
+        inicio_oracion = oracion[:60]
+        aciertos += any(i >= 0 and chunks[i][0] == filename and inicio_oracion in normalizados[i]
+                        for i in ids)
+
+    return {
+        'num_chunks': len(chunks),
+        'palabras_por_chunk': float(np.mean([len(t.split()) for t in textos])),
+        # Como en `PDFAnalyzer.test_chunk_sizes`: chunks que terminan en punto
+        'oraciones_completas': float(np.mean([t.strip().endswith('.') for t in textos])),
+        'tiempo_embedding': tiempo_embedding,
+        'bytes_indice': bytes_indice,
+        'latencia_busqueda_p50_ms': float(np.percentile(latencias, 50)),
+        'latencia_busqueda_p95_ms': float(np.percentile(latencias, 95)),
+        f'hit_rate@{k}': aciertos / len(consultas) if consultas else 0.0
+    }
+
+def barrido(tamanos=None, solapes=SOLAPES, estrategias=('ventanas', 'secciones', 'recursivo'),
+            n_consultas=200, k=5, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """Evalúa cada combinación de estrategia, tamaño y solape y devuelve un DataFrame.
+
+    El texto de las páginas y los embeddings se reutilizan entre configuraciones y entre
+    ejecuciones (`cache_dir`), así que solo se embeben los chunks que no se han visto antes.
+    """
+    from embedding_backends import get_embedding_backend
+
+    tamanos = tamanos or TAMANOS
+    paginas = cargar_paginas(data_dir, cache_dir)
+    cache = EmbeddingCache(get_embedding_backend("torch", MODEL_NAME), MODEL_NAME, cache_dir)
+    consultas = generar_consultas(paginas, n_consultas)
+    embeddings_consultas, _ = cache.encode([oracion for _, oracion in consultas])
+    print(f"🔍 {len(paginas)} documentos, {len(consultas)} consultas de evaluación")
+
+    configuraciones = []
+    for estrategia in estrategias:
+        if estrategia == 'secciones':
+            configuraciones.append((estrategia, None, None))
+        else:
+            configuraciones.extend((estrategia, t, s) for t, s in itertools.product(tamanos[estrategia], solapes))
+
+    filas = []
+    for estrategia, tamano, solape in configuraciones:
+        inicio = time.time()
+        if estrategia == 'ventanas':
+            chunks = chunks_ventanas(paginas, tamano, solape)
+        elif estrategia == 'secciones':
+            chunks = chunks_secciones(paginas)
+        else:
+            chunks = chunks_recursivo(paginas, tamano, solape)
+
+        fila = {'estrategia': estrategia, 'tamano': tamano, 'solape': solape}
+        fila.update(evaluar_configuracion(chunks, cache, consultas, embeddings_consultas, k))
+        filas.append(fila)
+        cache.guardar()
+        print(f"✅ {estrategia} tamaño={tamano} solape={solape}: {fila['num_chunks']} chunks, "
+              f"hit_rate@{k}={fila[f'hit_rate@{k}']:.3f} ({time.time() - inicio:.1f}s)")
+
+    return pd.DataFrame(filas)
+
+def main():
+    estrategias = sys.argv[1:] or ['ventanas', 'secciones', 'recursivo']
+    inicio = time.time()
+    resultados = barrido(estrategias=estrategias)
+    resultados.to_csv("chunk_sweep.csv", index=False)
+    print(f"\n📊 Barrido completado en {time.time() - inicio:.1f}s")
+    print(resultados.sort_values('hit_rate@5', ascending=False).to_string(index=False))
+    print("\n✅ Resultados guardados en 'chunk_sweep.csv'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import re
+import numpy as np
+
+# Fin de oración, punto y coma o viñeta: los IPID usan muchas listas sin punto final
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?;])\s+|\s*[•·●○◦]\s*')
+
+class ContextCompressor:
+    """Comprime el contexto recuperado quedándose con las oraciones más cercanas a la pregunta."""
+
+    def __init__(self, embedding_model, max_tokens=200, min_sentence_chars=20):
+        self.embedding_model = embedding_model
+        self.max_tokens = max_tokens
+        self.min_sentence_chars = min_sentence_chars
+
+    def split_sentences(self, text):
+        """Divide un fragmento en oraciones descartando las demasiado cortas."""
+        return [s.strip() for s in SENTENCE_SPLIT.split(text)
+                if len(s.strip()) >= self.min_sentence_chars]
+
+    def compress(self, question_embedding, chunks, count_tokens=None):
+        """Selecciona las mejores oraciones de `chunks` hasta `max_tokens` y conserva su orden original.
+
+        `count_tokens` debe ser el tokenizador del LLM; si no se indica se aproxima por palabras.
+        """
+        if count_tokens is None:
+            count_tokens = lambda t: int(len(t.split()) * 1.3) + 1
+
+        sentences = []
+        positions = []  # (fragmento, posición dentro del fragmento)
+        for c, chunk in enumerate(chunks):
+            for p, sentence in enumerate(self.split_sentences(chunk)):
+                sentences.append(sentence)
+                positions.append((c, p))
+
+        stats = {
+            'oraciones_totales': len(sentences),
+            'oraciones_seleccionadas': 0,
+            'tokens_originales': count_tokens("\n".join(chunks)),
+            'tokens_comprimidos': 0
+        }
+        if not sentences:
+            contexto = "\n".join(chunks)
+            stats['tokens_comprimidos'] = stats['tokens_originales']
+            return contexto, stats
+
+        # Un solo encode para todas las oraciones y similitud coseno vectorizada
+        embeddings = self.embedding_model.encode(sentences, convert_to_numpy=True,
+                                                 normalize_embeddings=True)
+        q = np.asarray(question_embedding, dtype=np.float32)
+        q = q / (np.linalg.norm(q) + 1e-12)
+        scores = embeddings @ q
+
+        selected = []
+        tokens = 0
+        for i in np.argsort(-scores):
+            n = count_tokens(sentences[i])
+            if tokens + n > self.max_tokens:
+                if selected:
+                    continue
+                # Siempre se conserva al menos la mejor oración
+            selected.append(int(i))
+            tokens += n
+
+        # Reconstruir el contexto en el orden original de los fragmentos
+        selected.sort(key=lambda i: positions[i])
+        grupos = {}
+        for i in selected:
+            grupos.setdefault(positions[i][0], []).append(sentences[i])
+        contexto = "\n".join(" ".join(grupos[c]) for c in sorted(grupos))
+
+        stats['oraciones_seleccionadas'] = len(selected)
+        stats['tokens_comprimidos'] = tokens
+        return contexto, stats
@@ -1,11 +1,13 @@
 import os
+import sys
 import fitz  # PyMuPDF
 import pandas as pd
 from tqdm import tqdm
 import re
 import numpy as np
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import matplotlib.pyplot as plt
+from text_stats import analizar_texto
 from datetime import datetime
 
 class PDFAnalyzer:
@@ -19,38 +21,48 @@ class PDFAnalyzer:
             'antigüedad', 'cargas', 'franquicia', 'cláusulas'
         ]
         
-    def analyze_pdf_structure(self, pdf_path):
-        """Analiza la estructura de un PDF y retorna estadísticas."""
-        doc = fitz.open(pdf_path)
+    def parse_document(self, pdf_path):
+        """Extrae una sola vez el modelo de páginas del PDF: texto, fuentes, bloques e imágenes.
+
+        Todas las estadísticas del modo paralelo se calculan a partir de este modelo en
+        lugar de volver a abrir y extraer el PDF en cada análisis.
+        """
+        pages = []
+        with fitz.open(pdf_path) as doc:
+            for page in doc:
+                # Sin TEXT_PRESERVE_IMAGES el diccionario no decodifica las imágenes; sus
+                # bloques son los mismos que devuelve get_text_blocks()
+                blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]
+                pages.append({
+                    'text': page.get_text(),
+                    'fonts': {span['font'] for block in blocks
+                              for line in block.get("lines", []) for span in line["spans"]},
+                    'text_blocks': len(blocks),
+                    'images': len(page.get_images())
+                })
+        return pages
+
+    def structure_from_pages(self, pages):
+        """Estadísticas de estructura (las de `analyze_pdf_structure`) desde el modelo de páginas."""
         stats = {
-            'num_pages': len(doc),
+            'num_pages': len(pages),
             'chars_per_page': [],
             'words_per_page': [],
             'fonts': set(),
             'text_blocks': [],
             'images': 0
         }
-        
-        for page in doc:
-            text = page.get_text()
-            words = text.split()
-            stats['chars_per_page'].append(len(text))
-            stats['words_per_page'].append(len(words))
-            
-            # Analizar fuentes
-            for block in page.get_text("dict")["blocks"]:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            stats['fonts'].add(span['font'])
-            
-            # Contar bloques de texto
-            stats['text_blocks'].append(len(page.get_text_blocks()))
-            
-            # Contar imágenes
-            stats['images'] += len(page.get_images())
-        
+        for page in pages:
+            stats['chars_per_page'].append(len(page['text']))
+            stats['words_per_page'].append(len(page['text'].split()))
+            stats['fonts'].update(page['fonts'])
+            stats['text_blocks'].append(page['text_blocks'])
+            stats['images'] += page['images']
         return stats
+
+    def analyze_pdf_structure(self, pdf_path):
+        """Analiza la estructura de un PDF y retorna estadísticas."""
+        return self.structure_from_pages(self.parse_document(pdf_path))
     
     def test_chunk_sizes(self, pdf_path, chunk_sizes=[256, 512, 1024]):
         """Prueba diferentes tamaños de chunk y analiza resultados."""
@@ -130,50 +142,43 @@ class PDFAnalyzer:
     def analyze_content_structure(self, pdf_path):
         """Analiza la estructura de contenido del documento."""
         doc = fitz.open(pdf_path)
-        structure = {
-            'paragraphs': [],
-            'avg_paragraph_length': 0,
-            'sentence_lengths': [],
-            'word_frequencies': Counter(),
-            'insurance_terms_freq': Counter(),
-            'total_words': 0
-        }
-        
         text = ""
         for page in doc:
             text += page.get_text()
         
-        # Analizar párrafos
-        paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
-        structure['paragraphs'] = len(paragraphs)
-        structure['avg_paragraph_length'] = np.mean([len(p.split()) for p in paragraphs])
-        
-        # Analizar oraciones
-        sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
-        structure['sentence_lengths'] = [len(s.split()) for s in sentences]
-        
-        # Frecuencia de palabras (excluyendo palabras de 3 o menos letras)
-        words = [w.lower() for w in re.findall(r'\w+', text.lower()) if len(w) > 3]
-        structure['word_frequencies'] = Counter(words)
-        structure['total_words'] = len(words)
-        
-        # Frecuencia de términos de seguros
-        text_lower = text.lower()
-        for term in self.insurance_terms:
-            count = len(re.findall(r'\b' + term + r'\b', text_lower))
-            if count > 0:
-                structure['insurance_terms_freq'][term] = count
-        
-        # Calcular ratio de términos de seguros
-        total_insurance_terms = sum(structure['insurance_terms_freq'].values())
-        structure['insurance_terms_ratio'] = total_insurance_terms / structure['total_words'] if structure['total_words'] > 0 else 0
-        
-        return structure
+        return self.content_from_text(text)
 
-    def visualize_document_structure(self, pdf_path):
-        """Visualiza la estructura del documento."""
-        stats = self.analyze_pdf_structure(pdf_path)
-        content_stats = self.analyze_content_structure(pdf_path)
+    def content_from_text(self, text):
+        """Estadísticas de contenido (las de `analyze_content_structure`) a partir del texto."""
+        stats = analizar_texto(text, self.insurance_terms)
+        return {
+            'paragraphs': len(stats['paragraphs']),
+            'avg_paragraph_length': np.mean(stats['paragraph_lengths']),
+            'sentence_lengths': stats['sentence_lengths'],
+            # Frecuencia de palabras (excluyendo palabras de 3 o menos letras)
+            'word_frequencies': stats['word_frequencies'],
+            'insurance_terms_freq': stats['insurance_terms_freq'],
+            'total_words': stats['total_words'],
+            'insurance_terms_ratio': stats['insurance_terms_ratio']
+        }
+
+    def analyze_document(self, pdf_path):
+        """Estructura y contenido de un documento con una sola extracción del PDF."""
+        pages = self.parse_document(pdf_path)
+        return {
+            'structure': self.structure_from_pages(pages),
+            'content': self.content_from_text("".join(page['text'] for page in pages))
+        }
+
+    def visualize_document_structure(self, pdf_path, stats=None, content_stats=None):
+        """Visualiza la estructura del documento.
+
+        Si se pasan las estadísticas ya calculadas no se vuelve a analizar el PDF.
+        """
+        if stats is None:
+            stats = self.analyze_pdf_structure(pdf_path)
+        if content_stats is None:
+            content_stats = self.analyze_content_structure(pdf_path)
         
         # Crear visualizaciones
         fig = plt.figure(figsize=(15, 15))
@@ -222,77 +227,157 @@ class PDFAnalyzer:
         plt.tight_layout()
         return plt
 
+    def build_tables(self, all_stats):
+        """Tablas del análisis (una por hoja del Excel) como DataFrames."""
+        # Hoja 1: Información general de documentos
+        docs_info = []
+        for doc_name, stats in all_stats.items():
+            doc_info = {
+                'Documento': doc_name,
+                'Fecha_Análisis': datetime.now().strftime('%Y-%m-%d'),
+                'Número_Páginas': stats['structure']['num_pages'],
+                'Total_Imágenes': stats['structure']['images'],
+                'Promedio_Palabras_Por_Página': np.mean(stats['structure']['words_per_page']),
+                'Total_Párrafos': stats['content']['paragraphs'],
+                'Promedio_Palabras_Por_Párrafo': stats['content']['avg_paragraph_length'],
+                'Ratio_Términos_Seguros': stats['content']['insurance_terms_ratio']
+            }
+            docs_info.append(doc_info)
+
+        # Hoja 2: Palabras por página
+        words_per_page = []
+        for doc_name, stats in all_stats.items():
+            for page_num, word_count in enumerate(stats['structure']['words_per_page'], 1):
+                words_per_page.append({
+                    'Documento': doc_name,
+                    'Número_Página': page_num,
+                    'Cantidad_Palabras': word_count
+                })
+
+        # Hoja 3: Términos de seguros
+        insurance_terms = []
+        for doc_name, stats in all_stats.items():
+            for term, freq in stats['content']['insurance_terms_freq'].items():
+                insurance_terms.append({
+                    'Documento': doc_name,
+                    'Término': term,
+                    'Frecuencia': freq
+                })
+
+        # Hoja 4: Palabras más frecuentes
+        frequent_words = []
+        for doc_name, stats in all_stats.items():
+            for word, count in stats['content']['word_frequencies'].most_common(50):  # Top 50
+                frequent_words.append({
+                    'Documento': doc_name,
+                    'Palabra': word,
+                    'Frecuencia': count
+                })
+
+        # Hoja 5: Longitud de oraciones
+        sentence_lengths = []
+        for doc_name, stats in all_stats.items():
+            for length in stats['content']['sentence_lengths']:
+                sentence_lengths.append({
+                    'Documento': doc_name,
+                    'Longitud_Oración': length
+                })
+
+        return {
+            'Información_General': pd.DataFrame(docs_info),
+            'Palabras_Por_Página': pd.DataFrame(words_per_page),
+            'Términos_Seguros': pd.DataFrame(insurance_terms),
+            'Palabras_Frecuentes': pd.DataFrame(frequent_words),
+            'Longitud_Oraciones': pd.DataFrame(sentence_lengths)
+        }
+
     def export_to_excel(self, all_stats, output_file="analisis_pdfs.xlsx"):
         """Exporta todos los datos del análisis a un archivo Excel para Power BI."""
         with pd.ExcelWriter(output_file, engine='xlsxwriter') as writer:
-            # Hoja 1: Información general de documentos
-            docs_info = []
-            for doc_name, stats in all_stats.items():
-                doc_info = {
-                    'Documento': doc_name,
-                    'Fecha_Análisis': datetime.now().strftime('%Y-%m-%d'),
-                    'Número_Páginas': stats['structure']['num_pages'],
-                    'Total_Imágenes': stats['structure']['images'],
-                    'Promedio_Palabras_Por_Página': np.mean(stats['structure']['words_per_page']),
-                    'Total_Párrafos': stats['content']['paragraphs'],
-                    'Promedio_Palabras_Por_Párrafo': stats['content']['avg_paragraph_length'],
-                    'Ratio_Términos_Seguros': stats['content']['insurance_terms_ratio']
-                }
-                docs_info.append(doc_info)
-            
-            df_docs = pd.DataFrame(docs_info)
-            df_docs.to_excel(writer, sheet_name='Información_General', index=False)
+            for sheet_name, df in self.build_tables(all_stats).items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
 
-            # Hoja 2: Palabras por página
-            words_per_page = []
-            for doc_name, stats in all_stats.items():
-                for page_num, word_count in enumerate(stats['structure']['words_per_page'], 1):
-                    words_per_page.append({
-                        'Documento': doc_name,
-                        'Número_Página': page_num,
-                        'Cantidad_Palabras': word_count
-                    })
-            
-            df_words = pd.DataFrame(words_per_page)
-            df_words.to_excel(writer, sheet_name='Palabras_Por_Página', index=False)
+    def export_tables(self, all_stats, output_dir="analisis_pdfs", formato="parquet"):
+        """Exporta cada tabla a un archivo Parquet (o CSV); mucho más rápido que el Excel.
 
-            # Hoja 3: Términos de seguros
-            insurance_terms = []
-            for doc_name, stats in all_stats.items():
-                for term, freq in stats['content']['insurance_terms_freq'].items():
-                    insurance_terms.append({
-                        'Documento': doc_name,
-                        'Término': term,
-                        'Frecuencia': freq
-                    })
-            
-            df_terms = pd.DataFrame(insurance_terms)
-            df_terms.to_excel(writer, sheet_name='Términos_Seguros', index=False)
+        Power BI lee ambos formatos. Si pyarrow no está instalado se usa CSV.
+        """
+        if formato == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                print("⚠️ pyarrow no está instalado; se exporta en CSV")
+                formato = "csv"
 
-            # Hoja 4: Palabras más frecuentes
-            frequent_words = []
-            for doc_name, stats in all_stats.items():
-                for word, count in stats['content']['word_frequencies'].most_common(50):  # Top 50
-                    frequent_words.append({
-                        'Documento': doc_name,
-                        'Palabra': word,
-                        'Frecuencia': count
-                    })
-            
-            df_words_freq = pd.DataFrame(frequent_words)
-            df_words_freq.to_excel(writer, sheet_name='Palabras_Frecuentes', index=False)
+        os.makedirs(output_dir, exist_ok=True)
+        for name, df in self.build_tables(all_stats).items():
+            path = os.path.join(output_dir, f"{name}.{formato}")
+            if formato == "parquet":
+                df.to_parquet(path, index=False)
+            else:
+                df.to_csv(path, index=False, encoding='utf-8-sig')  # BOM para Excel/Power BI
+        return formato
 
-            # Hoja 5: Longitud de oraciones
-            sentence_lengths = []
-            for doc_name, stats in all_stats.items():
-                for length in stats['content']['sentence_lengths']:
-                    sentence_lengths.append({
-                        'Documento': doc_name,
-                        'Longitud_Oración': length
-                    })
-            
-            df_sentences = pd.DataFrame(sentence_lengths)
-            df_sentences.to_excel(writer, sheet_name='Longitud_Oraciones', index=False)
+    def analyze_corpus(self, workers=None, graficos=True, dpi=300):
+        """Analiza todos los PDFs en paralelo: un proceso por documento y una extracción por PDF.
+
+        Cada proceso calcula las estadísticas y genera el gráfico de su documento; el
+        análisis del corpus escala con el número de núcleos.
+        """
+        workers = workers or os.cpu_count()
+        all_stats = {}
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = {
+                executor.submit(_analizar_documento, self.data_dir, pdf_file, graficos, dpi): pdf_file
+                for pdf_file in self.pdf_files
+            }
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Analizando PDFs"):
+                pdf_file = futures[future]
+                try:
+                    all_stats[pdf_file] = future.result()
+                except Exception as e:
+                    print(f"❌ Error analizando {pdf_file}: {str(e)}")
+        # Mismo orden que el análisis secuencial
+        return {pdf_file: all_stats[pdf_file] for pdf_file in self.pdf_files if pdf_file in all_stats}
+
+def _init_worker():
+    # Backend sin ventana: los procesos solo guardan imágenes
+    plt.switch_backend("Agg")
+
+def _analizar_documento(data_dir, pdf_file, graficos=True, dpi=300):
+    """Tarea de un proceso del pool: análisis completo (y gráfico) de un documento."""
+    analyzer = PDFAnalyzer(data_dir)
+    pdf_path = os.path.join(data_dir, pdf_file)
+    stats = analyzer.analyze_document(pdf_path)
+    if graficos:
+        figura = analyzer.visualize_document_structure(pdf_path, stats['structure'], stats['content'])
+        figura.savefig(f"analysis_{pdf_file}.png", bbox_inches='tight', dpi=dpi)
+        figura.close()
+    return stats
+
+def main_paralelo(excel=False):
+    """Análisis del corpus en paralelo con exportación a Parquet/CSV (y Excel opcional)."""
+    analyzer = PDFAnalyzer()
+    
+    if not analyzer.pdf_files:
+        print("❌ No se encontraron archivos PDF en el directorio preparsed_data/")
+        return
+    
+    print(f"🔍 Analizando {len(analyzer.pdf_files)} PDFs en {os.cpu_count()} procesos...")
+    all_stats = analyzer.analyze_corpus()
+    
+    for pdf_file, stats in all_stats.items():
+        print(f"📄 {pdf_file}: {stats['structure']['num_pages']} páginas, "
+              f"ratio de términos de seguros {stats['content']['insurance_terms_ratio']:.4f}")
+    
+    formato = analyzer.export_tables(all_stats)
+    print(f"\n✅ Tablas exportadas en formato {formato} a 'analisis_pdfs/'")
+    if excel:
+        try:
+            analyzer.export_to_excel(all_stats)
+            print("✅ Datos exportados a 'analisis_pdfs.xlsx'")
+        except Exception as e:
+            print(f"❌ Error exportando a Excel: {str(e)}")
 
 def main():
     analyzer = PDFAnalyzer()
@@ -348,4 +433,8 @@ def main():
         print(f"❌ Error exportando a Excel: {str(e)}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    # --paralelo: una extracción por PDF, documentos en un pool de procesos y salida Parquet/CSV
+    if "--paralelo" in sys.argv:
+        main_paralelo(excel="--excel" in sys.argv)
+    else:
+        main() 
\ No newline at end of file
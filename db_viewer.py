@@ -1,83 +1,135 @@
 import streamlit as st
 import numpy as np
-import faiss
 import os
+from index_versions import ruta_indice
+from index_bundle import IndexBundle, BUNDLE_FILE
+from index_registry import RegistroIndices, productos_disponibles
+from memory_profile import perfil_memoria
 
-def cargar_datos():
-    """Carga los datos de la base vectorial."""
-    try:
-        ids = np.load('vector_ids.npy')
-        texts = np.load('vector_texts.npy')
-        index = faiss.read_index('vector_index.faiss')
-        return ids, texts, index
-    except Exception as e:
-        st.error(f"❌ Error cargando los datos: {str(e)}")
-        return None, None, None
+# faiss y sentence_transformers se importan solo al usar la búsqueda por similitud:
+# el modo de paginación únicamente necesita los IDs y los textos.
 
-def main():
-    st.title("📚 Visor de Base de Datos Vectorial")
-    
-    # Cargar datos
-    ids, texts, index = cargar_datos()
-    if ids is None:
-        st.error("No se pudieron cargar los datos. Verifica que existan los archivos vector_ids.npy, vector_texts.npy y vector_index.faiss")
-        return
-    
+# Backend de embeddings: "torch" (por defecto) u "onnx" (int8 en onnxruntime)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+
+@st.cache_resource
+def cargar_datos(ruta):
+    """Carga los IDs y textos de la base vectorial (sin el índice FAISS).
+
+    Los errores se propagan: un resultado fallido no queda en la caché y se reintenta
+    en la siguiente ejecución.
+    """
+    if os.path.exists(os.path.join(ruta, BUNDLE_FILE)):
+        bundle = IndexBundle(os.path.join(ruta, BUNDLE_FILE))
+        return bundle.ids, bundle.texts
+    ids = np.load(os.path.join(ruta, 'vector_ids.npy'), mmap_mode='r')
+    texts = np.load(os.path.join(ruta, 'vector_texts.npy'), mmap_mode='r')
+    return ids, texts
+
+@st.cache_resource
+def cargar_indice(ruta):
+    """Carga el índice FAISS (único o en shards) la primera vez que se necesita."""
+    from index_versions import VersionIndice
+    return VersionIndice(ruta).index
+
+@st.cache_resource
+def cargar_registro():
+    """Registro de índices por producto: se cargan al consultarlos y se desalojan por LRU."""
+    perfil = perfil_memoria()
+    return RegistroIndices(presupuesto_mb=perfil['presupuesto_indices_mb'], mmap=perfil['mmap_indice'])
+
+@st.cache_resource
+def cargar_modelo():
+    """Carga el modelo de embeddings la primera vez que se necesita."""
+    from embedding_backends import get_embedding_backend
+    return get_embedding_backend(EMBEDDING_BACKEND, "all-MiniLM-L6-v2")
+
+def mostrar(ids, texts, obtener_indice):
+    """Paginación de los fragmentos o búsqueda por similitud sobre `obtener_indice()`."""
     st.write(f"Total de fragmentos en la base de datos: {len(ids)}")
-    
+
     # Selector de modo de visualización
     modo = st.radio(
         "Selecciona modo de visualización:",
         ["Ver todos los fragmentos", "Buscar por similitud"]
     )
-    
+
     if modo == "Ver todos los fragmentos":
         # Mostrar todos los fragmentos con paginación
         fragmentos_por_pagina = 25
         total_paginas = len(ids) // fragmentos_por_pagina + (1 if len(ids) % fragmentos_por_pagina > 0 else 0)
-        
+
         pagina = st.number_input(
             "Página",
             min_value=1,
             max_value=total_paginas,
             value=1
         )
-        
+
         inicio = (pagina - 1) * fragmentos_por_pagina
         fin = min(inicio + fragmentos_por_pagina, len(ids))
-        
+
         for i in range(inicio, fin):
             with st.expander(f"📄 {ids[i]}"):
                 st.write(texts[i])
-                
+
         st.write(f"Página {pagina} de {total_paginas}")
-        
+
     else:
         # Búsqueda por similitud
-        from sentence_transformers import SentenceTransformer
-        
         query = st.text_input("🔍 Ingresa tu búsqueda:")
         num_resultados = st.slider("Número de resultados", 1, 10, 3)
-        
+
         if query and st.button("Buscar"):
             try:
-                # Cargar modelo de embeddings
-                model = SentenceTransformer("all-MiniLM-L6-v2")
-                
+                # Cargar índice y modelo de embeddings (solo la primera vez)
+                with st.spinner("🔄 Cargando modelo e índice..."):
+                    index = obtener_indice()
+                    model = cargar_modelo()
+
                 # Generar embedding de la consulta
                 query_embedding = model.encode([query])[0]
-                
+
                 # Buscar documentos similares
                 D, I = index.search(query_embedding.reshape(1, -1), num_resultados)
-                
+
                 # Mostrar resultados
                 st.write("### 📊 Resultados más similares:")
                 for i, (idx, dist) in enumerate(zip(I[0], D[0])):
                     with st.expander(f"🔍 Resultado {i+1} - {ids[idx]} (Distancia: {dist:.2f})"):
                         st.write(texts[idx])
-                        
+
             except Exception as e:
                 st.error(f"❌ Error en la búsqueda: {str(e)}")
 
+def main():
+    st.title("📚 Visor de Base de Datos Vectorial")
+
+    # Índice general o el de una línea de producto (cargado bajo demanda por el registro)
+    productos = productos_disponibles()
+    producto = st.selectbox("Índice", ["General"] + productos) if productos else "General"
+
+    if producto != "General":
+        registro = cargar_registro()
+        try:
+            with registro.adquirir(producto) as version:
+                mostrar(version.ids, version.texts, lambda: version.index)
+        except Exception as e:
+            st.error(f"❌ Error cargando el índice de {producto}: {str(e)}")
+        with st.expander("🗂️ Registro de índices"):
+            st.json(registro.estadisticas())
+        return
+
+    # Cargar datos de la versión publicada del índice
+    ruta = ruta_indice()
+    try:
+        ids, texts = cargar_datos(ruta)
+    except Exception as e:
+        st.error(f"❌ Error cargando los datos: {str(e)}")
+        st.error("No se pudieron cargar los datos. Verifica que exista el índice (index.bundle o vector_ids.npy, vector_texts.npy y vector_index.faiss)")
+        return
+
+    mostrar(ids, texts, lambda: cargar_indice(ruta))
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,164 @@
+import re
+import zlib
+import hashlib
+from collections import defaultdict
+import numpy as np
+
+# Mayor primo < 2^32: con a < 2^31 y hashes de 32 bits, a * x + b cabe en uint64
+PRIME = 4294967291
+MAX_HASH = (1 << 32) - 1
+
+def shingles(texto, n=5):
+    """Conjunto de n-gramas de palabras del texto normalizado (minúsculas, sin puntuación)."""
+    palabras = re.findall(r'\w+', texto.lower())
+    if len(palabras) < n:
+        return {' '.join(palabras)} if palabras else set()
+    return {' '.join(palabras[i:i + n]) for i in range(len(palabras) - n + 1)}
+
+class MinHashDeduplicator:
+    """Detecta fragmentos casi duplicados con MinHash + LSH por bandas.
+
+    Cada fragmento se resume en `num_perm` mínimos de permutaciones aleatorias de sus
+    shingles; los que coinciden en alguna banda de `filas` valores son candidatos, y se
+    consideran duplicados si su similitud de Jaccard estimada alcanza `umbral`.
+    """
+
+    def __init__(self, umbral=0.9, num_perm=128, bandas=16, n_shingle=5, semilla=1):
+        if num_perm % bandas:
+            raise ValueError("num_perm debe ser múltiplo de bandas")
+        self.umbral = umbral
+        self.num_perm = num_perm
+        self.bandas = bandas
+        self.filas = num_perm // bandas
+        self.n_shingle = n_shingle
+        rng = np.random.default_rng(semilla)
+        # Permutaciones aleatorias (a * x + b) mod p de los hashes de los shingles
+        self._a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, PRIME, num_perm, dtype=np.uint64)
+
+    def firma(self, texto):
+        """Firma MinHash (uint64 de longitud `num_perm`) de un fragmento."""
+        hashes = np.array([zlib.crc32(s.encode('utf-8')) for s in shingles(texto, self.n_shingle)],
+                          dtype=np.uint64)
+        if not len(hashes):
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        return ((np.outer(hashes, self._a) + self._b) % PRIME).min(axis=0)
+
+    def agrupar(self, textos):
+        """Devuelve, para cada fragmento, la posición de su representante canónico.
+
+        El representante es la primera aparición del grupo, así el orden del corpus se
+        conserva. Los textos idénticos se agrupan sin calcular firmas.
+        """
+        padre = list(range(len(textos)))
+
+        def raiz(i):
+            while padre[i] != i:
+                padre[i] = padre[padre[i]]
+                i = padre[i]
+            return i
+
+        def unir(i, j):
+            ri, rj = raiz(i), raiz(j)
+            if ri != rj:
+                padre[max(ri, rj)] = min(ri, rj)
+
+        # Duplicados exactos (texto normalizado)
+        vistos = {}
+        unicos = []
+        for i, texto in enumerate(textos):
+            clave = ' '.join(texto.split()).lower()
+            if clave in vistos:
+                unir(vistos[clave], i)
+            else:
+                vistos[clave] = i
+                unicos.append(i)
+
+        # Casi duplicados: candidatos por LSH y verificación con la similitud estimada
+        firmas = np.stack([self.firma(textos[i]) for i in unicos]) if unicos else np.empty((0, self.num_perm))
+        cubetas = defaultdict(list)
+        for fila, i in enumerate(unicos):
+            for banda in range(self.bandas):
+                clave = (banda, firmas[fila, banda * self.filas:(banda + 1) * self.filas].tobytes())
+                cubetas[clave].append(fila)
+
+        comparados = set()
+        for miembros in cubetas.values():
+            for x in range(len(miembros)):
+                for y in range(x + 1, len(miembros)):
+                    par = (miembros[x], miembros[y])
+                    if par in comparados:
+                        continue
+                    comparados.add(par)
+                    if np.mean(firmas[par[0]] == firmas[par[1]]) >= self.umbral:
+                        unir(unicos[par[0]], unicos[par[1]])
+
+        return [raiz(i) for i in range(len(textos))]
+
+class DeduplicadorIncremental:
+    """Deduplicación en streaming: cada fragmento se compara al llegar con los canónicos previos.
+
+    Usa las mismas firmas y bandas que `MinHashDeduplicator`, pero sin ver el corpus
+    completo: la memoria crece con los fragmentos únicos (clave de 16 bytes y firma por
+    canónico), no con el texto leído. A diferencia de `agrupar`, un fragmento solo se une
+    a un canónico al que se parece directamente (no hay uniones transitivas).
+    """
+
+    def __init__(self, umbral=0.9, **kwargs):
+        self.minhash = MinHashDeduplicator(umbral=umbral, **kwargs)
+        self._exactos = {}
+        self._cubetas = defaultdict(list)
+        self._firmas = []
+        self.fuentes = []  # IDs de todos los fragmentos que representa cada canónico
+        self.total = 0
+
+    def anadir(self, texto, split_id):
+        """True si el fragmento es nuevo (se conserva); False si duplica a uno anterior."""
+        self.total += 1
+        clave = hashlib.blake2b(' '.join(texto.split()).lower().encode('utf-8'), digest_size=16).digest()
+        if clave in self._exactos:
+            self.fuentes[self._exactos[clave]].append(split_id)
+            return False
+
+        minhash = self.minhash
+        firma = minhash.firma(texto)
+        claves = [(banda, firma[banda * minhash.filas:(banda + 1) * minhash.filas].tobytes())
+                  for banda in range(minhash.bandas)]
+        for candidato in dict.fromkeys(c for k in claves for c in self._cubetas.get(k, ())):
+            if np.mean(self._firmas[candidato] == firma) >= minhash.umbral:
+                self.fuentes[candidato].append(split_id)
+                return False
+
+        posicion = len(self.fuentes)
+        self._exactos[clave] = posicion
+        self._firmas.append(firma)
+        self.fuentes.append([split_id])
+        for k in claves:
+            self._cubetas[k].append(posicion)
+        return True
+
+    def resumen(self):
+        unicos = len(self.fuentes)
+        reduccion = 1 - unicos / self.total if self.total else 0.0
+        print(f"🧹 Deduplicación: {self.total} -> {unicos} fragmentos "
+              f"({reduccion:.1%} menos, {sum(len(f) > 1 for f in self.fuentes)} compartidos entre varias fuentes)")
+
+def deduplicar(split_texts, split_ids, umbral=0.9):
+    """Elimina fragmentos duplicados o casi duplicados entre documentos.
+
+    Devuelve los textos e IDs canónicos, para cada uno la lista de IDs de todos los
+    fragmentos que representa (el propio incluido) y sus posiciones en la entrada.
+    """
+    canonicos = MinHashDeduplicator(umbral=umbral).agrupar(split_texts)
+
+    fuentes = defaultdict(list)
+    for i, canonico in enumerate(canonicos):
+        fuentes[canonico].append(split_ids[i])
+
+    posiciones = sorted(fuentes)
+    textos = [split_texts[i] for i in posiciones]
+    ids = [split_ids[i] for i in posiciones]
+    reduccion = 1 - len(posiciones) / len(split_texts) if split_texts else 0.0
+    print(f"🧹 Deduplicación: {len(split_texts)} -> {len(posiciones)} fragmentos "
+          f"({reduccion:.1%} menos, {sum(len(f) > 1 for f in fuentes.values())} compartidos entre varias fuentes)")
+    return textos, ids, [fuentes[i] for i in posiciones], posiciones
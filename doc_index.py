@@ -0,0 +1,147 @@
+import os
+import re
+import json
+import numpy as np
+
+DOC_INDEX_FILE = "documentos.npz"
+METADATA_DIR = "metadata"
+METADATA_FILE = "documentos_metadata.json"
+
+def cargar_resumenes(metadata_dir=METADATA_DIR):
+    """{nombre del documento: descripción resumida} de los archivos `metadata/metadata_*.txt`."""
+    resumenes = {}
+    if not os.path.isdir(metadata_dir):
+        return resumenes
+    for archivo in sorted(os.listdir(metadata_dir)):
+        if not (archivo.startswith("metadata_") and archivo.endswith(".txt")):
+            continue
+        with open(os.path.join(metadata_dir, archivo), 'r', encoding='utf-8') as f:
+            contenido = f.read()
+        nombre = re.search(r'Nombre del documento:\s*(.+)', contenido)
+        resumen = re.search(r'Descripción resumida:\s*(.+)', contenido, re.S)
+        if nombre and resumen:
+            resumenes[nombre.group(1).strip()] = ' '.join(resumen.group(1).split())
+    return resumenes
+
+def cargar_metadatos():
+    """Metadatos por documento: el store SQLite si existe, si no el JSON."""
+    from metadata_store import MetadataStore, METADATA_STORE
+    if os.path.exists(METADATA_STORE):
+        return MetadataStore(METADATA_STORE)
+    if os.path.exists(METADATA_FILE):
+        with open(METADATA_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def texto_documento(nombre, metadata=None, resumen=None):
+    """Representación textual de un documento: nombre, título, palabras clave, secciones y resumen."""
+    partes = [re.sub(r'[_\-.()]+', ' ', os.path.splitext(nombre)[0])]
+    if metadata:
+        titulo = metadata.get('document_info', {}).get('title', '').strip()
+        if titulo:
+            partes.append(titulo)
+        content_summary = metadata.get('content_summary', {})
+        partes.append(', '.join(content_summary.get('keywords', [])))
+        partes.append('. '.join(' '.join(s.split()) for s in content_summary.get('main_sections', [])))
+    if resumen:
+        partes.append(resumen)
+    return '. '.join(p for p in partes if p)
+
+def construir_indice_documentos(directorio, procedencia, vectores, model, fuentes=None,
+                                metadatos=None, resumenes=None):
+    """Escribe `documentos.npz` en la versión del índice: un vector por documento y sus particiones.
+
+    El vector de cada documento es el embedding de su texto resumen (metadatos y
+    descripción resumida); si no tiene, el centroide de sus fragmentos. Cada partición
+    lista las filas del índice de un documento, incluidos los fragmentos compartidos con
+    otros documentos por la deduplicación (`fuentes`).
+    """
+    metadatos = cargar_metadatos() if metadatos is None else metadatos
+    resumenes = cargar_resumenes() if resumenes is None else resumenes
+    documentos = procedencia.documentos
+    posicion = {doc: i for i, doc in enumerate(documentos)}
+
+    # Particiones en formato CSR: filas[offsets[d]:offsets[d + 1]] son las del documento d
+    miembros = [[] for _ in documentos]
+    for fila, doc_id in enumerate(procedencia.doc_id):
+        docs = {int(doc_id)}
+        if fuentes is not None:
+            docs.update(posicion[f.split(" | ")[0]] for f in fuentes[fila] if f.split(" | ")[0] in posicion)
+        for d in docs:
+            miembros[d].append(fila)
+    offsets = np.zeros(len(documentos) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(m) for m in miembros])
+    filas = np.array([fila for m in miembros for fila in m], dtype=np.int64)
+
+    textos = {doc: texto_documento(doc, metadatos.get(doc), resumenes.get(doc)) for doc in documentos}
+    con_resumen = [doc for doc in documentos if metadatos.get(doc) or resumenes.get(doc)]
+    vectores_doc = np.zeros((len(documentos), vectores.shape[1]), dtype=np.float32)
+    if con_resumen:
+        vectores_doc[[posicion[d] for d in con_resumen]] = model.encode(
+            [textos[d] for d in con_resumen], convert_to_numpy=True)
+    for doc in documentos:
+        if doc not in con_resumen:
+            d = posicion[doc]
+            fragmentos = np.asarray(vectores[filas[offsets[d]:offsets[d + 1]]], dtype=np.float32)
+            centroide = fragmentos.mean(axis=0)
+            # La media de vectores normalizados queda más corta que ellos y, en L2, más lejos
+            # de cualquier pregunta: se reescala a la norma media de sus fragmentos
+            norma = np.linalg.norm(centroide)
+            if norma > 0:
+                centroide *= np.linalg.norm(fragmentos, axis=1).mean() / norma
+            vectores_doc[d] = centroide
+
+    np.savez(os.path.join(directorio, DOC_INDEX_FILE), documentos=np.array(documentos),
+             vectores=vectores_doc, offsets=offsets, filas=filas)
+    print(f"✅ Índice de documentos: {len(documentos)} documentos "
+          f"({len(con_resumen)} con resumen, {len(documentos) - len(con_resumen)} con centroide)")
+
+class IndiceDocumentos:
+    """Búsqueda en dos etapas: documentos por su resumen y después fragmentos de esos documentos.
+
+    La búsqueda fina solo lee las filas de las particiones candidatas, así su coste
+    depende del tamaño de esos documentos y no del corpus. Si la elección de documentos
+    es dudosa (los `docs_k` primeros no acumulan `confianza_minima` del peso), se devuelve
+    None para que quien llama haga la búsqueda global.
+    """
+
+    def __init__(self, path, bundle, docs_k=3, confianza_minima=0.6, temperatura=0.1):
+        datos = np.load(path)
+        self.documentos = datos['documentos'].tolist()
+        self.vectores = datos['vectores']
+        self.offsets = datos['offsets']
+        self.filas = datos['filas']
+        self.bundle = bundle
+        self.docs_k = docs_k
+        self.confianza_minima = confianza_minima
+        self.temperatura = temperatura
+        self._normas = np.einsum('ij,ij->i', self.vectores, self.vectores)
+
+    def elegir_documentos(self, consulta):
+        """Posiciones de los `docs_k` documentos más cercanos y la confianza de la elección."""
+        distancias = self._normas + consulta @ consulta - 2 * self.vectores @ consulta
+        orden = np.argsort(distancias)
+        pesos = np.exp(-(distancias[orden] - distancias[orden[0]]) / self.temperatura)
+        confianza = float(pesos[:self.docs_k].sum() / pesos.sum())
+        return orden[:self.docs_k], confianza
+
+    def search(self, consulta, k):
+        """(D, I, documentos elegidos) de 1 x k sobre las particiones candidatas, o None si hay poca confianza."""
+        consulta = np.asarray(consulta, dtype=np.float32).reshape(-1)
+        documentos, confianza = self.elegir_documentos(consulta)
+        if confianza < self.confianza_minima:
+            return None
+
+        filas = np.unique(np.concatenate([self.filas[self.offsets[d]:self.offsets[d + 1]] for d in documentos]))
+        D = np.full((1, k), np.inf, dtype=np.float32)
+        I = np.full((1, k), -1, dtype=np.int64)
+        if not len(filas):
+            return D, I, [self.documentos[d] for d in documentos]
+
+        distancias = self.bundle.norms[filas] + consulta @ consulta - 2 * (self.bundle.vectors[filas] @ consulta)
+        k_real = min(k, len(filas))
+        top = np.argpartition(distancias, k_real - 1)[:k_real] if k_real < len(filas) else np.arange(len(filas))
+        top = top[np.argsort(distancias[top], kind='stable')]
+        D[0, :k_real] = np.maximum(distancias[top], 0)
+        I[0, :k_real] = filas[top]
+        return D, I, [self.documentos[d] for d in documentos]
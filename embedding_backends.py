@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import numpy as np
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+class OnnxEmbeddingBackend:
+    """Sentence embeddings con un modelo exportado a ONNX (cuantizado a int8) y onnxruntime en CPU.
+
+    Expone el mismo `encode` que SentenceTransformer para poder sustituirlo sin cambiar a
+    quien lo llama.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL, model_dir="onnx_models", quantize=True, threads=None):
+        self.model_name = model_name
+        self.model_dir = os.path.join(model_dir, model_name.replace("/", "__"))
+        self.quantize = quantize
+        self.threads = threads
+        self._session = None
+        self._tokenizer = None
+        self.config = None
+
+    @property
+    def model_path(self):
+        return os.path.join(self.model_dir, "model.int8.onnx" if self.quantize else "model.onnx")
+
+    def export(self):
+        """Exporta el transformer a ONNX con ejes dinámicos y aplica cuantización dinámica int8."""
+        import torch
+        from sentence_transformers import SentenceTransformer
+        from sentence_transformers.models import Normalize
+
+        os.makedirs(self.model_dir, exist_ok=True)
+        st_model = SentenceTransformer(self.model_name, device="cpu")
+        transformer = st_model[0].auto_model.eval()
+        tokenizer = st_model.tokenizer
+
+        ejemplo = tokenizer(["ejemplo de exportación"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in ejemplo]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        fp32_path = os.path.join(self.model_dir, "model.onnx")
+        with torch.no_grad():
+            torch.onnx.export(
+                transformer,
+                tuple(ejemplo[name] for name in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14
+            )
+
+        if self.quantize:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(fp32_path, self.model_path, weight_type=QuantType.QInt8)
+
+        tokenizer.save_pretrained(self.model_dir)
+        config = {
+            'model_name': self.model_name,
+            'input_names': input_names,
+            'max_seq_length': st_model.max_seq_length,
+            'normalize': any(isinstance(module, Normalize) for module in st_model),
+            'dimension': st_model.get_sentence_embedding_dimension()
+        }
+        with open(os.path.join(self.model_dir, "config_backend.json"), 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2)
+        print(f"✅ Modelo exportado a {self.model_path}")
+
+    def load(self):
+        """Carga la sesión de onnxruntime, exportando el modelo si todavía no existe."""
+        if self._session is not None:
+            return
+        if not os.path.exists(self.model_path):
+            print(f"🔄 Exportando {self.model_name} a ONNX...")
+            self.export()
+
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(self.model_dir, "config_backend.json"), 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        options = ort.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        self._session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+
+    def get_sentence_embedding_dimension(self):
+        self.load()
+        return self.config['dimension']
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False,
+               show_progress_bar=False):
+        """Genera embeddings con mean pooling, igual que el modelo de sentence-transformers."""
+        self.load()
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        # Ordenar por longitud reduce el padding dentro de cada lote
+        order = np.argsort([-len(s) for s in sentences], kind='stable')
+        embeddings = np.empty((len(sentences), self.config['dimension']), dtype=np.float32)
+
+        for start in range(0, len(sentences), batch_size):
+            batch_idx = order[start:start + batch_size]
+            encoded = self._tokenizer(
+                [sentences[i] for i in batch_idx],
+                padding=True,
+                truncation=True,
+                max_length=self.config['max_seq_length'],
+                return_tensors="np"
+            )
+            inputs = {name: encoded[name].astype(np.int64) for name in self.config['input_names']}
+            hidden = self._session.run(None, inputs)[0]
+
+            mask = inputs['attention_mask'][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            embeddings[batch_idx] = pooled
+
+        if self.config['normalize'] or normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+
+        return embeddings[0] if single else embeddings
+
+def get_embedding_backend(backend="torch", model_name=DEFAULT_MODEL, **kwargs):
+    """Devuelve un modelo de embeddings con la interfaz `encode` de SentenceTransformer.
+
+    - "torch": SentenceTransformer en PyTorch (precisión completa).
+    - "onnx": modelo exportado a ONNX y cuantizado a int8 para onnxruntime.
+    """
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend == "onnx":
+        return OnnxEmbeddingBackend(model_name, **kwargs)
+    raise ValueError(f"Backend de embeddings desconocido: {backend}")
+
+def check_parity(reference, candidate, queries, corpus_embeddings, k=5):
+    """Compara dos backends: acuerdo coseno en las consultas y recall@k sobre el corpus indexado.
+
+    `corpus_embeddings` son los vectores del índice (generados con el backend de referencia);
+    el recall@k mide cuántos de los k vecinos obtenidos con la referencia recupera el candidato.
+    """
+    ref = np.asarray(reference.encode(queries, convert_to_numpy=True), dtype=np.float32)
+    cand = np.asarray(candidate.encode(queries, convert_to_numpy=True), dtype=np.float32)
+
+    ref_n = ref / np.linalg.norm(ref, axis=1, keepdims=True)
+    cand_n = cand / np.linalg.norm(cand, axis=1, keepdims=True)
+    cosines = (ref_n * cand_n).sum(axis=1)
+
+    corpus = np.asarray(corpus_embeddings, dtype=np.float32)
+    corpus_sq = (corpus ** 2).sum(axis=1)
+
+    def top_k(q):
+        # Distancia L2 al cuadrado, igual que IndexFlatL2
+        dist = corpus_sq[None, :] - 2 * q @ corpus.T
+        return np.argpartition(dist, min(k, len(corpus) - 1), axis=1)[:, :k]
+
+    ref_top, cand_top = top_k(ref), top_k(cand)
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)])
+
+    return {
+        'cosine_mean': float(cosines.mean()),
+        'cosine_min': float(cosines.min()),
+        f'recall@{k}': float(recall)
+    }
+
+def main():
+    import faiss
+    from benchmarks import generar_consultas
+
+    # Exportar el modelo y comprobar la paridad con PyTorch sobre el índice actual
+    torch_model = get_embedding_backend("torch")
+    onnx_model = get_embedding_backend("onnx")
+
+    index = faiss.read_index("vector_index.faiss")
+    corpus_embeddings = index.reconstruct_n(0, index.ntotal)
+    consultas = generar_consultas(200)
+
+    inicio = time.time()
+    paridad = check_parity(torch_model, onnx_model, consultas, corpus_embeddings, k=5)
+    print(f"\n📊 Paridad ONNX int8 vs PyTorch ({len(consultas)} consultas, {time.time() - inicio:.1f}s):")
+    for clave, valor in paridad.items():
+        print(f"- {clave}: {valor:.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,145 @@
 import json
 import os
+import re
 from typing import List, Dict, Tuple
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings import HuggingFaceEmbeddings
+from langchain.embeddings.base import Embeddings
 from langchain.vectorstores import FAISS
 import numpy as np
-from datetime import datetime
 import fitz
+from index_bundle import IndexBundle, escribir_bundle, BUNDLE_FILE
+from metadata_store import MetadataStore, METADATA_STORE
+
+# Configuración del splitter recursivo (también la usa chunk_sweep.py sin crear un EnhancedRetriever)
+SPLITTER_CONFIG = {
+    'chunk_size': 500,
+    'chunk_overlap': 50,
+    'separators': ["\n\n", "\n", ".", "!", "?", ",", " ", ""]
+}
+
+def _trie_regex(words: List[str]) -> str:
+    """Construye una alternancia factorizada por prefijos (trie) para que `re` descarte
+    cada posición con una sola comparación de carácter."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = True
+
+    def build(node):
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != '']
+        if not alts:
+            return ''
+        body = alts[0] if len(alts) == 1 else '(?:' + '|'.join(alts) + ')'
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+class MetadataMatcher:
+    """Patrones de un documento: términos de seguros y secciones principales.
+
+    Se compila una vez por documento. Los términos se buscan con un único patrón
+    factorizado por prefijos sobre el chunk en minúsculas (una sola conversión y una
+    sola búsqueda que termina en la primera coincidencia), y las secciones con un solo
+    recorrido ordenado que resuelve a la vez la pertenencia y la sección de contexto.
+    """
+
+    def __init__(self, insurance_terms: List[str], main_sections: List[str]):
+        terms = sorted({t.lower() for t in insurance_terms})
+        if '' in terms:
+            # El término vacío está en cualquier chunk (mismo comportamiento que `in`)
+            self.term_re = re.compile('')
+        else:
+            self.term_re = re.compile(_trie_regex(terms)) if terms else None
+        # Secciones sin duplicados, conservando el orden de `main_sections`
+        self.sections = list(dict.fromkeys(main_sections))
+
+    def match(self, chunk: str) -> Tuple[bool, bool, str]:
+        """Devuelve (contiene términos, en sección importante, sección de contexto)."""
+        has_term = self.term_re is not None and self.term_re.search(chunk.lower()) is not None
+        for section in self.sections:
+            if section in chunk:
+                return has_term, True, section
+        return has_term, False, ''
+
+class LazyEmbeddings(Embeddings):
+    """Embeddings de HuggingFace que solo cargan el modelo en la primera consulta."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+
+    @property
+    def model(self) -> HuggingFaceEmbeddings:
+        if self._model is None:
+            print(f"🔄 Cargando modelo de embeddings {self.model_name}...")
+            self._model = HuggingFaceEmbeddings(model_name=self.model_name)
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.embed_query(text)
 
 class EnhancedRetriever:
-    def __init__(self, metadata_file="documentos_metadata.json", data_dir="preparsed_data"):
+    def __init__(self, metadata_file=None, data_dir="preparsed_data",
+                 model_name="sentence-transformers/paraphrase-multilingual-mpnet-base-v2"):
         self.data_dir = data_dir
+        # Por defecto el store por documento (metadata_generator.py --incremental) si existe
+        if metadata_file is None:
+            metadata_file = METADATA_STORE if os.path.exists(METADATA_STORE) else "documentos_metadata.json"
         self.metadata_file = metadata_file
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
-        )
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50,
-            separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
-        )
+        self.model_name = model_name
+        # El modelo (420M parámetros) no se carga hasta la primera consulta o indexación
+        self.embeddings = LazyEmbeddings(model_name)
+        self.splitter_config = dict(SPLITTER_CONFIG)
+        self.text_splitter = RecursiveCharacterTextSplitter(**self.splitter_config)
         self.metadata = self._load_metadata()
         self.vector_store = None
+        # Índice FAISS y chunks: del vector_store de LangChain o, en modo servicio, del bundle
+        self.index = None
+        self.chunk_store = None
+        # Boost de relevancia por chunk, alineado con las posiciones del índice FAISS
+        self.relevance_boost = None
+        self._matchers = {}
+        self._chunks = []
 
     def _load_metadata(self) -> Dict:
-        """Carga los metadatos del archivo JSON."""
+        """Carga los metadatos del archivo JSON o abre el store (que se consulta por documento)."""
         try:
+            if self.metadata_file.endswith(".sqlite"):
+                return MetadataStore(self.metadata_file)
             with open(self.metadata_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except Exception as e:
             print(f"❌ Error cargando metadatos: {str(e)}")
             return {}
 
+    def _get_matcher(self, filename: str) -> MetadataMatcher:
+        """Devuelve el autómata de patrones del documento, compilándolo solo la primera vez."""
+        if filename not in self._matchers:
+            content_summary = self.metadata.get(filename, {}).get('content_summary', {})
+            self._matchers[filename] = MetadataMatcher(
+                content_summary.get('insurance_terms_present', []),
+                content_summary.get('main_sections', [])
+            )
+        return self._matchers[filename]
+
     def _enhance_chunk_with_metadata(self, chunk: str, pdf_path: str) -> Dict:
         """Enriquece el chunk con metadatos relevantes."""
         filename = os.path.basename(pdf_path)
         doc_metadata = self.metadata.get(filename, {})
         
-        # Extraer información relevante de los metadatos
-        insurance_terms = doc_metadata.get('content_summary', {}).get('insurance_terms_present', [])
-        main_sections = doc_metadata.get('content_summary', {}).get('main_sections', [])
-        
-        # Determinar si el chunk contiene términos de seguros
-        contains_insurance_terms = any(term in chunk.lower() for term in insurance_terms)
-        
-        # Determinar si el chunk es parte de una sección importante
-        in_important_section = any(section in chunk for section in main_sections)
+        # Términos de seguros, pertenencia a sección importante y sección de contexto en una sola pasada
+        contains_insurance_terms, in_important_section, section_context = \
+            self._get_matcher(filename).match(chunk)
         
         # Calcular un score de relevancia basado en metadatos
         relevance_score = 1.0
@@ -61,7 +155,7 @@ class EnhancedRetriever:
             'in_important_section': in_important_section,
             'relevance_score': relevance_score,
             'doc_title': doc_metadata.get('document_info', {}).get('title', ''),
-            'section_context': next((s for s in main_sections if s in chunk), '')
+            'section_context': section_context
         }
 
     def process_documents(self):
@@ -102,55 +196,159 @@ class EnhancedRetriever:
             embedding=self.embeddings,
             metadatas=metadatas
         )
+        self.index = self.vector_store.index
+        self.chunk_store = None
+        self._chunks = all_chunks
+        self.relevance_boost = np.array([chunk['relevance_score'] for chunk in all_chunks], dtype=np.float32)
         
         print(f"\n✅ Índice de vectores creado con {len(all_chunks)} chunks")
 
-    def retrieve(self, query: str, k: int = 5) -> List[Dict]:
-        """Realiza la búsqueda considerando tanto similitud semántica como metadatos."""
-        if not self.vector_store:
-            print("❌ Primero debes procesar los documentos con process_documents()")
+    def _build_relevance_boost(self) -> np.ndarray:
+        """Reconstruye el array de boosts a partir del docstore (posición FAISS -> relevance_score)."""
+        index_to_id = self.vector_store.index_to_docstore_id
+        return np.array([
+            self.vector_store.docstore.search(index_to_id[i]).metadata.get('relevance_score', 1.0)
+            for i in range(self.vector_store.index.ntotal)
+        ], dtype=np.float32)
+
+    def _get_chunk(self, position: int) -> Dict:
+        """Devuelve los metadatos del chunk en la posición FAISS indicada."""
+        if self.chunk_store is not None:
+            return self.chunk_store[position]
+        if self._chunks:
+            return self._chunks[position]
+        doc_id = self.vector_store.index_to_docstore_id[position]
+        return self.vector_store.docstore.search(doc_id).metadata
+
+    def retrieve_batch(self, queries: List[str], k: int = 5) -> List[List[Dict]]:
+        """Búsqueda por lotes: un solo encode para todas las consultas y una búsqueda FAISS matricial."""
+        if self.index is None:
+            print("❌ Primero debes procesar los documentos con process_documents() o cargar un índice")
+            return [[] for _ in queries]
+        if not queries:
             return []
         
-        # Realizar búsqueda semántica
-        results = self.vector_store.similarity_search_with_score(query, k=k*2)  # Obtenemos más resultados para filtrar
+        # Embeddings de todas las consultas en una sola llamada
+        query_matrix = np.asarray(self.embeddings.embed_documents(list(queries)), dtype=np.float32)
         
-        # Reordenar resultados considerando tanto similitud como metadata
-        enhanced_results = []
-        for doc, score in results:
-            metadata = doc.metadata
-            final_score = (1 / (1 + score)) * metadata['relevance_score']
-            
-            enhanced_results.append({
-                'content': doc.page_content,
-                'metadata': metadata,
-                'final_score': final_score
-            })
+        # Obtenemos más resultados para reordenar con los metadatos
+        distances, ids = self.index.search(query_matrix, k * 2)
+        
+        # Score final = similitud * boost de metadatos, calculado sobre toda la matriz
+        valid = ids >= 0
+        boosts = self.relevance_boost[np.where(valid, ids, 0)]
+        scores = np.where(valid, boosts / (1.0 + distances), -np.inf)
+        
+        # Top-k por fila sin ordenar toda la fila
+        top_k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
         
-        # Ordenar por score final y tomar los k mejores
-        enhanced_results.sort(key=lambda x: x['final_score'], reverse=True)
-        return enhanced_results[:k]
+        all_results = []
+        for row, cols in enumerate(top):
+            results = []
+            for col in cols:
+                if not valid[row, col]:
+                    continue
+                metadata = self._get_chunk(int(ids[row, col]))
+                results.append({
+                    'content': metadata['content'],
+                    'metadata': metadata,
+                    'final_score': float(scores[row, col])
+                })
+            all_results.append(results)
+        return all_results
+
+    def retrieve(self, query: str, k: int = 5) -> List[Dict]:
+        """Realiza la búsqueda considerando tanto similitud semántica como metadatos."""
+        return self.retrieve_batch([query], k=k)[0]
+
+    def _manifest(self) -> Dict:
+        """Configuración con la que se construye el índice: modelo y parámetros del splitter."""
+        return {
+            'model_name': self.model_name,
+            'splitter': dict(self.splitter_config)
+        }
+
+    def check_manifest(self, path: str = "vector_store") -> bool:
+        """Comprueba que el índice guardado se construyó con el mismo modelo y splitter."""
+        bundle_path = os.path.join(path, BUNDLE_FILE)
+        if not os.path.exists(bundle_path):
+            return False
+        # Solo lee la cabecera del bundle
+        bundle = IndexBundle(bundle_path)
+        guardado = {'model_name': bundle.header['model_id'], 'splitter': bundle.header['chunker']}
+        bundle.close()
+        esperado = self._manifest()
+        for key, value in esperado.items():
+            if guardado.get(key) != value:
+                print(f"⚠️ El índice en {path} no coincide con la configuración actual ({key})")
+                return False
+        return True
 
     def save_index(self, path: str = "vector_store"):
-        """Guarda el índice de vectores."""
+        """Guarda el índice de vectores y el bundle con vectores, chunks, boosts y configuración."""
         if self.vector_store:
             self.vector_store.save_local(path)
+            
+            # Bundle apto para mmap que usa el modo servicio (un solo archivo con checksums)
+            num_chunks = self.index.ntotal
+            chunks = [self._get_chunk(i) for i in range(num_chunks)]
+            manifest = self._manifest()
+            escribir_bundle(
+                os.path.join(path, BUNDLE_FILE),
+                self.index.reconstruct_n(0, num_chunks),
+                [f"{chunk['source']} | chunk {i + 1}" for i, chunk in enumerate(chunks)],
+                [chunk['content'] for chunk in chunks],
+                chunks,
+                model_id=manifest['model_name'],
+                chunker=manifest['splitter'],
+                metric="L2",
+                extras={'relevance_boost': np.asarray(self.relevance_boost, dtype=np.float32)}
+            )
             print(f"✅ Índice guardado en {path}")
     
     def load_index(self, path: str = "vector_store"):
         """Carga un índice de vectores existente."""
         if os.path.exists(path):
             self.vector_store = FAISS.load_local(path, self.embeddings)
+            self.index = self.vector_store.index
+            self.chunk_store = None
+            self._chunks = []
+            self.relevance_boost = self._build_relevance_boost()
             print(f"✅ Índice cargado desde {path}")
 
+    def load_for_serving(self, path: str = "vector_store") -> bool:
+        """Modo servicio: abre el bundle con mmap sin re-embeber el corpus.
+
+        El modelo de embeddings no se carga hasta la primera consulta. Devuelve False si el
+        índice no existe o se construyó con otro modelo o splitter.
+        """
+        if not self.check_manifest(path):
+            return False
+        
+        # Vectores, chunks y boosts son vistas del mismo archivo: no pueden desalinearse
+        self.index = IndexBundle(os.path.join(path, BUNDLE_FILE))
+        self.chunk_store = self.index.metadata
+        self.relevance_boost = self.index.extra('relevance_boost')
+        self.vector_store = None
+        self._chunks = []
+        
+        print(f"✅ Índice abierto en modo servicio desde {path} ({self.index.ntotal} chunks)")
+        return True
+
 def main():
     # Ejemplo de uso
     retriever = EnhancedRetriever()
     
-    # Procesar documentos y crear índice
-    retriever.process_documents()
-    
-    # Guardar índice para uso futuro
-    retriever.save_index()
+    # Reutilizar el índice guardado si se construyó con la misma configuración
+    if not retriever.load_for_serving():
+        # Procesar documentos y crear índice
+        retriever.process_documents()
+        
+        # Guardar índice para uso futuro
+        retriever.save_index()
     
     # Ejemplo de búsqueda
     query = "¿Cuáles son las coberturas principales?"
@@ -0,0 +1,345 @@
+import os
+import json
+import mmap
+import shutil
+import hashlib
+import itertools
+from datetime import datetime
+import numpy as np
+
+BUNDLE_FILE = "index.bundle"
+MAGIC = b"BDPBNDL\x00"
+FORMAT_VERSION = 1
+ALIGN = 4096  # Secciones alineadas a página: cada una se mapea sin copias
+
+def _codificar_textos(textos, inicio=0):
+    """Codifica cadenas como offsets int64 (uno por cadena, a partir de `inicio`) y un bloque UTF-8."""
+    codificados = [str(t).encode('utf-8') for t in textos]
+    offsets = inicio + np.cumsum([len(c) for c in codificados], dtype=np.int64)
+    return offsets.astype(np.int64), b"".join(codificados)
+
+class _SeccionTemporal:
+    """Sección del bundle que se va escribiendo por partes en un archivo temporal."""
+
+    def __init__(self, path, es_array=True):
+        self.path = path
+        self.es_array = es_array
+        self._file = open(path, 'wb')
+        self._sha256 = hashlib.sha256()
+        self.nbytes = 0
+        self.filas = 0
+        self.dtype = None
+        self.forma = None  # Dimensiones de cada fila (p. ej. [d] para los vectores)
+
+    def escribir(self, datos):
+        if self.es_array:
+            datos = np.ascontiguousarray(datos, dtype=self.dtype)
+            if self.dtype is None:
+                self.dtype, self.forma = datos.dtype, list(datos.shape[1:])
+            elif list(datos.shape[1:]) != self.forma:
+                raise ValueError(f"Forma inconsistente en la sección {os.path.basename(self.path)}")
+            self.filas += len(datos)
+            datos = datos.tobytes()
+        self._file.write(datos)
+        self._sha256.update(datos)
+        self.nbytes += len(datos)
+
+    def descripcion(self):
+        self._file.close()
+        return {
+            'nbytes': self.nbytes,
+            'dtype': np.dtype(self.dtype).str if self.es_array else 'bytes',
+            'shape': [self.filas] + self.forma if self.es_array else None,
+            'sha256': self._sha256.hexdigest()
+        }
+
+    def descartar(self):
+        self._file.close()
+
+class EscritorBundle:
+    """Escribe un bundle por lotes sin tener el índice completo en memoria.
+
+    Cada sección (vectores, normas, IDs, textos, metadatos y extras) se añade a un
+    archivo temporal a medida que llegan los lotes; al cerrar se escribe la cabecera y
+    se copian las secciones alineadas en el bundle final. La memoria es la de un lote.
+    Se usa como context manager: si hay una excepción, los temporales se eliminan.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_dir = path + ".secciones"
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        self._secciones = {}
+        self._fin_textos = {}
+        self.n = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        if os.path.isdir(self._tmp_dir):
+            # Sin `cerrar` o con una excepción: no queda ningún bundle a medias
+            for seccion in self._secciones.values():
+                seccion.descartar()
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        return False
+
+    def _seccion(self, nombre, es_array=True):
+        if nombre not in self._secciones:
+            self._secciones[nombre] = _SeccionTemporal(
+                os.path.join(self._tmp_dir, f"{len(self._secciones)}.bin"), es_array)
+        return self._secciones[nombre]
+
+    def _textos(self, nombre, textos):
+        """Añade cadenas a las secciones `<nombre>.offsets` y `<nombre>.data`; devuelve cuántas."""
+        if nombre not in self._fin_textos:
+            self._seccion(f'{nombre}.offsets').escribir(np.zeros(1, dtype=np.int64))
+            self._seccion(f'{nombre}.data', es_array=False)
+            self._fin_textos[nombre] = 0
+        offsets, datos = _codificar_textos(textos, self._fin_textos[nombre])
+        if len(offsets):
+            self._secciones[f'{nombre}.offsets'].escribir(offsets)
+            self._secciones[f'{nombre}.data'].escribir(datos)
+            self._fin_textos[nombre] = int(offsets[-1])
+        return len(offsets)
+
+    def anadir(self, embeddings, ids, textos, metadatos=None, extras=None):
+        """Añade un lote de chunks: vectores, IDs, textos y, opcionalmente, metadatos y extras."""
+        vectores = np.ascontiguousarray(embeddings, dtype=np.float32)
+        n = len(vectores)
+        if len(ids) != n or len(textos) != n or (metadatos is not None and len(metadatos) != n):
+            raise ValueError("La cantidad de embeddings, IDs, textos y metadatos no coincide")
+        for nombre, valores in (extras or {}).items():
+            if len(valores) != n:
+                raise ValueError(f"La sección extra '{nombre}' no está alineada con los chunks")
+        if n == 0:
+            return
+
+        self._seccion('vectors').escribir(vectores)
+        # Normas al cuadrado precalculadas para la distancia L2
+        self._seccion('norms').escribir(np.einsum('ij,ij->i', vectores, vectores).astype(np.float32))
+        self._textos('ids', ids)
+        self._textos('texts', textos)
+        if metadatos is not None:
+            self.metadatos(metadatos)
+        for nombre, valores in (extras or {}).items():
+            self._seccion(f'extra.{nombre}').escribir(valores)
+        self.n += n
+
+    def metadatos(self, metadatos):
+        """Añade metadatos por chunk (objetos JSON); pueden escribirse al final, por bloques."""
+        iterador = iter(metadatos)
+        while self._textos('metadata', (json.dumps(m, ensure_ascii=False)
+                                        for m in itertools.islice(iterador, 4096))):
+            pass
+
+    def cerrar(self, model_id=None, chunker=None, metric="L2", documentos=None):
+        """Escribe la cabecera y las secciones en el bundle final (de forma atómica)."""
+        for nombre in ('vectors', 'norms'):
+            if self._seccion(nombre).dtype is None:
+                self._secciones[nombre].escribir(np.zeros(0, dtype=np.float32))
+        for nombre in ('ids', 'texts'):
+            self._textos(nombre, [])
+        descripcion = {nombre: seccion.descripcion() for nombre, seccion in self._secciones.items()}
+        for nombre, info in descripcion.items():
+            esperado = self.n + 1 if nombre.endswith('.offsets') else self.n
+            if info['shape'] is not None and info['shape'][0] != esperado:
+                raise ValueError(f"La sección '{nombre}' no está alineada con los chunks")
+
+        # Offsets relativos al inicio de los datos; se desplazan cuando se conoce la cabecera
+        posicion = 0
+        for info in descripcion.values():
+            info['offset'] = posicion
+            posicion += -(-info['nbytes'] // ALIGN) * ALIGN
+        forma = descripcion['vectors']['shape']
+        cabecera = {
+            'format_version': FORMAT_VERSION,
+            'model_id': model_id,
+            'dimension': int(forma[1]) if len(forma) == 2 else 0,
+            'metric': metric,
+            'chunker': chunker or {},
+            'count': self.n,
+            'documents': list(documentos) if documentos is not None else None,
+            'created_at': datetime.now().isoformat(),
+            'sections': descripcion
+        }
+        # La cabecera reserva espacio suficiente para sus propios offsets absolutos
+        inicio = -(-(len(MAGIC) + 8 + len(json.dumps(cabecera).encode('utf-8')) + 64 * len(descripcion)) // ALIGN) * ALIGN
+        for info in descripcion.values():
+            info['offset'] += inicio
+        cabecera_bytes = json.dumps(cabecera, ensure_ascii=False).encode('utf-8')
+
+        tmp = self.path + ".tmp"
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC)
+            f.write(np.uint64(len(cabecera_bytes)).tobytes())
+            f.write(cabecera_bytes)
+            for nombre, seccion in self._secciones.items():
+                f.seek(descripcion[nombre]['offset'])
+                with open(seccion.path, 'rb') as origen:
+                    shutil.copyfileobj(origen, f, 1 << 20)
+            f.truncate(max(inicio, max(s['offset'] + s['nbytes'] for s in descripcion.values())))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        print(f"✅ Bundle escrito en {self.path} ({self.n} chunks, {os.path.getsize(self.path) / 1e6:.1f} MB)")
+        return self.path
+
+def escribir_bundle(path, embeddings, ids, textos, metadatos=None, model_id=None,
+                    chunker=None, metric="L2", extras=None, documentos=None):
+    """Escribe el índice completo en un único archivo versionado.
+
+    Estructura: MAGIC, longitud de la cabecera (uint64), cabecera JSON y secciones
+    alineadas a 4096 bytes. La cabecera registra el modelo, la dimensión, la métrica, la
+    configuración del chunker, el número de chunks y el SHA-256 de cada sección.
+    `extras` son arrays adicionales alineados con los chunks (p. ej. boosts de relevancia)
+    y `documentos` la tabla de documentos a la que apuntan sus columnas de procedencia.
+    Para índices que no caben en memoria, ver `EscritorBundle`.
+    """
+    with EscritorBundle(path) as escritor:
+        escritor.anadir(embeddings, ids, textos, metadatos=metadatos, extras=extras)
+        return escritor.cerrar(model_id=model_id, chunker=chunker, metric=metric, documentos=documentos)
+
+class _SeccionTextos:
+    """Lista de cadenas (o de objetos JSON) leída bajo demanda desde el mmap."""
+
+    def __init__(self, offsets, datos, json_items=False):
+        self.offsets = offsets
+        self.datos = datos
+        self.json_items = json_items
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        valor = bytes(self.datos[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+        return json.loads(valor) if self.json_items else valor
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+class IndexBundle:
+    """Índice abierto desde un bundle con mmap: vectores, IDs, textos y metadatos por chunk.
+
+    Abrir el archivo solo lee la cabecera; las secciones son vistas sobre el mmap, así que
+    varios procesos que abren el mismo bundle comparten las páginas físicas. Expone
+    `search`, `ntotal` y `d` como un IndexFlatL2 de FAISS.
+    """
+
+    def __init__(self, path, verificar=False):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"❌ {path} no es un bundle de índice")
+        longitud = int(np.frombuffer(self._mmap, dtype=np.uint64, count=1, offset=len(MAGIC))[0])
+        inicio = len(MAGIC) + 8
+        self.header = json.loads(self._mmap[inicio:inicio + longitud].decode('utf-8'))
+        if self.header['format_version'] > FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"❌ Versión de bundle no soportada: {self.header['format_version']}")
+        if verificar:
+            self.verificar()
+
+        self.d = self.header['dimension']
+        self.ntotal = self.header['count']
+        self.metric = self.header['metric']
+        self.vectors = self._array('vectors')
+        self.norms = self._array('norms')
+        self.ids = _SeccionTextos(self._array('ids.offsets'), self._seccion('ids.data'))
+        self.texts = _SeccionTextos(self._array('texts.offsets'), self._seccion('texts.data'))
+        self.metadata = None
+        if 'metadata.offsets' in self.header['sections']:
+            self.metadata = _SeccionTextos(self._array('metadata.offsets'),
+                                           self._seccion('metadata.data'), json_items=True)
+
+    def _seccion(self, nombre):
+        info = self.header['sections'][nombre]
+        return memoryview(self._mmap)[info['offset']:info['offset'] + info['nbytes']]
+
+    def _array(self, nombre):
+        info = self.header['sections'][nombre]
+        dtype = np.dtype(info['dtype'])
+        count = int(np.prod(info['shape'])) if info['shape'] else 0
+        return np.frombuffer(self._mmap, dtype=dtype, count=count,
+                             offset=info['offset']).reshape(info['shape'])
+
+    def extra(self, nombre):
+        """Array adicional guardado con `extras` al escribir el bundle."""
+        return self._array(f'extra.{nombre}')
+
+    def verificar(self):
+        """Comprueba el SHA-256 de cada sección (lee el archivo completo)."""
+        for nombre, info in self.header['sections'].items():
+            datos = self._mmap[info['offset']:info['offset'] + info['nbytes']]
+            if hashlib.sha256(datos).hexdigest() != info['sha256']:
+                raise ValueError(f"❌ Checksum incorrecto en la sección '{nombre}' de {self.path}")
+        return True
+
+    def search(self, consultas, k, bloque=65536):
+        """Búsqueda exacta L2 (distancias al cuadrado, como IndexFlatL2) sobre el mmap.
+
+        El corpus se recorre por bloques de `bloque` filas manteniendo un top-k parcial por
+        consulta, así la memoria temporal es de `consultas × bloque` distancias y no crece
+        con el número de chunks.
+        """
+        consultas = np.ascontiguousarray(consultas, dtype=np.float32).reshape(-1, self.d)
+        k_real = min(k, self.ntotal)
+        D = np.full((len(consultas), k), np.inf, dtype=np.float32)
+        I = np.full((len(consultas), k), -1, dtype=np.int64)
+        if k_real == 0:
+            return D, I
+
+        normas_q = np.einsum('ij,ij->i', consultas, consultas)[:, None]
+        mejores_D = np.full((len(consultas), k_real), np.inf, dtype=np.float32)
+        mejores_I = np.full((len(consultas), k_real), -1, dtype=np.int64)
+        for inicio in range(0, self.ntotal, bloque):
+            # ||q||² + ||v||² - 2·q·v calculado en el mismo array
+            dist = consultas @ self.vectors[inicio:inicio + bloque].T
+            dist *= -2
+            dist += self.norms[None, inicio:inicio + bloque]
+            dist += normas_q
+            np.maximum(dist, 0, out=dist)
+            k_bloque = min(k_real, dist.shape[1])
+            top = np.argpartition(dist, k_bloque - 1, axis=1)[:, :k_bloque] if k_bloque < dist.shape[1] \
+                else np.broadcast_to(np.arange(dist.shape[1]), dist.shape)
+            # Merge con el top-k acumulado: se conservan los k_real mejores de ambos
+            candidatos_D = np.concatenate([mejores_D, np.take_along_axis(dist, top, axis=1)], axis=1)
+            candidatos_I = np.concatenate([mejores_I, top + inicio], axis=1)
+            seleccion = np.argpartition(candidatos_D, k_real - 1, axis=1)[:, :k_real]
+            mejores_D = np.take_along_axis(candidatos_D, seleccion, axis=1)
+            mejores_I = np.take_along_axis(candidatos_I, seleccion, axis=1)
+
+        orden = np.argsort(mejores_D, axis=1, kind='stable')
+        D[:, :k_real] = np.take_along_axis(mejores_D, orden, axis=1)
+        I[:, :k_real] = np.take_along_axis(mejores_I, orden, axis=1)
+        return D, I
+
+    def reconstruct_n(self, inicio, n):
+        return np.array(self.vectors[inicio:inicio + n])
+
+    def to_faiss(self):
+        """IndexFlatL2 de FAISS con los mismos vectores (copia en memoria)."""
+        import faiss
+        index = faiss.IndexFlatL2(self.d)
+        if self.ntotal:
+            index.add(np.ascontiguousarray(self.vectors))
+        return index
+
+    def close(self):
+        # Soltar las vistas antes de cerrar el mmap
+        self.vectors = self.norms = self.ids = self.texts = self.metadata = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # Alguna vista sigue viva fuera; el mmap se libera con ella
+        self._file.close()
@@ -0,0 +1,217 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, ExitStack
+import numpy as np
+from index_versions import GestorIndices, INDICES_DIR, CURRENT_FILE, version_actual
+
+# Un directorio de versiones (con su CURRENT) por línea de producto: indices/productos/<producto>
+PRODUCTOS_DIR = os.path.join(INDICES_DIR, "productos")
+
+# Palabras del nombre de archivo que identifican cada familia de producto
+PRODUCTOS = {
+    'moto': ['moto'],
+    'auto': ['auto'],
+    'comunidades': ['comunidad'],
+    'decesos': ['decesos'],
+    'salud': ['salud'],
+    'autonomos': ['autónomo', 'autonomo']
+}
+
+def producto_de(filename):
+    """Línea de producto de un documento según su nombre, o None si no encaja en ninguna."""
+    nombre = filename.lower()
+    for producto, claves in PRODUCTOS.items():
+        if any(clave in nombre for clave in claves):
+            return producto
+    return None
+
+def productos_disponibles(base_dir=PRODUCTOS_DIR):
+    """Productos con una versión de índice publicada."""
+    if not os.path.isdir(base_dir):
+        return []
+    return sorted(p for p in os.listdir(base_dir)
+                  if os.path.exists(os.path.join(base_dir, p, CURRENT_FILE)))
+
+def tamano_indice(path):
+    """Bytes de los archivos de una versión del índice: su coste en memoria una vez cargada."""
+    total = 0
+    for raiz, _, archivos in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(raiz, a)) for a in archivos)
+    return total
+
+class RegistroIndices:
+    """Índices por línea de producto cargados bajo demanda y desalojados por LRU.
+
+    El índice de un producto (vectores y textos de su bundle) se carga la primera vez que
+    se consulta y queda residente mientras la suma de tamaños no supere `presupuesto_mb`;
+    al superarlo se desalojan los menos usados recientemente. Un índice desalojado se
+    libera cuando terminan las consultas que lo estaban usando.
+    """
+
+    def __init__(self, base_dir=PRODUCTOS_DIR, presupuesto_mb=4096, mmap=False, vigilar=True):
+        self.base_dir = base_dir
+        self.presupuesto = presupuesto_mb * 2**20
+        self.mmap = mmap
+        self.vigilar = vigilar
+        self._lock = threading.Lock()
+        self._cargando = {}
+        self._residentes = OrderedDict()  # producto -> (GestorIndices, bytes, ruta medida)
+        self.stats = {'aciertos': 0, 'cargas': 0, 'desalojos': 0,
+                      'tiempos_carga': [], 'tiempos_desalojo': []}
+
+    def gestor(self, producto, contar=True):
+        """GestorIndices del producto, cargándolo si no está residente.
+
+        Con `contar` el acceso cuenta como uso: acierto en las estadísticas y posición
+        más reciente en el LRU. Las consultas (`adquirir`) cuentan; las lecturas de estado no.
+        """
+        while True:
+            with self._lock:
+                if producto in self._residentes:
+                    if contar:
+                        self._residentes.move_to_end(producto)
+                        self.stats['aciertos'] += 1
+                    gestor, _, ruta = self._residentes[producto]
+                    break
+                evento = self._cargando.get(producto)
+                if evento is None:
+                    evento = self._cargando[producto] = threading.Event()
+                    gestor = None
+                    break
+            # Otro hilo ya lo está cargando: esperar y volver a mirar
+            evento.wait()
+
+        if gestor is None:
+            try:
+                gestor, tamano, ruta = self._cargar(producto)
+                with self._lock:
+                    self._residentes[producto] = (gestor, tamano, ruta)
+                    desalojar = self._seleccionar_desalojos()
+            finally:
+                with self._lock:
+                    self._cargando.pop(producto).set()
+        elif gestor.actual.path != ruta:
+            # El gestor ha cambiado de versión en caliente: la nueva puede ocupar más
+            desalojar = self._remedir(producto, gestor)
+        else:
+            return gestor
+        for anterior, (gestor_anterior, *_) in desalojar:
+            self._desalojar(anterior, gestor_anterior)
+        return gestor
+
+    def _cargar(self, producto):
+        base_dir = os.path.join(self.base_dir, producto)
+        if version_actual(base_dir) is None:
+            raise KeyError(f"No hay ningún índice publicado para el producto '{producto}'")
+        inicio = time.time()
+        gestor = GestorIndices(base_dir, vigilar=self.vigilar, mmap=self.mmap)
+        ruta = gestor.actual.path
+        tamano = tamano_indice(ruta)
+        tiempo = time.time() - inicio
+        with self._lock:
+            self.stats['cargas'] += 1
+            self.stats['tiempos_carga'].append(tiempo)
+        print(f"🔄 Índice de {producto} cargado en {tiempo:.2f}s ({tamano / 2**20:.0f} MB)")
+        return gestor, tamano, ruta
+
+    def _remedir(self, producto, gestor):
+        """Actualiza el tamaño de un producto tras un cambio de versión y aplica el presupuesto."""
+        ruta = gestor.actual.path
+        tamano = tamano_indice(ruta)  # Fuera del lock: recorre el directorio de la versión
+        with self._lock:
+            if self._residentes.get(producto, (None,))[0] is not gestor:
+                return []
+            # Se acaba de consultar: no debe ser el primero en desalojarse por su propio cambio
+            self._residentes[producto] = (gestor, tamano, ruta)
+            self._residentes.move_to_end(producto)
+            desalojar = self._seleccionar_desalojos()
+        print(f"🔄 Índice de {producto} en {os.path.basename(ruta)}: {tamano / 2**20:.0f} MB")
+        return desalojar
+
+    def _seleccionar_desalojos(self):
+        """Saca del registro los menos usados hasta cumplir el presupuesto (siempre queda el último)."""
+        desalojar = []
+        while len(self._residentes) > 1 and self.memoria_residente() > self.presupuesto:
+            desalojar.append(self._residentes.popitem(last=False))
+        return desalojar
+
+    def _desalojar(self, producto, gestor):
+        inicio = time.time()
+        gestor.cerrar()
+        tiempo = time.time() - inicio
+        with self._lock:
+            self.stats['desalojos'] += 1
+            self.stats['tiempos_desalojo'].append(tiempo)
+        print(f"♻️ Índice de {producto} desalojado ({tiempo * 1000:.0f} ms)")
+
+    def memoria_residente(self):
+        return sum(tamano for _, tamano, _ in self._residentes.values())
+
+    @contextmanager
+    def adquirir(self, producto):
+        """Fija la versión del índice del producto mientras dura una petición."""
+        with ExitStack() as pila:
+            while True:
+                gestor = self.gestor(producto)
+                # Bajo el lock del registro: si sigue residente no se puede desalojar antes
+                # de que la petición quede registrada en la versión
+                with self._lock:
+                    if self._residentes.get(producto, (None,))[0] is gestor:
+                        version = pila.enter_context(gestor.adquirir())
+                        break
+            yield version
+
+    def producto(self, producto):
+        """Vista del índice de un producto con la interfaz de `GestorIndices` (para `RAGSimple`)."""
+        return IndiceProducto(self, producto)
+
+    def estadisticas(self):
+        """Cargas, desalojos y aciertos, latencias medias/p95 y productos residentes."""
+        with self._lock:
+            stats = {clave: list(valor) if isinstance(valor, list) else valor
+                     for clave, valor in self.stats.items()}
+            resumen = {
+                'aciertos': stats['aciertos'],
+                'cargas': stats['cargas'],
+                'desalojos': stats['desalojos'],
+                'residentes': list(self._residentes),
+                'memoria_residente_mb': self.memoria_residente() / 2**20
+            }
+        for clave in ('carga', 'desalojo'):
+            tiempos = stats[f'tiempos_{clave}']
+            resumen[f'latencia_{clave}_media'] = float(np.mean(tiempos)) if tiempos else None
+            resumen[f'latencia_{clave}_p95'] = float(np.percentile(tiempos, 95)) if tiempos else None
+        return resumen
+
+    def cerrar(self):
+        with self._lock:
+            residentes = list(self._residentes.items())
+            self._residentes.clear()
+        for _, (gestor, *_) in residentes:
+            gestor.cerrar()
+
+class IndiceProducto:
+    """Índice de un producto visto como un `GestorIndices`: cada acceso pasa por el registro."""
+
+    def __init__(self, registro, producto):
+        self.registro = registro
+        self.producto = producto
+
+    @property
+    def actual(self):
+        # Lectura de estado: no cuenta como acierto ni reordena el LRU (solo lo hacen las consultas)
+        return self.registro.gestor(self.producto, contar=False).actual
+
+    @property
+    def nombre_actual(self):
+        # Desde CURRENT: no carga el índice si el producto no está residente
+        return version_actual(os.path.join(self.registro.base_dir, self.producto))
+
+    def adquirir(self):
+        return self.registro.adquirir(self.producto)
+
+    def detener(self):
+        # El registro es compartido: el índice sigue residente para otras sesiones
+        pass
@@ -0,0 +1,267 @@
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+
+INDICES_DIR = "indices"
+CURRENT_FILE = "CURRENT"
+
+def nueva_version(base_dir=INDICES_DIR):
+    """Crea y devuelve el directorio de una nueva versión del índice (aún no publicada)."""
+    version = "v" + datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    path = os.path.join(base_dir, version)
+    os.makedirs(path)
+    return path
+
+def listar_versiones(base_dir=INDICES_DIR):
+    if not os.path.isdir(base_dir):
+        return []
+    return sorted(v for v in os.listdir(base_dir)
+                  if v.startswith("v") and os.path.isdir(os.path.join(base_dir, v)))
+
+def version_actual(base_dir=INDICES_DIR):
+    """Nombre de la versión publicada, o None si todavía no hay ninguna."""
+    try:
+        with open(os.path.join(base_dir, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def ruta_indice(base_dir=INDICES_DIR):
+    """Directorio con los archivos del índice en uso (la raíz del proyecto si no hay versiones)."""
+    version = version_actual(base_dir)
+    return os.path.join(base_dir, version) if version else "."
+
+def publicar_version(path, base_dir=INDICES_DIR, conservar=5):
+    """Apunta CURRENT a la versión de forma atómica y elimina las versiones más antiguas."""
+    version = os.path.basename(os.path.normpath(path))
+    tmp = os.path.join(base_dir, CURRENT_FILE + ".tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(base_dir, CURRENT_FILE))
+    print(f"✅ Versión de índice publicada: {version}")
+
+    for antigua in listar_versiones(base_dir)[:-conservar]:
+        if antigua != version:
+            shutil.rmtree(os.path.join(base_dir, antigua), ignore_errors=True)
+
+def rollback(base_dir=INDICES_DIR):
+    """Vuelve a publicar la versión anterior a la actual (solo cambia el puntero)."""
+    versiones = listar_versiones(base_dir)
+    actual = version_actual(base_dir)
+    if actual not in versiones or versiones.index(actual) == 0:
+        print("⚠️ No hay una versión anterior a la que volver")
+        return None
+    anterior = versiones[versiones.index(actual) - 1]
+    publicar_version(os.path.join(base_dir, anterior), base_dir, conservar=len(versiones))
+    return anterior
+
+def convertir_a_bundle(path, caducidad_marcador=3600):
+    """Convierte un índice del formato anterior (`vector_index.faiss` plano y `.npy`) en un bundle.
+
+    FAISS solo mapea las listas invertidas: un `IndexFlatL2` se lee entero en memoria
+    anónima de cada proceso aunque se pida mmap. Convertido a `index.bundle`, los vectores
+    y textos se mapean y las réplicas comparten sus páginas. Conviene hacerlo offline,
+    antes de arrancar las réplicas:
+    `python -c "from index_versions import convertir_a_bundle; convertir_a_bundle('.')"`.
+    Si dos procesos lo intentan a la vez, solo convierte el que crea el marcador
+    `index.bundle.convirtiendo`. Devuelve la ruta del bundle, o None si el índice no es
+    plano, está incompleto o no se puede convertir ahora.
+    """
+    from index_bundle import escribir_bundle, BUNDLE_FILE
+
+    destino = os.path.join(path, BUNDLE_FILE)
+    marcador = destino + ".convirtiendo"
+    try:
+        if os.path.exists(marcador) and time.time() - os.path.getmtime(marcador) > caducidad_marcador:
+            os.remove(marcador)  # Conversión interrumpida de un proceso anterior
+        os.close(os.open(marcador, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        print(f"⚠️ Otro proceso está convirtiendo el índice de {path} a bundle")
+        return None
+    except OSError as e:
+        print(f"⚠️ No se pudo convertir el índice de {path} a bundle: {e}")
+        return None
+
+    tmp = f"{destino}.{os.getpid()}.tmp"
+    try:
+        import faiss
+        index = faiss.read_index(os.path.join(path, "vector_index.faiss"))
+        if not isinstance(index, faiss.IndexFlatL2):
+            return None
+        vectores = index.reconstruct_n(0, index.ntotal)
+        del index
+        textos = np.load(os.path.join(path, "vector_texts.npy")).tolist()
+        ids_path = os.path.join(path, "vector_ids.npy")
+        ids = np.load(ids_path).tolist() if os.path.exists(ids_path) else [f"fragmento {i}" for i in range(len(textos))]
+        escribir_bundle(tmp, vectores, ids, textos, metric="L2")
+        os.replace(tmp, destino)
+    except (OSError, ValueError, RuntimeError) as e:
+        # RuntimeError: FAISS no puede leer el índice; ValueError: vectores, IDs y textos desalineados
+        print(f"⚠️ No se pudo convertir el índice de {path} a bundle: {e}")
+        return None
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        os.remove(marcador)
+    print(f"✅ Índice anterior convertido a {destino} ({len(textos)} fragmentos)")
+    return destino
+
+class VersionIndice:
+    """Índice FAISS (único o en shards), textos e IDs de una versión, con contador de uso."""
+
+    def __init__(self, path, mmap=False):
+        # Importaciones diferidas: los visores solo usan `ruta_indice` y no necesitan FAISS
+        import faiss
+        from sharded_index import ShardedIndex, MANIFEST_FILE as SHARDS_MANIFEST
+        from index_bundle import IndexBundle, BUNDLE_FILE
+        from provenance import Procedencia
+        from doc_index import IndiceDocumentos, DOC_INDEX_FILE
+
+        self.path = path
+        self.nombre = os.path.basename(os.path.normpath(path))
+        self.bundle = None
+        legacy = os.path.join(path, "vector_index.faiss")
+        if (mmap and not os.path.exists(os.path.join(path, BUNDLE_FILE)) and os.path.exists(legacy)
+                and not os.path.exists(os.path.join(path, "shards", SHARDS_MANIFEST))):
+            # Solo un bundle se comparte entre réplicas: el formato anterior se convierte una vez
+            if convertir_a_bundle(path) is None:
+                print(f"⚠️ El índice de {path} no está en bundle: se carga en la memoria de este proceso")
+        if os.path.exists(os.path.join(path, BUNDLE_FILE)):
+            # Textos e IDs se leen bajo demanda del mmap, compartido entre procesos
+            self.bundle = IndexBundle(os.path.join(path, BUNDLE_FILE))
+            self.texts = self.bundle.texts
+            self.ids = self.bundle.ids
+        # Metadatos por fragmento (documento, sección y fuentes de los duplicados)
+        self.metadata = self.bundle.metadata if self.bundle is not None else None
+        # Documento, página, offsets y sección de cada fragmento como arrays alineados
+        self.procedencia = Procedencia.desde_bundle(self.bundle) if self.bundle is not None else None
+        # Vectores de documento y particiones por documento para la búsqueda en dos etapas
+        self.documentos_index = None
+        if self.bundle is not None and os.path.exists(os.path.join(path, DOC_INDEX_FILE)):
+            self.documentos_index = IndiceDocumentos(os.path.join(path, DOC_INDEX_FILE), self.bundle)
+        if os.path.exists(os.path.join(path, "shards", SHARDS_MANIFEST)):
+            self.index = ShardedIndex(os.path.join(path, "shards"))
+        elif self.bundle is not None:
+            self.index = self.bundle
+        elif os.path.exists(legacy):
+            # Con mmap, FAISS deja en disco los datos que admiten mapeo (listas invertidas);
+            # los índices planos se convierten antes a bundle (ver `convertir_a_bundle`)
+            self.index = faiss.read_index(legacy, faiss.IO_FLAG_MMAP if mmap else 0)
+        else:
+            raise FileNotFoundError(f"❌ No se encontró la base de datos vectorial en {path}")
+        if self.bundle is None:
+            # Formato anterior: archivos .npy sueltos en la raíz del proyecto. Con mmap se
+            # indexa el array mapeado en lugar de materializar una lista de str
+            cargar = (lambda p: np.load(p, mmap_mode='r')) if mmap else (lambda p: np.load(p).tolist())
+            self.texts = cargar(os.path.join(path, "vector_texts.npy"))
+            ids_path = os.path.join(path, "vector_ids.npy")
+            # IDs "documento | sección N" para citar la fuente de cada fragmento
+            self.ids = cargar(ids_path) if os.path.exists(ids_path) else None
+        self.en_uso = 0
+        self.retirada = False
+
+    def close(self):
+        if hasattr(self.index, 'close'):
+            self.index.close()
+        if self.bundle is not None and self.bundle is not self.index:
+            self.bundle.close()
+        self.bundle = None
+        self.metadata = None
+        self.procedencia = None
+        self.documentos_index = None
+        self.index = None
+        self.texts = None
+        self.ids = None
+
+class GestorIndices:
+    """Sirve la versión publicada del índice y la sustituye en caliente cuando cambia.
+
+    Un hilo vigila CURRENT; la versión nueva se carga en segundo plano y se intercambia
+    de forma atómica entre peticiones. La anterior se libera cuando terminan las consultas
+    que la estaban usando.
+    """
+
+    def __init__(self, base_dir=INDICES_DIR, intervalo=2.0, vigilar=True, mmap=False):
+        self.base_dir = base_dir
+        self.intervalo = intervalo
+        self.mmap = mmap
+        self._lock = threading.Lock()
+        self._version_publicada = version_actual(base_dir)
+        self.actual = VersionIndice(ruta_indice(base_dir), mmap=mmap)
+        self._detener = threading.Event()
+        self._hilo = None
+        if vigilar:
+            self._hilo = threading.Thread(target=self._vigilar, daemon=True)
+            self._hilo.start()
+
+    @property
+    def nombre_actual(self):
+        return self.actual.nombre
+
+    @contextmanager
+    def adquirir(self):
+        """Fija la versión actual mientras dura una petición."""
+        with self._lock:
+            version = self.actual
+            version.en_uso += 1
+        try:
+            yield version
+        finally:
+            with self._lock:
+                version.en_uso -= 1
+                liberar = version.retirada and version.en_uso == 0
+            if liberar:
+                version.close()
+
+    def recargar(self):
+        """Carga la versión publicada (si ha cambiado) y la pone en servicio."""
+        publicada = version_actual(self.base_dir)
+        if publicada == self._version_publicada:
+            return False
+
+        inicio = time.time()
+        try:
+            nueva = VersionIndice(ruta_indice(self.base_dir), mmap=self.mmap)  # Fuera del lock: no bloquea consultas
+        except Exception:
+            # No reintentar la misma versión rota en cada ciclo; se sigue sirviendo la actual
+            self._version_publicada = publicada
+            raise
+
+        with self._lock:
+            anterior = self.actual
+            self.actual = nueva
+            self._version_publicada = publicada
+            anterior.retirada = True
+            liberar = anterior.en_uso == 0
+        if liberar:
+            anterior.close()
+        print(f"🔄 Índice actualizado a {nueva.nombre} en {time.time() - inicio:.2f}s")
+        return True
+
+    def _vigilar(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.recargar()
+            except Exception as e:
+                print(f"❌ Error cargando la nueva versión del índice: {str(e)}")
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=self.intervalo + 1)
+
+    def cerrar(self):
+        """Deja de vigilar y libera la versión actual en cuanto terminen sus consultas."""
+        self.detener()
+        with self._lock:
+            version = self.actual
+            version.retirada = True
+            liberar = version.en_uso == 0
+        if liberar:
+            version.close()
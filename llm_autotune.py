@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import platform
+from datetime import datetime
+
+MODELO_PATH = "llama-2-7b-chat.Q4_K_M.gguf"
+PERFIL_FILE = "llm_profile.json"
+
+# Tamaño típico de una petición de RAG.py (prompt con contexto + tokens generados) por modo
+PETICION_TIPICA = {
+    'prueba': {'prompt_tokens': 350, 'new_tokens': 100},
+    'normal': {'prompt_tokens': 650, 'new_tokens': 215}
+}
+CONTEXT_LENGTHS = (512, 1024, 2048)
+BATCH_SIZES = (1, 2, 8, 32)
+
+def hay_gpu():
+    """True si el host tiene una GPU NVIDIA visible (ctransformers solo descarga capas a CUDA)."""
+    return shutil.which("nvidia-smi") is not None and os.environ.get("CUDA_VISIBLE_DEVICES") != ""
+
+def huella_hardware():
+    """Descripción del host con la que se valida el perfil (CPU, núcleos, memoria y GPU)."""
+    nucleos = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    try:
+        memoria = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        memoria = None
+    return {
+        'machine': platform.machine(),
+        'processor': platform.processor() or platform.platform(),
+        'cpus': nucleos,
+        'memoria': memoria,
+        'gpu': hay_gpu()
+    }
+
+# Huellas ya calculadas por (ruta, tamaño, mtime): cada RAGSimple() la consulta
+_HUELLAS_MODELO = {}
+
+def huella_modelo(modelo_path=MODELO_PATH, muestra=1 << 20):
+    """Tamaño y hash del primer MB del modelo: detecta un archivo sustituido sin leer 4 GB.
+
+    El hash solo se recalcula si cambian el tamaño o la fecha de modificación del archivo.
+    """
+    estado = os.stat(modelo_path)
+    clave = (os.path.abspath(modelo_path), estado.st_size, estado.st_mtime_ns, muestra)
+    if clave not in _HUELLAS_MODELO:
+        with open(modelo_path, 'rb') as f:
+            cabecera = f.read(muestra)
+        _HUELLAS_MODELO[clave] = {
+            'nombre': os.path.basename(modelo_path),
+            'tamano': estado.st_size,
+            'sha256_inicio': hashlib.sha256(cabecera).hexdigest()
+        }
+    return dict(_HUELLAS_MODELO[clave])
+
+def candidatos_threads(cpus):
+    """1, 2, 4, ... hasta el número de CPUs disponibles (incluidos la mitad y el total)."""
+    candidatos = {cpus, max(cpus // 2, 1)}
+    n = 1
+    while n < cpus:
+        candidatos.add(n)
+        n *= 2
+    return sorted(candidatos)
+
+def parametros_por_defecto(modo_prueba=False):
+    """Parámetros sin perfil: todos los núcleos y capas en GPU solo si hay GPU."""
+    return {
+        'gpu_layers': 20 if hay_gpu() else 0,
+        'threads': huella_hardware()['cpus'],
+        'batch_size': 8,
+        'context_length': 512 if modo_prueba else 1024
+    }
+
+def cargar_perfil(modelo_path=MODELO_PATH, perfil_file=PERFIL_FILE):
+    """Perfil guardado por `autotune`, o None si no existe o ya no es válido.
+
+    El perfil deja de ser válido si cambia el archivo del modelo o el hardware. Un perfil
+    ilegible o incompleto se ignora con un aviso: RAG.py arranca con los valores por defecto.
+    """
+    if not os.path.exists(perfil_file):
+        return None
+    try:
+        with open(perfil_file, 'r', encoding='utf-8') as f:
+            perfil = json.load(f)
+        for modo in PETICION_TIPICA:
+            dict(perfil['parametros'][modo])
+    except (OSError, json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        print(f"⚠️ El perfil {perfil_file} no es válido ({e}); se usan los parámetros por defecto")
+        return None
+    if perfil.get('hardware') != huella_hardware():
+        print(f"⚠️ El perfil {perfil_file} se generó en otro hardware; ejecuta 'python llm_autotune.py'")
+        return None
+    if perfil.get('modelo') != huella_modelo(modelo_path):
+        print(f"⚠️ El perfil {perfil_file} se generó para otro modelo; ejecuta 'python llm_autotune.py'")
+        return None
+    return perfil
+
+def parametros_llm(modelo_path=MODELO_PATH, modo_prueba=False, perfil_file=PERFIL_FILE):
+    """Parámetros de carga del LLM: los del perfil si es válido, si no los de por defecto."""
+    perfil = cargar_perfil(modelo_path, perfil_file)
+    if perfil is None:
+        return parametros_por_defecto(modo_prueba)
+    return dict(perfil['parametros']['prueba' if modo_prueba else 'normal'])
+
+def _medir(llm, tokens, new_tokens, threads, batch_size, repeticiones=2):
+    """Tokens/s de prefill (evaluar el prompt) y de decode (generar de uno en uno)."""
+    prefill, decode = [], []
+    for _ in range(repeticiones):
+        llm.reset()
+        inicio = time.perf_counter()
+        llm.eval(tokens, batch_size=batch_size, threads=threads)
+        prefill.append(len(tokens) / (time.perf_counter() - inicio))
+
+        inicio = time.perf_counter()
+        for _ in range(new_tokens):
+            llm.eval([llm.sample()], batch_size=1, threads=threads)
+        decode.append(new_tokens / (time.perf_counter() - inicio))
+    return max(prefill), max(decode)
+
+def autotune(modelo_path=MODELO_PATH, perfil_file=PERFIL_FILE, rapido=False):
+    """Mide prefill y decode en el host para cada combinación y guarda el perfil más rápido.
+
+    Threads y batch_size se pasan a cada `eval`, así que el modelo solo se recarga por
+    cada context_length. Para cada modo se elige la context_length más pequeña en la que
+    cabe su petición típica y, dentro de ella, la combinación con menor tiempo estimado
+    (prompt / prefill + tokens generados / decode).
+    """
+    from ctransformers import AutoModelForCausalLM
+
+    hardware = huella_hardware()
+    gpu_layers = 20 if hardware['gpu'] else 0
+    threads = candidatos_threads(hardware['cpus'])
+    batch_sizes = BATCH_SIZES[:2] if rapido else BATCH_SIZES
+    new_tokens = 16 if rapido else 32
+    print(f"🔍 Host: {hardware['cpus']} CPUs, GPU: {'sí' if hardware['gpu'] else 'no'}")
+
+    texto = "La póliza cubre los daños propios del vehículo asegurado en caso de accidente. " * 200
+    resultados = []
+    for context_length in CONTEXT_LENGTHS:
+        if not any(p['prompt_tokens'] + p['new_tokens'] <= context_length for p in PETICION_TIPICA.values()):
+            continue
+        print(f"🔄 Cargando modelo con context_length={context_length}...")
+        llm = AutoModelForCausalLM.from_pretrained(modelo_path, model_type="llama",
+                                                   gpu_layers=gpu_layers, context_length=context_length)
+        tokens = llm.tokenize(texto)[:context_length - new_tokens]
+        for n_threads in threads:
+            for batch_size in batch_sizes:
+                prefill, decode = _medir(llm, tokens, new_tokens, n_threads, batch_size,
+                                         repeticiones=1 if rapido else 2)
+                print(f"- ctx {context_length}, {n_threads} threads, batch {batch_size}: "
+                      f"prefill {prefill:.1f} tok/s, decode {decode:.1f} tok/s")
+                resultados.append({'context_length': context_length, 'threads': n_threads,
+                                   'batch_size': batch_size, 'prefill': prefill, 'decode': decode})
+        del llm
+
+    parametros = {}
+    for modo, peticion in PETICION_TIPICA.items():
+        necesario = peticion['prompt_tokens'] + peticion['new_tokens']
+        context_length = min(c for c in {r['context_length'] for r in resultados} if c >= necesario)
+        mejor = min((r for r in resultados if r['context_length'] == context_length),
+                    key=lambda r: peticion['prompt_tokens'] / r['prefill'] + peticion['new_tokens'] / r['decode'])
+        parametros[modo] = {'gpu_layers': gpu_layers, 'threads': mejor['threads'],
+                            'batch_size': mejor['batch_size'], 'context_length': context_length}
+        print(f"✅ Modo {modo}: {parametros[modo]} (prefill {mejor['prefill']:.1f} tok/s, "
+              f"decode {mejor['decode']:.1f} tok/s)")
+
+    perfil = {
+        'hardware': hardware,
+        'modelo': huella_modelo(modelo_path),
+        'creado': datetime.now().isoformat(),
+        'parametros': parametros,
+        'mediciones': resultados
+    }
+    with open(perfil_file, 'w', encoding='utf-8') as f:
+        json.dump(perfil, f, indent=2)
+    print(f"✅ Perfil guardado en {perfil_file}")
+    return perfil
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    modelo_path = args[0] if args else MODELO_PATH
+    if not os.path.exists(modelo_path):
+        print(f"❌ No se encontró el modelo en {modelo_path}")
+        return
+    autotune(modelo_path, rapido="--rapido" in sys.argv)
+
+if __name__ == "__main__":
+    main()
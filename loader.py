@@ -1,16 +1,62 @@
 import os
+import shutil
 import fitz  # PyMuPDF
-import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
-from tqdm import tqdm
 import re
+import itertools
+from sharded_index import construir_shards
+from index_versions import nueva_version, publicar_version, version_actual, INDICES_DIR
+from index_bundle import escribir_bundle, EscritorBundle, IndexBundle, BUNDLE_FILE
+from dedup import DeduplicadorIncremental
+from provenance import Procedencia, columnas_de_filas
+from text_stream import leer_secciones, es_encabezado
+from doc_index import construir_indice_documentos
+
+def _inicios(partes, separador):
+    """Offset de inicio de cada parte de `texto.split(sep)`, con `separador` = len(sep)."""
+    inicios = []
+    posicion = 0
+    for parte in partes:
+        inicios.append(posicion)
+        posicion += len(parte) + separador
+    return inicios
+
+def _limpiar_seccion(section):
+    """Sección normalizada (espacios simples) si es válida para indexar, o None."""
+    clean_section = ' '.join(section.split())
+    if len(clean_section) > 50 and any(c.isalpha() for c in clean_section):
+        return clean_section
+    return None
 
 class DocumentProcessor:
-    def __init__(self, chunk_size=512, chunk_overlap=0.1):
+    def __init__(self, chunk_size=512, chunk_overlap=0.1, num_shards=1, eliminar_duplicados=True, umbral_dedup=0.9,
+                 max_chars_seccion=20000, lote_embeddings=256, base_dir=INDICES_DIR, archivos=None,
+                 data_directory="data"):
+        self.data_directory = data_directory
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+        self.num_shards = num_shards
+        # Los bloques legales repetidos entre documentos (IPIDs) se indexan una sola vez
+        self.eliminar_duplicados = eliminar_duplicados
+        self.umbral_dedup = umbral_dedup
+        # Los TXT se leen en streaming: secciones de como mucho ~max_chars_seccion caracteres
+        # que pasan a los embeddings en lotes de lote_embeddings
+        self.max_chars_seccion = max_chars_seccion
+        self.lote_embeddings = lote_embeddings
+        # Directorio de versiones donde se publica el índice y, opcionalmente, los archivos
+        # de data_directory que entran en él (p. ej. los de una línea de producto)
+        self.base_dir = base_dir
+        self.archivos = archivos
+        self.model_name = "all-MiniLM-L6-v2"
+        self._embedding_model = None
+
+    @property
+    def embedding_model(self):
+        """Carga el modelo de embeddings la primera vez que se usa (el chunking no lo necesita)."""
+        if self._embedding_model is None:
+            self._embedding_model = SentenceTransformer(self.model_name)
+        return self._embedding_model
     
     def create_chunks(self, text):
         """Divide el texto en chunks con overlap."""
@@ -61,11 +107,15 @@ class DocumentProcessor:
             print(f"Error procesando {pdf_path}: {str(e)}")
             return []
 
-    def dataLoader(self):
-        """Carga y extrae texto de archivos PDF y TXT."""
+    def dataLoader(self, streaming_txt=False):
+        """Carga y extrae texto de archivos PDF y TXT.
+
+        Con `streaming_txt` los TXT no se leen aquí: se dejan en `self.archivos_txt` para
+        `fragmentos_txt`, que los recorre sin cargarlos enteros en memoria.
+        """
         # Obtener lista de archivos
         all_files = [f for f in os.listdir(self.data_directory) 
-                    if f.endswith(('.pdf', '.txt'))]
+                    if f.endswith(('.pdf', '.txt')) and (self.archivos is None or f in self.archivos)]
         
         if not all_files:
             print("⚠️ No se encontraron archivos PDF o TXT en el directorio.")
@@ -73,16 +123,25 @@ class DocumentProcessor:
         
         texts = []
         doc_ids = []
+        # Offset de inicio de cada página en el texto extraído de cada PDF
+        self.inicios_pagina = {}
+        self.archivos_txt = []
         
         for file in all_files:
             file_path = os.path.join(self.data_directory, file)
+            if streaming_txt and file.endswith('.txt'):
+                self.archivos_txt.append(file)
+                continue
             try:
                 if file.endswith('.pdf'):
                     # Extraer texto del PDF
                     text = ""
+                    inicios = []
                     with fitz.open(file_path) as doc:
                         for page in doc:
+                            inicios.append(len(text))
                             text += page.get_text("text") + "\n"
+                    self.inicios_pagina[file] = np.array(inicios, dtype=np.int64)
                 else:
                     # Leer archivo TXT
                     with open(file_path, 'r', encoding='utf-8') as f:
@@ -102,56 +161,96 @@ class DocumentProcessor:
             
         return texts, doc_ids
 
-    def splitter(self, texts, doc_ids):
-        """Divide los textos en párrafos."""
-        split_texts = []
-        split_ids = []
+    def _secciones(self, texts, doc_ids):
+        """Genera `(texto, ID, fila de procedencia)` de cada sección válida de los textos."""
+        inicios_pagina = getattr(self, 'inicios_pagina', {})
         
         for text, doc_id in zip(texts, doc_ids):
-            # Limpiar el texto
+            # Limpiar el texto (mismo número de caracteres: los offsets siguen siendo válidos)
             text = text.replace('\r', '\n')
             
             # Dividir por secciones si hay títulos en mayúsculas
             if doc_id.endswith('.txt'):
                 sections = []
+                starts = []
                 current_section = []
+                current_start = 0
+                position = 0
                 lines = text.split('\n')
                 
                 for line in lines:
-                    if line.isupper() and len(line) > 10:  # Probable título de sección
+                    if es_encabezado(line):  # Probable título de sección
                         if current_section:
                             sections.append('\n'.join(current_section))
+                            starts.append(current_start)
                         current_section = [line]
+                        current_start = position
                     else:
                         current_section.append(line)
+                    position += len(line) + 1
                 
                 if current_section:
                     sections.append('\n'.join(current_section))
+                    starts.append(current_start)
                 
                 # Si no se encontraron secciones, usar párrafos
                 if not sections:
                     sections = text.split('\n\n')
+                    starts = _inicios(sections, len('\n\n'))
             else:
                 # Para PDFs usar la división por párrafos original
                 sections = text.split('\n\n')
+                starts = _inicios(sections, len('\n\n'))
+            
+            paginas = inicios_pagina.get(doc_id)
             
             # Procesar cada sección/párrafo
-            for i, section in enumerate(sections):
-                # Limpiar espacios y saltos de línea extras
-                clean_section = ' '.join(section.split())
-                
+            for i, (section, start) in enumerate(zip(sections, starts)):
                 # Filtrar secciones válidas
-                if len(clean_section) > 50 and any(c.isalpha() for c in clean_section):
-                    split_texts.append(clean_section)
-                    split_ids.append(f"{doc_id} | sección {i+1}")
+                clean_section = _limpiar_seccion(section)
+                if clean_section:
+                    # Página en la que empieza la sección (0 si el documento no tiene páginas)
+                    pagina = int(np.searchsorted(paginas, start, side='right')) if paginas is not None else 0
+                    yield clean_section, f"{doc_id} | sección {i+1}", (doc_id, pagina, start, start + len(section), i + 1)
             
             print(f"📄 {doc_id}: {len(sections)} secciones extraídas")
+
+    def fragmentos_txt(self, file):
+        """Genera las secciones válidas de un TXT leyéndolo en streaming (ver `text_stream.py`).
+
+        La memoria no depende del tamaño del archivo; los offsets de la procedencia son
+        bytes del archivo, así cada fragmento se localiza en el original con un `seek`.
+        """
+        secciones = 0
+        for numero, inicio, fin, section in leer_secciones(os.path.join(self.data_directory, file),
+                                                           self.max_chars_seccion):
+            secciones = numero
+            clean_section = _limpiar_seccion(section)
+            if clean_section:
+                yield clean_section, f"{file} | sección {numero}", (file, 0, inicio, fin, numero)
+        print(f"📄 {file}: {secciones} secciones extraídas (streaming)")
+
+    def splitter(self, texts, doc_ids, con_procedencia=False):
+        """Divide los textos en párrafos.
+
+        Con `con_procedencia` devuelve además una `Procedencia` con el documento, la página,
+        los offsets de caracteres y el número de sección de cada fragmento.
+        """
+        split_texts = []
+        split_ids = []
+        filas = []
+        for clean_section, split_id, fila in self._secciones(texts, doc_ids):
+            split_texts.append(clean_section)
+            split_ids.append(split_id)
+            filas.append(fila)
                 
         if not split_texts:
             print("⚠️ No se pudo extraer ninguna sección válida de los documentos")
         else:
             print(f"✅ Total de secciones extraídas: {len(split_texts)}")
-            
+        
+        if con_procedencia:
+            return split_texts, split_ids, Procedencia.desde_filas(filas)
         return split_texts, split_ids
 
     def embedder(self, texts):
@@ -165,98 +264,182 @@ class DocumentProcessor:
         except Exception as e:
             raise Exception(f"Error generando embeddings: {str(e)}")
 
-    def indexer(self, embeddings, split_ids, split_texts):
-        """Crea y guarda el índice FAISS junto con los IDs y textos."""
+    def embedder_stream(self, fragmentos):
+        """Genera `(lote, embeddings)` a partir de un iterador de fragmentos `(texto, ID, fila)`.
+
+        Solo se mantiene en memoria un lote de `lote_embeddings` fragmentos pendientes.
+        """
+        lote = []
+        for fragmento in fragmentos:
+            lote.append(fragmento)
+            if len(lote) == self.lote_embeddings:
+                yield lote, self.embedder([texto for texto, _, _ in lote])
+                lote = []
+        if lote:
+            yield lote, self.embedder([texto for texto, _, _ in lote])
+
+    @property
+    def config_chunker(self):
+        return {'splitter': 'secciones', 'min_chars': 50, 'max_chars_txt': self.max_chars_seccion}
+
+    def indexer(self, embeddings, split_ids, split_texts, num_shards=None, fuentes=None, procedencia=None):
+        """Crea y guarda el índice FAISS junto con los IDs y textos.
+
+        Vectores, IDs, textos y metadatos por fragmento se escriben en un único bundle
+        (`index.bundle`, ver `index_bundle.py`) con checksums, así no pueden desalinearse.
+        Cada ejecución escribe una versión nueva en `indices/` y solo al terminar la publica
+        (cambio atómico del puntero CURRENT), así nunca se sobrescribe un índice en uso.
+        Con `num_shards` > 1 los vectores se reparten por documento en shards independientes
+        (directorio `shards/` de la versión) en lugar de un único `vector_index.faiss`.
+        `fuentes` son, para cada fragmento canónico, los IDs de todos los fragmentos
+        duplicados que representa (ver `dedup.DeduplicadorIncremental`). `procedencia` se guarda como
+        columnas alineadas del bundle (ver `provenance.py`).
+        Para corpus que no caben en memoria, `process_documents` escribe el bundle por lotes.
+        """
         if len(embeddings) != len(split_ids) or len(embeddings) != len(split_texts):
             raise ValueError("La cantidad de embeddings, IDs y textos no coincide")
             
+        directorio = nueva_version(self.base_dir)
         try:
-            # Crear índice FAISS
-            embedding_dim = embeddings.shape[1]
-            index = faiss.IndexFlatL2(embedding_dim)
-            index.add(embeddings)
-
-            # Guardar índice y metadatos
-            faiss.write_index(index, "vector_index.faiss")
-            np.save("vector_ids.npy", np.array(split_ids))
-            np.save("vector_texts.npy", np.array(split_texts))
+            if procedencia is None:
+                # Sin procedencia explícita: "archivo.pdf | sección N" -> documento y sección
+                filas = []
+                for split_id in split_ids:
+                    documento, _, seccion = split_id.partition(" | sección ")
+                    filas.append((documento, 0, 0, 0, int(seccion) if seccion else 0))
+                procedencia = Procedencia.desde_filas(filas)
+            metadatos = [{'fuentes': fuentes[i] if fuentes is not None else [split_id]}
+                         for i, split_id in enumerate(split_ids)]
 
-            print(f"✅ Se han indexado {len(split_ids)} fragmentos en FAISS.")
+            # Índice, IDs, textos, metadatos y procedencia en un solo archivo (las filas son los IDs globales de los shards)
+            escribir_bundle(
+                os.path.join(directorio, BUNDLE_FILE),
+                embeddings, split_ids, split_texts, metadatos,
+                model_id=self.model_name,
+                chunker=self.config_chunker,
+                metric="L2",
+                extras=procedencia.columnas(),
+                documentos=procedencia.documentos
+            )
+            self._completar_version(directorio, num_shards or self.num_shards, fuentes)
             
         except Exception as e:
+            shutil.rmtree(directorio, ignore_errors=True)
             raise Exception(f"Error en la indexación: {str(e)}")
 
+    def _completar_version(self, directorio, num_shards, fuentes=None):
+        """Shards e índice de documentos a partir del bundle ya escrito (leído con mmap) y publicación."""
+        bundle = IndexBundle(os.path.join(directorio, BUNDLE_FILE))
+        try:
+            if num_shards > 1:
+                construir_shards(bundle.vectors, bundle.ids, num_shards,
+                                 directorio=os.path.join(directorio, "shards"))
+            # Índice de documentos (resúmenes) y particiones de fragmentos para la búsqueda jerárquica
+            construir_indice_documentos(directorio, Procedencia.desde_bundle(bundle), bundle.vectors,
+                                        self.embedding_model, fuentes)
+            total = bundle.ntotal
+        finally:
+            bundle.close()
+        
+        # Publicar la versión completa: los procesos de servicio la cargan en caliente
+        publicar_version(directorio, self.base_dir)
+        print(f"✅ Se han indexado {total} fragmentos en FAISS.")
+
     def process_documents(self):
-        """Ejecuta el pipeline completo de procesamiento."""
+        """Ejecuta el pipeline completo de procesamiento.
+
+        Los fragmentos fluyen como un generador: lectura (los TXT en streaming),
+        deduplicación incremental y embeddings por lotes, y cada lote se añade al bundle
+        en disco (`EscritorBundle`). Ni los textos ni los vectores se acumulan en memoria;
+        lo que crece con el corpus es el estado por fragmento único de la deduplicación
+        (firma MinHash e IDs de sus fuentes) y la tabla de documentos.
+        """
+        directorio = None
         try:
             print("🔄 Iniciando procesamiento de documentos...")
             
             print("📚 Cargando documentos...")
-            texts, doc_ids = self.dataLoader()
+            texts, doc_ids = self.dataLoader(streaming_txt=True)
             
-            if not texts:
+            if not texts and not self.archivos_txt:
                 return "❌ No hay documentos para procesar"
             
             print("✂️ Dividiendo textos...")
-            split_texts, split_ids = self.splitter(texts, doc_ids)
+            fragmentos = itertools.chain(self._secciones(texts, doc_ids),
+                                         *(self.fragmentos_txt(file) for file in self.archivos_txt))
             
-            if not split_texts:
-                return "❌ No se generaron fragmentos de texto válidos"
+            dedup = None
+            if self.eliminar_duplicados:
+                # Los duplicados se descartan antes de calcular su embedding
+                dedup = DeduplicadorIncremental(self.umbral_dedup)
+                fragmentos = (f for f in fragmentos if dedup.anadir(f[0], f[1]))
             
             print("🧮 Generando embeddings...")
-            embeddings = self.embedder(split_texts)
-            
-            print("💾 Indexando en FAISS...")
-            self.indexer(embeddings, split_ids, split_texts)
+            directorio = nueva_version(self.base_dir)
+            documentos = {}  # documento -> doc_id de la procedencia
+            with EscritorBundle(os.path.join(directorio, BUNDLE_FILE)) as escritor:
+                for lote, embeddings in self.embedder_stream(fragmentos):
+                    lote_textos, lote_ids, lote_filas = zip(*lote)
+                    escritor.anadir(embeddings, lote_ids, lote_textos,
+                                    # Sin deduplicación cada fragmento es su única fuente
+                                    metadatos=None if dedup is not None else [{'fuentes': [i]} for i in lote_ids],
+                                    extras=columnas_de_filas(lote_filas, documentos))
+                
+                if not escritor.n:
+                    shutil.rmtree(directorio, ignore_errors=True)
+                    return "❌ No se generaron fragmentos de texto válidos"
+                print(f"✅ Total de secciones indexables: {escritor.n}")
+                if dedup is not None:
+                    dedup.resumen()
+                    # Las fuentes de cada canónico solo se conocen al final del corpus
+                    escritor.metadatos({'fuentes': fuentes} for fuentes in dedup.fuentes)
+                
+                print("💾 Indexando en FAISS...")
+                escritor.cerrar(model_id=self.model_name, chunker=self.config_chunker,
+                                metric="L2", documentos=list(documentos))
+            self._completar_version(directorio, self.num_shards,
+                                    dedup.fuentes if dedup is not None else None)
             
             return "✅ Procesamiento completado con éxito"
             
         except Exception as e:
+            if directorio is not None and version_actual(self.base_dir) != os.path.basename(directorio):
+                shutil.rmtree(directorio, ignore_errors=True)
             print(f"❌ Error en el procesamiento: {str(e)}")
             return "❌ El proceso falló"
 
+def procesar_por_producto(data_directory="preparsed_data", **kwargs):
+    """Construye un índice independiente por línea de producto en `indices/productos/<producto>`.
+
+    Los documentos se asignan a cada producto por su nombre (ver `index_registry.producto_de`);
+    los que no encajan en ninguno solo están en el índice general.
+    """
+    from index_registry import PRODUCTOS_DIR, producto_de
+
+    por_producto = {}
+    for file in sorted(os.listdir(data_directory)):
+        producto = producto_de(file)
+        if producto is not None and file.endswith(('.pdf', '.txt')):
+            por_producto.setdefault(producto, []).append(file)
+
+    resultados = {}
+    for producto, archivos in por_producto.items():
+        print(f"\n📦 Producto {producto}: {len(archivos)} documentos")
+        base_dir = os.path.join(PRODUCTOS_DIR, producto)
+        os.makedirs(base_dir, exist_ok=True)
+        processor = DocumentProcessor(base_dir=base_dir, archivos=archivos,
+                                      data_directory=data_directory, **kwargs)
+        resultados[producto] = processor.process_documents()
+    return resultados
+
 def main():
-    # Configuración
-    data_dir = "data"
-    chunk_size = 512  # Tamaño mediano por defecto
-    chunk_overlap = 0.15  # 15% de overlap
-    
-    # Inicializar procesador
-    processor = DocumentProcessor(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    
-    # Procesar documentos
-    all_chunks = []
-    pdf_files = [f for f in os.listdir(data_dir) if f.endswith('.pdf')]
-    
-    print(f"🔍 Procesando {len(pdf_files)} documentos...")
-    for pdf_file in tqdm(pdf_files):
-        pdf_path = os.path.join(data_dir, pdf_file)
-        chunks = processor.process_pdf(pdf_path)
-        all_chunks.extend(chunks)
-    
-    print(f"✅ Se generaron {len(all_chunks)} chunks")
-    
-    # Generar embeddings
-    print("🔄 Generando embeddings...")
-    embeddings = processor.embedding_model.encode(all_chunks, show_progress_bar=True)
-    
-    # Crear índice FAISS
-    print("🔄 Creando índice FAISS...")
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings.astype('float32'))
-    
-    # Guardar resultados
-    print("💾 Guardando archivos...")
-    faiss.write_index(index, "vector_index.faiss")
-    np.save("vector_texts.npy", all_chunks)
+    # Configuración: documentos en preparsed_data/ (ver README)
+    data_dir = "preparsed_data"
     
-    print("✅ Proceso completado")
-    print(f"📊 Estadísticas:")
-    print(f"- Documentos procesados: {len(pdf_files)}")
-    print(f"- Chunks generados: {len(all_chunks)}")
-    print(f"- Tamaño de chunk: {chunk_size}")
-    print(f"- Overlap: {chunk_overlap*100}%")
+    # Pipeline completo: lectura, deduplicación, embeddings y una versión nueva en indices/
+    # que se publica al terminar (RAG.py y db_viewer.py la cargan en caliente)
+    processor = DocumentProcessor(data_directory=data_dir)
+    print(processor.process_documents())
 
 if __name__ == "__main__":
     main()
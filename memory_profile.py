@@ -0,0 +1,101 @@
+import os
+from contextlib import contextmanager
+
+# Perfil de memoria del servidor: "normal" o "bajo" (dos réplicas en un nodo de 16 GB).
+# Solo los índices en bundle (`index.bundle`) se comparten entre réplicas: en el perfil bajo
+# un índice plano del formato anterior se convierte a bundle al cargarlo (ver
+# `index_versions.convertir_a_bundle`); si no se puede, ocupa memoria propia en cada réplica.
+PERFIL_MEMORIA = os.environ.get("PERFIL_MEMORIA", "normal")
+
+PERFILES_MEMORIA = {
+    'normal': {
+        'mmap_indice': False,       # Índice FAISS anterior y textos .npy cargados en memoria
+        'cache_reranker': 10000,    # Entradas de la caché LRU del cross-encoder
+        'max_lote': 32,             # Consultas por lote del micro-batcher
+        'batch_size_max': None,     # Sin límite al batch de evaluación del LLM
+        'presupuesto_indices_mb': 4096  # Índices por producto residentes a la vez
+    },
+    'bajo': {
+        # Modelo e índice mapeados desde disco: las páginas son del page cache y las
+        # comparten todas las réplicas del nodo en lugar de duplicarse en cada proceso
+        'mmap_indice': True,
+        'cache_reranker': 1000,
+        'max_lote': 8,
+        'batch_size_max': 8,        # Los buffers de evaluación del LLM crecen con el batch
+        'presupuesto_indices_mb': 1024
+    }
+}
+
+def perfil_memoria(nombre=None):
+    """Parámetros del perfil de memoria (`PERFIL_MEMORIA` por defecto)."""
+    nombre = nombre or PERFIL_MEMORIA
+    if nombre not in PERFILES_MEMORIA:
+        raise ValueError(f"Perfil de memoria desconocido: {nombre}. Disponibles: {', '.join(PERFILES_MEMORIA)}")
+    return dict(PERFILES_MEMORIA[nombre], nombre=nombre)
+
+def uso_memoria():
+    """Memoria del proceso en MB: residente, pico y, si se conoce, la parte anónima (privada).
+
+    La parte residente que no es anónima son páginas de archivos mapeados (modelo, bundle
+    del índice), compartidas con otras réplicas que mapean los mismos archivos.
+    """
+    if os.path.exists("/proc/self/status"):
+        campos = {}
+        with open("/proc/self/status", 'r') as f:
+            for linea in f:
+                clave, _, valor = linea.partition(":")
+                if clave in ("VmRSS", "VmHWM", "RssAnon"):
+                    campos[clave] = int(valor.split()[0]) / 1024
+        return {'rss': campos.get("VmRSS"), 'pico': campos.get("VmHWM"), 'anonima': campos.get("RssAnon")}
+    try:
+        import psutil
+    except ImportError:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return {'rss': None, 'pico': pico, 'anonima': None}
+    info = psutil.Process().memory_info()
+    return {'rss': info.rss / 2**20, 'pico': getattr(info, 'peak_wset', 0) / 2**20 or None, 'anonima': None}
+
+class ContabilidadMemoria:
+    """Memoria atribuida a cada componente del servidor, medida como incremento de RSS al cargarlo.
+
+    Los incrementos no son exactos (el recolector y los allocators reutilizan memoria),
+    pero bastan para saber qué componente domina el consumo.
+    """
+
+    def __init__(self):
+        self.componentes = {}
+
+    @contextmanager
+    def medir(self, componente):
+        antes = uso_memoria()
+        try:
+            yield
+        finally:
+            despues = uso_memoria()
+            registro = {}
+            for campo in ('rss', 'anonima'):
+                if antes[campo] is not None and despues[campo] is not None:
+                    registro[campo] = despues[campo] - antes[campo]
+            self.componentes[componente] = registro
+
+    def registrar_archivo(self, componente, path):
+        """Tamaño de un archivo mapeado: memoria compartida entre procesos, no por réplica."""
+        if path and os.path.exists(path):
+            self.componentes.setdefault(componente, {})['mmap'] = os.path.getsize(path) / 2**20
+
+    def resumen(self):
+        """Uso actual del proceso y memoria por componente (MB) para las métricas."""
+        return {'proceso': uso_memoria(), 'componentes': dict(self.componentes)}
+
+    def informe(self):
+        uso = uso_memoria()
+        print("📊 Memoria del proceso: "
+              + ", ".join(f"{campo} {valor:.0f} MB" for campo, valor in uso.items() if valor is not None))
+        for componente, registro in self.componentes.items():
+            detalle = ", ".join(f"{campo} {valor:+.0f} MB" if campo != 'mmap' else f"mmap {valor:.0f} MB"
+                                for campo, valor in registro.items())
+            print(f"   - {componente}: {detalle or 'sin datos'}")
+
+# Contabilidad compartida por todos los componentes del proceso
+CONTABILIDAD = ContabilidadMemoria()
@@ -5,8 +5,20 @@ from datetime import datetime
 import hashlib
 from typing import Dict, List
 import re
+import sys
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
+from metadata_store import MetadataStore, METADATA_STORE
+from text_stats import analizar_texto
+
+def hash_documento(pdf_path: str) -> str:
+    """MD5 del archivo leído por bloques (identifica si el documento ha cambiado)."""
+    md5 = hashlib.md5()
+    with open(pdf_path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            md5.update(bloque)
+    return md5.hexdigest()
 
 class MetadataGenerator:
     def __init__(self, data_dir="preparsed_data"):
@@ -98,27 +110,13 @@ class MetadataGenerator:
             
             content['sections'].extend(cleaned_sections)
 
-        # Analizar párrafos con mejor limpieza
-        paragraphs = [p.strip() for p in content['full_text'].split('\n\n') if p.strip()]
-        content['paragraphs'] = [p for p in paragraphs if len(p.split()) > 1]  # Ignorar párrafos de una sola palabra
-
-        # Analizar palabras y términos con mejor limpieza
-        words = []
-        for word in re.findall(r'\w+', content['full_text'].lower()):
-            # Limpiar la palabra
-            word = re.sub(r'[^\w\sáéíóúñ]', '', word)
-            if len(word) > 3 and not word.isdigit():
-                words.append(word)
-        
-        content['word_frequencies'] = Counter(words)
-        content['total_words'] = len(words)
-
-        # Analizar términos de seguros
-        text_lower = content['full_text'].lower()
-        for term in self.insurance_terms:
-            count = len(re.findall(r'\b' + term + r'\b', text_lower))
-            if count > 0:
-                content['insurance_terms_freq'][term] = count
+        # Palabras, términos de seguros y párrafos en una sola pasada
+        stats = analizar_texto(content['full_text'], self.insurance_terms, skip_numbers=True)
+        # Ignorar párrafos de una sola palabra
+        content['paragraphs'] = [p for p, n in zip(stats['paragraphs'], stats['paragraph_lengths']) if n > 1]
+        content['word_frequencies'] = stats['word_frequencies']
+        content['total_words'] = stats['total_words']
+        content['insurance_terms_freq'] = stats['insurance_terms_freq']
 
         doc.close()
         return content
@@ -132,8 +130,7 @@ class MetadataGenerator:
         content = self.extract_text_content(pdf_path)
         
         # Generar hash único del documento
-        with open(pdf_path, 'rb') as f:
-            doc_hash = hashlib.md5(f.read()).hexdigest()
+        doc_hash = hash_documento(pdf_path)
 
         # Identificar título del documento
         first_text = content['paragraphs'][0] if content['paragraphs'] else ''
@@ -201,6 +198,47 @@ class MetadataGenerator:
         except Exception as e:
             print(f"❌ Error guardando metadatos: {str(e)}")
 
+    def process_incremental(self, store: MetadataStore, workers: int = None) -> Dict[str, int]:
+        """Actualiza el store solo con los documentos nuevos o modificados.
+
+        Los documentos cuyo hash coincide con el guardado se saltan; el resto se procesa en
+        paralelo y cada resultado se escribe en el store en cuanto termina. Los registros de
+        PDFs que ya no están en el directorio se eliminan.
+        """
+        guardados = store.hashes()
+        pendientes = [f for f in self.pdf_files
+                      if guardados.get(f) != hash_documento(os.path.join(self.data_dir, f))]
+        eliminados = set(guardados) - set(self.pdf_files)
+        for pdf_file in eliminados:
+            store.delete(pdf_file)
+
+        print(f"🔍 {len(pendientes)} documentos nuevos o modificados, "
+              f"{len(self.pdf_files) - len(pendientes)} sin cambios")
+        errores = 0
+        if pendientes:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(_generar_metadatos, self.data_dir, pdf_file): pdf_file
+                           for pdf_file in pendientes}
+                for future in as_completed(futures):
+                    pdf_file = futures[future]
+                    try:
+                        store.upsert(pdf_file, future.result())
+                        print(f"✅ Metadatos actualizados: {pdf_file}")
+                    except Exception as e:
+                        errores += 1
+                        print(f"❌ Error procesando {pdf_file}: {str(e)}")
+
+        return {
+            'actualizados': len(pendientes) - errores,
+            'sin_cambios': len(self.pdf_files) - len(pendientes),
+            'eliminados': len(eliminados),
+            'errores': errores
+        }
+
+def _generar_metadatos(data_dir: str, pdf_file: str) -> Dict:
+    """Tarea de un proceso del pool: metadatos de un documento."""
+    return MetadataGenerator(data_dir).generate_metadata(os.path.join(data_dir, pdf_file))
+
 def main():
     generator = MetadataGenerator()
     
@@ -208,6 +246,17 @@ def main():
         print("❌ No se encontraron archivos PDF en el directorio preparsed_data/")
         return
     
+    if "--incremental" in sys.argv:
+        # Solo los documentos nuevos o modificados, con un registro por documento
+        store = MetadataStore(METADATA_STORE)
+        if not len(store) and os.path.exists("documentos_metadata.json"):
+            # Primera ejecución: partir de los metadatos ya generados en JSON
+            print(f"🔄 Importados {store.import_json('documentos_metadata.json')} documentos del JSON")
+        resumen = generator.process_incremental(store)
+        print(f"\n✅ Store '{METADATA_STORE}' actualizado: {resumen}")
+        store.close()
+        return
+    
     # Procesar documentos y generar metadatos
     all_metadata = generator.process_all_documents()
     
@@ -0,0 +1,112 @@
+import json
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime
+
+METADATA_STORE = "documentos_metadata.sqlite"
+
+class MetadataStore:
+    """Metadatos por documento en SQLite, indexados por nombre de archivo.
+
+    Cada documento es un registro independiente: se puede consultar, insertar o
+    actualizar uno solo sin leer ni reescribir el corpus completo. Se usa como un
+    diccionario de solo lectura (`store[filename]`, `store.get`, `store.items()`).
+    Los documentos consultados con `get` se guardan en una caché LRU de `max_cache` entradas.
+    """
+
+    def __init__(self, path=METADATA_STORE, max_cache=256):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documentos ("
+            " filename TEXT PRIMARY KEY,"
+            " doc_hash TEXT NOT NULL,"
+            " metadata TEXT NOT NULL,"
+            " actualizado TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self.max_cache = max_cache
+        self._cache = OrderedDict()
+
+    def hashes(self):
+        """{filename: doc_hash} de todos los documentos, sin cargar sus metadatos."""
+        return dict(self._conn.execute("SELECT filename, doc_hash FROM documentos"))
+
+    def upsert(self, filename, metadata):
+        """Inserta o sustituye los metadatos de un documento."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO documentos (filename, doc_hash, metadata, actualizado) "
+            "VALUES (?, ?, ?, ?)",
+            (filename, metadata['file_info']['doc_hash'],
+             json.dumps(metadata, ensure_ascii=False), datetime.now().isoformat())
+        )
+        self._conn.commit()
+        self._cache.pop(filename, None)
+
+    def delete(self, filename):
+        self._conn.execute("DELETE FROM documentos WHERE filename = ?", (filename,))
+        self._conn.commit()
+        self._cache.pop(filename, None)
+
+    def _leer(self, filename):
+        fila = self._conn.execute(
+            "SELECT metadata FROM documentos WHERE filename = ?", (filename,)).fetchone()
+        return json.loads(fila[0]) if fila is not None else None
+
+    def get(self, filename, default=None):
+        if filename in self._cache:
+            self._cache.move_to_end(filename)
+            return self._cache[filename]
+        metadata = self._leer(filename)
+        if metadata is None:
+            return default
+        self._cache[filename] = metadata
+        while len(self._cache) > self.max_cache:
+            self._cache.popitem(last=False)
+        return metadata
+
+    def __getitem__(self, filename):
+        metadata = self.get(filename)
+        if metadata is None:
+            raise KeyError(filename)
+        return metadata
+
+    def __contains__(self, filename):
+        return self._conn.execute(
+            "SELECT 1 FROM documentos WHERE filename = ?", (filename,)).fetchone() is not None
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM documentos").fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return [fila[0] for fila in self._conn.execute("SELECT filename FROM documentos ORDER BY filename")]
+
+    def items(self):
+        """Recorre los documentos de uno en uno (no carga todo el corpus a la vez).
+
+        El recorrido no pasa por la caché: no desplaza los documentos consultados con `get`.
+        """
+        for filename in self.keys():
+            metadata = self._leer(filename)
+            if metadata is not None:
+                yield filename, metadata
+
+    def import_json(self, metadata_file="documentos_metadata.json"):
+        """Carga en el store los registros del JSON anterior (con sus hashes)."""
+        with open(metadata_file, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        for filename, registro in metadata.items():
+            self.upsert(filename, registro)
+        return len(metadata)
+
+    def export_json(self, output_file="documentos_metadata.json"):
+        """Vuelca el store al formato JSON anterior para herramientas que aún lo leen."""
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.items()), f, ensure_ascii=False, indent=2)
+        print(f"✅ Metadatos exportados a '{output_file}'")
+
+    def close(self):
+        self._conn.close()
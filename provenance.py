@@ -0,0 +1,98 @@
+import numpy as np
+
+# Columnas de procedencia guardadas como secciones alineadas del bundle (28 bytes por fragmento)
+COLUMNAS = {
+    'doc_id': np.int32,      # Posición en la tabla de documentos
+    'page': np.int32,        # Página (1..n); 0 si el documento no tiene páginas (TXT)
+    # Offsets del fragmento: caracteres del texto extraído (PDF) o bytes del archivo (TXT
+    # leídos en streaming); int64 porque los volcados de texto superan los 2 GB
+    'char_start': np.int64,
+    'char_end': np.int64,
+    'section': np.int32      # Número de sección/párrafo dentro del documento (1..n)
+}
+
+def columnas_de_filas(filas, posicion):
+    """Columnas de procedencia de un lote de tuplas (documento, página, inicio, fin, sección).
+
+    `posicion` (documento -> doc_id) se amplía con los documentos nuevos del lote, así
+    los lotes de un índice escrito por partes comparten la misma tabla de documentos.
+    """
+    for fila in filas:
+        posicion.setdefault(fila[0], len(posicion))
+    return {
+        'doc_id': np.array([posicion[fila[0]] for fila in filas], dtype=COLUMNAS['doc_id']),
+        'page': np.array([fila[1] for fila in filas], dtype=COLUMNAS['page']),
+        'char_start': np.array([fila[2] for fila in filas], dtype=COLUMNAS['char_start']),
+        'char_end': np.array([fila[3] for fila in filas], dtype=COLUMNAS['char_end']),
+        'section': np.array([fila[4] for fila in filas], dtype=COLUMNAS['section'])
+    }
+
+class Procedencia:
+    """Procedencia de cada fragmento en arrays NumPy alineados con el índice.
+
+    Citar, filtrar o localizar fragmentos son búsquedas vectorizadas sobre estos arrays y
+    la pequeña tabla de documentos, sin analizar cadenas del tipo "archivo | sección N".
+    """
+
+    def __init__(self, documentos, **columnas):
+        self.documentos = list(documentos)
+        self._nombres = np.array(self.documentos, dtype=object)
+        for nombre, dtype in COLUMNAS.items():
+            setattr(self, nombre, np.asarray(columnas[nombre], dtype=dtype))
+
+    @classmethod
+    def desde_filas(cls, filas):
+        """Construye la procedencia a partir de tuplas (documento, página, inicio, fin, sección)."""
+        posicion = {}
+        columnas = columnas_de_filas(filas, posicion)
+        return cls(list(posicion), **columnas)
+
+    @classmethod
+    def desde_bundle(cls, bundle):
+        """Procedencia guardada en un `IndexBundle`, o None si el bundle no la tiene."""
+        documentos = bundle.header.get('documents')
+        if documentos is None:
+            return None
+        return cls(documentos, **{nombre: bundle.extra(nombre) for nombre in COLUMNAS})
+
+    def columnas(self):
+        """Arrays por fragmento, listos para `escribir_bundle(..., extras=...)`."""
+        return {nombre: getattr(self, nombre) for nombre in COLUMNAS}
+
+    def seleccionar(self, posiciones):
+        """Procedencia de un subconjunto de fragmentos (p. ej. los canónicos tras deduplicar)."""
+        posiciones = np.asarray(posiciones, dtype=np.int64)
+        return Procedencia(self.documentos, **{nombre: valores[posiciones]
+                                                for nombre, valores in self.columnas().items()})
+
+    def __len__(self):
+        return len(self.doc_id)
+
+    def documento(self, indices):
+        """Nombre del documento de cada fragmento."""
+        return self._nombres[self.doc_id[np.asarray(indices, dtype=np.int64)]]
+
+    def citar(self, indices):
+        """Cita legible ("archivo, pág. P, sección S") de cada fragmento."""
+        indices = np.asarray(indices, dtype=np.int64)
+        citas = []
+        for documento, pagina, seccion in zip(self.documento(indices), self.page[indices], self.section[indices]):
+            cita = f"{documento}, pág. {pagina}" if pagina else documento
+            citas.append(f"{cita}, sección {seccion}")
+        return citas
+
+    def filtrar(self, documentos=None, paginas=None):
+        """Máscara booleana de los fragmentos de ciertos documentos y/o rango de páginas."""
+        mascara = np.ones(len(self), dtype=bool)
+        if documentos is not None:
+            ids = [i for i, doc in enumerate(self.documentos) if doc in set(documentos)]
+            mascara &= np.isin(self.doc_id, ids)
+        if paginas is not None:
+            desde, hasta = paginas
+            mascara &= (self.page >= desde) & (self.page <= hasta)
+        return mascara
+
+    def localizar(self, indices):
+        """Documento y offsets (inicio, fin) de cada fragmento para resaltarlo en el original."""
+        indices = np.asarray(indices, dtype=np.int64)
+        return self.documento(indices), self.char_start[indices], self.char_end[indices]
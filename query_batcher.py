@@ -0,0 +1,87 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+class MicroBatcher:
+    """Agrupa las consultas concurrentes de varias sesiones en un solo lote.
+
+    Un hilo de fondo toma la primera consulta pendiente, espera como mucho `ventana_ms`
+    a que lleguen más (hasta `max_lote`), calcula todos los embeddings con una sola
+    llamada a `encode` y hace una única búsqueda multi-consulta por índice. Cada
+    llamante recibe su resultado a través de un `Future`.
+
+    Con un solo usuario el lote se cierra en cuanto la cola está vacía tras la ventana,
+    así que la latencia añadida es de unos pocos milisegundos.
+    """
+
+    def __init__(self, embedding_model, ventana_ms=3, max_lote=32):
+        self.modelo = embedding_model
+        self.ventana = ventana_ms / 1000
+        self.max_lote = max_lote
+        self._cola = queue.Queue()
+        self.stats = {'lotes': 0, 'consultas': 0}
+        self._hilo = threading.Thread(target=self._bucle, daemon=True, name="micro-batcher")
+        self._hilo.start()
+
+    def encode(self, pregunta):
+        """Future con `(embedding, None, None, tiempos)` de la pregunta."""
+        return self.buscar(pregunta, None, 0)
+
+    def buscar(self, pregunta, index, k):
+        """Future con `(embedding, D, I, tiempos)` de la pregunta en `index` (D, I de 1 x k).
+
+        `tiempos` recoge la duración del embedding y de la búsqueda del lote y su tamaño.
+        Con `index=None` solo se calcula el embedding y D, I son None. Quien llama debe
+        mantener vivo el índice (p. ej. con `GestorIndices.adquirir`) hasta leer el resultado.
+        """
+        futuro = Future()
+        self._cola.put((pregunta, index, k, futuro))
+        return futuro
+
+    def _recoger(self):
+        """Bloquea hasta la primera consulta y añade las que lleguen dentro de la ventana."""
+        lote = [self._cola.get()]
+        limite = time.perf_counter() + self.ventana
+        while len(lote) < self.max_lote:
+            restante = limite - time.perf_counter()
+            try:
+                lote.append(self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _bucle(self):
+        while True:
+            lote = self._recoger()
+            futuros = [futuro for *_, futuro in lote]
+            try:
+                inicio = time.perf_counter()
+                embeddings = np.asarray(self.modelo.encode([pregunta for pregunta, *_ in lote]),
+                                        dtype=np.float32)
+                tiempos = {'embedding': time.perf_counter() - inicio, 'busqueda': 0.0, 'lote': len(lote)}
+                resultados = [(embeddings[i], None, None) for i in range(len(lote))]
+
+                # Una búsqueda por índice (las sesiones pueden estar en versiones distintas)
+                grupos = {}
+                for i, (_, index, k, _) in enumerate(lote):
+                    if index is not None:
+                        grupos.setdefault(id(index), (index, []))[1].append(i)
+                inicio = time.perf_counter()
+                for index, posiciones in grupos.values():
+                    k_max = max(lote[i][2] for i in posiciones)
+                    D, I = index.search(embeddings[posiciones], k_max)
+                    for fila, i in enumerate(posiciones):
+                        k = lote[i][2]
+                        resultados[i] = (embeddings[i], D[fila:fila + 1, :k], I[fila:fila + 1, :k])
+                tiempos['busqueda'] = time.perf_counter() - inicio
+            except Exception as e:
+                for futuro in futuros:
+                    futuro.set_exception(e)
+                continue
+
+            self.stats['lotes'] += 1
+            self.stats['consultas'] += len(lote)
+            for futuro, resultado in zip(futuros, resultados):
+                futuro.set_result((*resultado, tiempos))
@@ -0,0 +1,62 @@
+import time
+from collections import OrderedDict
+
+class CrossEncoderReranker:
+    """Reordena fragmentos candidatos con un cross-encoder multilingüe en CPU."""
+
+    def __init__(self, model_name="cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+                 max_cache_size=10000, batch_size=16):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_cache_size = max_cache_size
+        self._model = None
+        # Caché LRU de scores por (pregunta, fragmento)
+        self._cache = OrderedDict()
+        self.stats = {'llamadas': 0, 'pares_evaluados': 0, 'aciertos_cache': 0, 'tiempo_total': 0.0}
+
+    @property
+    def model(self):
+        """Carga el cross-encoder la primera vez que se usa."""
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            from memory_profile import CONTABILIDAD
+            with CONTABILIDAD.medir('reranker'):
+                self._model = CrossEncoder(self.model_name, max_length=512, device="cpu")
+        return self._model
+
+    def score(self, query, chunks):
+        """Devuelve un score por fragmento, evaluando en un solo batch los que no están en caché."""
+        inicio = time.time()
+        scores = [None] * len(chunks)
+        pendientes = []
+
+        for i, chunk in enumerate(chunks):
+            key = (query, chunk)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                scores[i] = self._cache[key]
+                self.stats['aciertos_cache'] += 1
+            else:
+                pendientes.append(i)
+
+        if pendientes:
+            pares = [(query, chunks[i]) for i in pendientes]
+            nuevos = self.model.predict(pares, batch_size=self.batch_size, show_progress_bar=False)
+            for i, s in zip(pendientes, nuevos):
+                scores[i] = float(s)
+                self._cache[(query, chunks[i])] = float(s)
+            while len(self._cache) > self.max_cache_size:
+                self._cache.popitem(last=False)
+
+        self.stats['llamadas'] += 1
+        self.stats['pares_evaluados'] += len(pendientes)
+        self.stats['tiempo_total'] += time.time() - inicio
+        return scores
+
+    def rerank(self, query, chunks, top_k=3):
+        """Devuelve las posiciones de los `top_k` mejores fragmentos y sus scores, en orden."""
+        if not chunks:
+            return []
+        scores = self.score(query, chunks)
+        orden = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+        return [(i, scores[i]) for i in orden[:top_k]]
@@ -0,0 +1,181 @@
+import os
+import json
+import heapq
+import hashlib
+import itertools
+import threading
+import multiprocessing as mp
+from multiprocessing.connection import Client, Listener
+import faiss
+import numpy as np
+
+MANIFEST_FILE = "shards.json"
+# Clave compartida de los shards remotos (multiprocessing.connection deserializa con pickle
+# cada mensaje: quien conozca la clave puede ejecutar código en el nodo)
+AUTHKEY_ENV = "BDP_SHARD_AUTHKEY"
+
+def clave_shards(authkey=None):
+    """Clave de autenticación de los shards remotos: la indicada o la de `BDP_SHARD_AUTHKEY`."""
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        raise ValueError(f"❌ Falta la clave de los shards remotos: pásala como authkey o define {AUTHKEY_ENV}")
+    return authkey.encode('utf-8') if isinstance(authkey, str) else authkey
+
+def shard_de_documento(doc_id, num_shards):
+    """Shard asignado a un documento: hash estable del nombre del archivo."""
+    return int(hashlib.md5(doc_id.encode('utf-8')).hexdigest(), 16) % num_shards
+
+def construir_shards(embeddings, split_ids, num_shards, directorio="shards"):
+    """Reparte los vectores por documento en `num_shards` índices FAISS independientes.
+
+    Cada shard guarda su índice y las posiciones globales de sus vectores, que son las
+    filas de `vector_ids.npy` / `vector_texts.npy`.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+
+    # "archivo.pdf | sección N" -> shard del archivo
+    documentos = [split_id.split(" | ")[0] for split_id in split_ids]
+    asignacion = np.array([shard_de_documento(doc, num_shards) for doc in documentos], dtype=np.int64)
+
+    tamanos = []
+    for shard in range(num_shards):
+        filas = np.where(asignacion == shard)[0].astype(np.int64)
+        index = faiss.IndexFlatL2(embeddings.shape[1])
+        if len(filas):
+            index.add(embeddings[filas])
+        faiss.write_index(index, os.path.join(directorio, f"shard_{shard}.faiss"))
+        np.save(os.path.join(directorio, f"shard_{shard}_ids.npy"), filas)
+        tamanos.append(int(len(filas)))
+
+    with open(os.path.join(directorio, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            'num_shards': num_shards,
+            'dimension': int(embeddings.shape[1]),
+            'metric': 'L2',
+            'total': int(len(embeddings)),
+            'shard_sizes': tamanos
+        }, f, indent=2)
+
+    print(f"✅ {len(embeddings)} vectores repartidos en {num_shards} shards: {tamanos}")
+
+def _cargar_shard(directorio, shard):
+    index = faiss.read_index(os.path.join(directorio, f"shard_{shard}.faiss"))
+    ids_globales = np.load(os.path.join(directorio, f"shard_{shard}_ids.npy"))
+    return index, ids_globales
+
+def _atender_shard(index, ids_globales, conn):
+    """Bucle de un shard: recibe (consultas, k) y devuelve distancias e IDs globales."""
+    while True:
+        try:
+            mensaje = conn.recv()
+        except EOFError:
+            break
+        if mensaje is None:
+            break
+        consultas, k = mensaje
+        k_local = min(k, index.ntotal)
+        if k_local == 0:
+            conn.send((np.empty((len(consultas), 0), dtype=np.float32),
+                       np.empty((len(consultas), 0), dtype=np.int64)))
+            continue
+        D, I = index.search(consultas, k_local)
+        conn.send((D, np.where(I >= 0, ids_globales[np.maximum(I, 0)], -1)))
+    conn.close()
+
+def _proceso_shard(directorio, shard, conn):
+    faiss.omp_set_num_threads(1)  # Un hilo por shard: el paralelismo viene de los procesos
+    _atender_shard(*_cargar_shard(directorio, shard), conn)
+
+def _atender_conexion(index, ids_globales, conn):
+    with conn:
+        _atender_shard(index, ids_globales, conn)
+
+def servir_shard(directorio, shard, address=("127.0.0.1", 6000), authkey=None):
+    """Sirve un shard por socket para repartir los shards entre varios nodos.
+
+    Por defecto solo escucha en local. Para servir a otros nodos, indica la IP de la red
+    interna en `address` (nunca una interfaz pública), restringe el puerto en el firewall a
+    los nodos de servicio y usa una clave larga y aleatoria (`authkey` o `BDP_SHARD_AUTHKEY`),
+    igual en el shard y en los clientes. Cada cliente (réplica) se atiende en su propio hilo.
+    """
+    authkey = clave_shards(authkey)
+    index, ids_globales = _cargar_shard(directorio, shard)
+    with Listener(address, authkey=authkey) as listener:
+        print(f"✅ Shard {shard} escuchando en {address}")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_atender_conexion, args=(index, ids_globales, conn), daemon=True).start()
+
+class ShardedIndex:
+    """Índice repartido en shards con búsqueda scatter-gather.
+
+    Cada shard se busca en su propio proceso (o en un nodo remoto por socket) y los
+    resultados se combinan con un merge por heap del top-k global. Expone `search` como
+    un índice FAISS, con IDs que apuntan a las filas de `vector_ids.npy`.
+    """
+
+    def __init__(self, directorio="shards", remotos=None, authkey=None):
+        self._conexiones = []
+        self._procesos = []
+        # Las conexiones se comparten entre hilos (p. ej. sesiones de db_viewer): un envío y
+        # su respuesta no pueden intercalarse con los de otra búsqueda
+        self._lock = threading.Lock()
+        with open(os.path.join(directorio, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.d = self.manifest['dimension']
+        self.ntotal = self.manifest['total']
+        self.num_shards = self.manifest['num_shards']
+
+        # remotos: {shard: (host, puerto)} para los shards servidos con `servir_shard`
+        remotos = remotos or {}
+        if remotos:
+            authkey = clave_shards(authkey)
+        for shard in range(self.num_shards):
+            if shard in remotos:
+                self._conexiones.append(Client(remotos[shard], authkey=authkey))
+                continue
+            padre, hijo = mp.Pipe()
+            proceso = mp.Process(target=_proceso_shard, args=(directorio, shard, hijo), daemon=True)
+            proceso.start()
+            hijo.close()
+            self._conexiones.append(padre)
+            self._procesos.append(proceso)
+
+    def search(self, consultas, k):
+        """Envía las consultas a todos los shards a la vez y combina sus top-k."""
+        consultas = np.ascontiguousarray(consultas, dtype=np.float32).reshape(-1, self.d)
+        with self._lock:
+            for conn in self._conexiones:
+                conn.send((consultas, k))
+            respuestas = [conn.recv() for conn in self._conexiones]
+
+        D = np.full((len(consultas), k), np.inf, dtype=np.float32)
+        I = np.full((len(consultas), k), -1, dtype=np.int64)
+        for fila in range(len(consultas)):
+            # Cada shard devuelve sus resultados ordenados: merge de k vías con heap
+            listas = [zip(Ds[fila], Is[fila]) for Ds, Is in respuestas]
+            mejores = itertools.islice(
+                (par for par in heapq.merge(*listas, key=lambda par: par[0]) if par[1] >= 0), k)
+            for col, (dist, idx) in enumerate(mejores):
+                D[fila, col] = dist
+                I[fila, col] = idx
+        return D, I
+
+    def close(self):
+        with self._lock:
+            conexiones = self._conexiones
+            self._conexiones = []
+        for conn in conexiones:
+            try:
+                conn.send(None)
+                conn.close()
+            except (OSError, EOFError):
+                pass
+        for proceso in self._procesos:
+            proceso.join(timeout=5)
+        self._procesos = []
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,63 @@
+import subprocess
+import sys
+import time
+
+# Dependencias pesadas que no deberían importarse al arrancar los visores
+HEAVY_MODULES = ['torch', 'transformers', 'sentence_transformers', 'faiss', 'ctransformers']
+
+def profile_import(module_name, top=10):
+    """Importa un módulo en un proceso limpio con `-X importtime` y resume el coste."""
+    inicio = time.time()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        capture_output=True,
+        text=True
+    )
+    tiempo_total = time.time() - inicio
+
+    # Formato de cada línea: "import time: self [us] | cumulative | imported package"
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        cumulative_us = int(parts[1].strip())
+        package = parts[2].rstrip()
+        # La profundidad de anidamiento se indica con la sangría del nombre
+        imports.append((package.strip(), cumulative_us, len(package) - len(package.lstrip())))
+
+    top_level = [(name, us) for name, us, depth in imports if depth == 1]
+    top_level.sort(key=lambda x: x[1], reverse=True)
+    heavy_loaded = sorted({name.split('.')[0] for name, _, _ in imports} & set(HEAVY_MODULES))
+
+    return {
+        'module': module_name,
+        'ok': result.returncode == 0,
+        'wall_time': tiempo_total,
+        'imports_time': sum(us for _, us in top_level) / 1e6,
+        'top_imports': top_level[:top],
+        'heavy_loaded': heavy_loaded,
+        'error': result.stderr.strip().splitlines()[-1] if result.returncode != 0 else ''
+    }
+
+def main():
+    modulos = sys.argv[1:] or ['db_viewer', 'app', 'RAG']
+
+    for modulo in modulos:
+        perfil = profile_import(modulo)
+        print(f"\n⏱️ {modulo}: {perfil['wall_time']:.2f}s de arranque "
+              f"({perfil['imports_time']:.2f}s en imports)")
+        if not perfil['ok']:
+            print(f"❌ Error importando {modulo}: {perfil['error']}")
+            continue
+        if perfil['heavy_loaded']:
+            print(f"⚠️ Dependencias pesadas cargadas al importar: {', '.join(perfil['heavy_loaded'])}")
+        else:
+            print("✅ Ninguna dependencia pesada cargada al importar")
+        for name, us in perfil['top_imports']:
+            print(f"   - {name}: {us / 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from ctransformers import AutoModelForCausalLM
 import os
+from llm_autotune import parametros_llm
 
 def test_modelo():
     # Verificar si existe el modelo
@@ -10,13 +11,11 @@ def test_modelo():
 
     print("🔄 Cargando modelo...")
     try:
-        # Cargar el modelo con configuración básica
+        # Cargar el modelo con el perfil de llm_autotune.py (o valores seguros si no hay)
         llm = AutoModelForCausalLM.from_pretrained(
             modelo_path,
             model_type="llama",
-            gpu_layers=0,
-            context_length=2048,
-            threads=4
+            **parametros_llm(modelo_path)
         )
         
         # Prompt de prueba simple
@@ -29,5 +29,133 @@ def test_rag():
     print(f"Tiempo mínimo: {min(tiempos):.2f}s")
     print(f"Tiempo máximo: {max(tiempos):.2f}s")
 
+PREGUNTAS_BENCHMARK = [
+    "¿Qué cubre el seguro de moto?",
+    "¿Cuál es el costo del seguro de comunidad?",
+    "¿Qué documentos necesito para asegurar mi moto?"
+]
+
+def medir_modo(rag, etiqueta, preguntas=PREGUNTAS_BENCHMARK):
+    """Ejecuta las preguntas con la configuración actual de `rag` y devuelve sus métricas."""
+    metricas = []
+    for pregunta in preguntas:
+        print(f"\n🔄 Probando ({etiqueta}): {pregunta}")
+        rag.generar_respuesta(pregunta)
+        metricas.append(dict(rag.metricas))
+    return metricas
+
+def media(metricas, clave):
+    valores = [m.get(clave, 0.0) for m in metricas]
+    return sum(valores) / len(valores) if valores else 0.0
+
+def comparar_reranker():
+    """Compara el contexto sin reranking frente al reordenado por el cross-encoder."""
+    rag = RAGSimple(modo_prueba=False, usar_reranker=False)
+    
+    rag.usar_reranker = False
+    base = medir_modo(rag, "sin reranker")
+    rag.usar_reranker = True
+    rerank = medir_modo(rag, "con reranker")
+    
+    tokens_sin, tokens_con = media(base, 'tokens_prompt'), media(rerank, 'tokens_prompt')
+    gen_sin, gen_con = media(base, 'tiempo_generacion'), media(rerank, 'tiempo_generacion')
+    coste_rerank = media(rerank, 'tiempo_rerank')
+    
+    print("\n📊 Reranking con cross-encoder:")
+    print(f"Tokens de prompt promedio: {tokens_sin:.0f} → {tokens_con:.0f}")
+    print(f"Tiempo de generación promedio: {gen_sin:.2f}s → {gen_con:.2f}s")
+    print(f"Coste medio del reranking: {coste_rerank:.2f}s")
+    print(f"Ahorro neto por pregunta: {(gen_sin - gen_con) - coste_rerank:.2f}s")
+
+def comparar_compresion():
+    """Compara el contexto completo frente al comprimido a las oraciones más relevantes."""
+    rag = RAGSimple(modo_prueba=False, comprimir_contexto=False)
+    
+    rag.comprimir_contexto = False
+    base = medir_modo(rag, "sin compresión")
+    rag.comprimir_contexto = True
+    comprimido = medir_modo(rag, "con compresión")
+    
+    tokens_sin, tokens_con = media(base, 'tokens_prompt'), media(comprimido, 'tokens_prompt')
+    gen_sin, gen_con = media(base, 'tiempo_generacion'), media(comprimido, 'tiempo_generacion')
+    reduccion = (1 - tokens_con / tokens_sin) * 100 if tokens_sin else 0.0
+    
+    print("\n📊 Compresión extractiva del contexto:")
+    print(f"Tokens de prompt promedio: {tokens_sin:.0f} → {tokens_con:.0f} ({reduccion:.1f}% menos)")
+    print(f"Tokens de contexto promedio: {media(comprimido, 'tokens_contexto_original'):.0f} → {media(comprimido, 'tokens_contexto'):.0f}")
+    print(f"Tiempo de generación LLM promedio: {gen_sin:.2f}s → {gen_con:.2f}s ({gen_con - gen_sin:+.2f}s)")
+    print(f"Coste medio de la compresión: {media(comprimido, 'tiempo_compresion'):.2f}s")
+
+def comparar_top_k_adaptativo():
+    """Compara el número fijo de fragmentos frente al top-k adaptativo.
+
+    La calidad se aproxima con el F1 por tokens entre la respuesta adaptativa y la del
+    modo fijo (referencia) y con la fracción de preguntas en las que se conserva el mejor
+    fragmento del modo fijo.
+    """
+    from answer_router import _f1_tokens
+    
+    rag = RAGSimple(modo_prueba=False, top_k_adaptativo=False)
+    preguntas = PREGUNTAS_BENCHMARK + [
+        "¿Qué franquicia tiene el seguro de moto todo riesgo?",
+        "¿Incluye el seguro de decesos la repatriación?"
+    ]
+    
+    rag.top_k_adaptativo = False
+    fijo, respuestas_fijo = [], []
+    for pregunta in preguntas:
+        respuestas_fijo.append(rag.generar_respuesta(pregunta))
+        fijo.append(dict(rag.metricas))
+    rag.top_k_adaptativo = True
+    adaptativo, respuestas_adaptativo = [], []
+    for pregunta in preguntas:
+        respuestas_adaptativo.append(rag.generar_respuesta(pregunta))
+        adaptativo.append(dict(rag.metricas))
+    
+    f1 = [_f1_tokens(a, f) for a, f in zip(respuestas_adaptativo, respuestas_fijo)]
+    conserva_mejor = [m_f['indices_contexto'][:1] == m_a['indices_contexto'][:1]
+                      for m_f, m_a in zip(fijo, adaptativo)]
+    tokens_fijo, tokens_adapt = media(fijo, 'tokens_prompt'), media(adaptativo, 'tokens_prompt')
+    gen_fijo, gen_adapt = media(fijo, 'tiempo_generacion'), media(adaptativo, 'tiempo_generacion')
+    
+    print("\n📊 Top-k adaptativo:")
+    print(f"Fragmentos promedio: {media(fijo, 'num_fragmentos'):.2f} → {media(adaptativo, 'num_fragmentos'):.2f}")
+    print(f"Tokens de prompt promedio: {tokens_fijo:.0f} → {tokens_adapt:.0f}")
+    print(f"Tiempo de generación promedio: {gen_fijo:.2f}s → {gen_adapt:.2f}s")
+    print(f"F1 respecto a la respuesta con k fijo: {sum(f1) / len(f1):.2f}")
+    print(f"Mejor fragmento conservado: {sum(conserva_mejor)}/{len(conserva_mejor)}")
+
+def evaluar_router(preguntas_calibracion=None):
+    """Mide qué fracción de preguntas resuelve cada nivel del router y su latencia."""
+    from answer_router import AnswerRouter
+    
+    rag = RAGSimple(modo_prueba=False)
+    router = AnswerRouter(rag)
+    if preguntas_calibracion:
+        router.calibrar(preguntas_calibracion)
+    
+    preguntas = PREGUNTAS_BENCHMARK + [
+        "¿Qué franquicia tiene el seguro de moto todo riesgo?",
+        "¿Incluye el seguro de decesos la repatriación?",
+        "¿Por qué me conviene el seguro de comunidades frente al básico?"
+    ]
+    for pregunta in preguntas:
+        print(f"\n🔄 Probando (router): {pregunta}")
+        router.responder(pregunta)
+    
+    resumen = router.resumen()
+    print("\n📊 Router extractivo / generativo:")
+    print(f"Tráfico extractivo: {resumen['fraccion_extractivo'] * 100:.0f}%")
+    print(f"Tráfico generativo: {resumen['fraccion_generativo'] * 100:.0f}%")
+    print(f"Latencia p50 / p90 / p99: {resumen['latencia_p50']:.2f}s / "
+          f"{resumen['latencia_p90']:.2f}s / {resumen['latencia_p99']:.2f}s")
+    for nivel in ('extractivo', 'generativo'):
+        if resumen[f'latencia_p50_{nivel}'] is not None:
+            print(f"Latencia p50 {nivel}: {resumen[f'latencia_p50_{nivel}']:.2f}s")
+
 if __name__ == "__main__":
-    test_rag() 
\ No newline at end of file
+    test_rag()
+    comparar_reranker()
+    comparar_compresion()
+    comparar_top_k_adaptativo()
+    evaluar_router()
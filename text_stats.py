@@ -0,0 +1,59 @@
+import re
+from collections import Counter
+from typing import Dict, Iterable
+
+# Patrones precompilados compartidos por metadata_generator.py y data_wrangler.py
+WORD_PATTERN = re.compile(r'\w+')
+SENTENCE_BOUNDARY = re.compile(r'[.!?]+')
+PARAGRAPH_SEPARATOR = '\n\n'
+
+def analizar_texto(text: str, terms: Iterable[str] = (), min_word_length: int = 4,
+                   skip_numbers: bool = False) -> Dict:
+    """Estadísticas de palabras, términos, oraciones y párrafos en una sola pasada por el texto.
+
+    El texto se tokeniza una vez; las frecuencias se cuentan con `Counter` (en C) y los
+    filtros por longitud se aplican sobre el vocabulario, no sobre cada ocurrencia. Los
+    términos de una sola palabra se leen del mismo recuento (equivale a buscar
+    `\\bterm\\b`); los de varias palabras se cuentan con una única alternancia precompilada.
+    """
+    token_counts = Counter(WORD_PATTERN.findall(text.lower()))
+
+    # Palabras significativas: más de 3 letras (y sin números si se pide)
+    word_frequencies = Counter({
+        word: count for word, count in token_counts.items()
+        if len(word) >= min_word_length and not (skip_numbers and word.isdigit())
+    })
+    total_words = sum(word_frequencies.values())
+
+    terms = [term.lower() for term in terms]
+    insurance_terms_freq = Counter()
+    multiword = [term for term in terms if not WORD_PATTERN.fullmatch(term)]
+    for term in terms:
+        if term not in multiword and token_counts[term]:
+            insurance_terms_freq[term] = token_counts[term]
+    if multiword:
+        pattern = re.compile(r'\b(?:' + '|'.join(map(re.escape, multiword)) + r')\b')
+        found = Counter(pattern.findall(text.lower()))
+        for term in multiword:
+            if found[term]:
+                insurance_terms_freq[term] = found[term]
+    # Mismo orden que la lista de términos
+    insurance_terms_freq = Counter({term: insurance_terms_freq[term] for term in terms
+                                    if term in insurance_terms_freq})
+
+    # Oraciones y párrafos no vacíos con su número de palabras
+    sentence_lengths = [n for n in map(len, map(str.split, SENTENCE_BOUNDARY.split(text))) if n]
+    paragraphs = [p.strip() for p in text.split(PARAGRAPH_SEPARATOR)]
+    paragraph_lengths = [len(p.split()) for p in paragraphs]
+    paragraphs = [p for p, n in zip(paragraphs, paragraph_lengths) if n]
+    paragraph_lengths = [n for n in paragraph_lengths if n]
+
+    return {
+        'word_frequencies': word_frequencies,
+        'total_words': total_words,
+        'insurance_terms_freq': insurance_terms_freq,
+        'insurance_terms_ratio': sum(insurance_terms_freq.values()) / total_words if total_words > 0 else 0,
+        'sentence_lengths': sentence_lengths,
+        'paragraphs': paragraphs,
+        'paragraph_lengths': paragraph_lengths
+    }
@@ -0,0 +1,44 @@
+import codecs
+
+# Lectura por bloques: ninguna línea ocupa más de esto en memoria (dumps sin saltos de línea)
+MAX_LINEA = 1 << 20
+
+def es_encabezado(linea):
+    """Probable título de sección: línea en mayúsculas de más de 10 caracteres."""
+    return linea.isupper() and len(linea) > 10
+
+def leer_secciones(path, max_chars=20000, encoding='utf-8'):
+    """Genera `(numero, inicio, fin, texto)` para cada sección de un archivo de texto.
+
+    El archivo se lee línea a línea y cada sección se emite en cuanto empieza la
+    siguiente, así la memoria no depende del tamaño del archivo. Las secciones empiezan
+    en los títulos en mayúsculas, igual que en `DocumentProcessor.splitter`; si una sección
+    supera `max_chars` se corta en la siguiente línea en blanco (o en cualquier línea al
+    doblar el límite). `inicio` y `fin` son offsets en bytes dentro del archivo.
+    """
+    decodificador = codecs.getincrementaldecoder(encoding)(errors='replace')
+    numero = 0
+    lineas = []
+    tamano = 0
+    inicio = 0
+    posicion = 0
+    with open(path, 'rb') as f:
+        while True:
+            bruta = f.readline(MAX_LINEA)
+            if not bruta:
+                break
+            linea = decodificador.decode(bruta).rstrip('\r\n')
+            corte = es_encabezado(linea) or (
+                tamano >= max_chars and (not linea.strip() or tamano >= 2 * max_chars))
+            if corte and lineas:
+                numero += 1
+                yield numero, inicio, posicion, '\n'.join(lineas)
+                lineas = []
+                tamano = 0
+                inicio = posicion
+            lineas.append(linea)
+            tamano += len(linea) + 1
+            posicion += len(bruta)
+    if lineas:
+        numero += 1
+        yield numero, inicio, posicion, '\n'.join(lineas)